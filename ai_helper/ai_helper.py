@@ -121,11 +121,18 @@
 #         log.log_error(f"Error in content generation with chunking: {e}")
 #         raise
 import tiktoken
+import openai
 from openai import OpenAI
 import os
-from typing import List
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Tuple
 from logger import CustomLogger
 from dotenv import load_dotenv
+from ai_helper.llm_cache import LLMCache
+from utils.adaptive_limiter import AdaptiveLimiter, ThrottledError
 
 load_dotenv()
 
@@ -134,69 +141,197 @@ log = CustomLogger("AI_Helper", log_file="ai_helper.log")
 MAX_TOKENS = 128000  # Maximum tokens allowed by the model
 BUFFER = 1000  # Buffer for system and user messages
 
+# Retries of rate limited and overloaded requests are left to llm_limiter, which
+# has to see them to adapt the number of requests in flight
 client = OpenAI(
     api_key=os.getenv("OPENAI_API_KEY"),
+    max_retries=0,
 )
 
 MODEL_TO_USE = "gpt-4o-mini-2024-07-18"
 
+# Responses are cached on disk keyed by model, messages and sampling parameters
+llm_cache = LLMCache.from_env()
 
-def num_tokens_from_string(string: str, model: str = MODEL_TO_USE) -> int:
-    encoding = tiktoken.encoding_for_model(model)
-    return len(encoding.encode(string))
 
+def new_llm_usage() -> Dict:
+    return {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0, "seconds": 0.0}
 
-def generate_content_from_openai(content: str, system_instructions: str, purpose: str) -> str:
-    log.log_debug(f"Generating {purpose} in chunks...")
 
-    def create_completion(messages: List[dict]) -> str:
-        completion = client.chat.completions.create(
+# Totals for completions actually sent to the API during this process
+llm_usage = new_llm_usage()
+_llm_usage_lock = threading.Lock()
+
+# Further totals the completions of the current context are added to, see track_llm_usage
+_llm_usage_scope: ContextVar[Tuple[Dict, ...]] = ContextVar("llm_usage_scope", default=())
+
+
+@contextmanager
+def track_llm_usage(usage: Dict) -> Iterator[Dict]:
+    """
+    Also add the completions sent within this context to usage.
+
+    Tasks and asyncio.to_thread calls started inside the context inherit it, so
+    concurrent pipelines in one process (e.g. the episodes of a series) each
+    count only their own requests. Enclosing scopes keep counting as well.
+    """
+    token = _llm_usage_scope.set(_llm_usage_scope.get() + (usage,))
+    try:
+        yield usage
+    finally:
+        _llm_usage_scope.reset(token)
+
+
+# Completion latency grows with the tokens generated, so it is measured per completion token
+llm_limiter = AdaptiveLimiter("openai", initial=4, max_limit=16)
+
+
+def retry_after_seconds(response) -> Optional[float]:
+    """The wait an OpenAI response asks for, from retry-after-ms or retry-after."""
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        pass  # retry-after given as an HTTP date; back off without it
+    return None
+
+
+def request_completion(messages: List[dict], **params):
+    """
+    Send one chat completion request.
+
+    Raises:
+        ThrottledError: The request was rate limited, timed out or hit a server error
+    """
+    try:
+        return client.chat.completions.create(
             model=MODEL_TO_USE,
             messages=messages,
+            **params,
         )
-        return completion.choices[0].message.content
-
-    def split_content(content: str, max_tokens: int) -> List[str]:
-        chunks = []
-        current_chunk = ""
-        for line in content.split('\n'):
-            line_tokens = num_tokens_from_string(line)
-            if num_tokens_from_string(current_chunk) + line_tokens > max_tokens:
-                chunks.append(current_chunk)
-                current_chunk = line
-            else:
-                current_chunk += ('\n' if current_chunk else '') + line
-        if current_chunk:
-            chunks.append(current_chunk)
-        return chunks
+    except openai.RateLimitError as e:
+        raise ThrottledError(f"OpenAI rate limit: {str(e)}", retry_after_seconds(e.response)) from e
+    except openai.InternalServerError as e:
+        raise ThrottledError(f"OpenAI server error: {str(e)}", retry_after_seconds(e.response)) from e
+    except (openai.APITimeoutError, openai.APIConnectionError) as e:
+        raise ThrottledError(f"OpenAI connection error: {str(e)}") from e
 
-    log.log_debug(f"Splitting content into chunks...")
-    log.log_debug(f"Content length: {len(content)}")
 
+def num_tokens_from_string(string: str, model: str = MODEL_TO_USE) -> int:
+    encoding = tiktoken.encoding_for_model(model)
+    return len(encoding.encode(string, disallowed_special=()))
+
+
+def split_content(content: str, max_tokens: int) -> List[str]:
+    """Split content on line boundaries into chunks of at most max_tokens tokens."""
+    encoding = tiktoken.encoding_for_model(MODEL_TO_USE)
+    chunks = []
+    current_lines = []
+    current_tokens = 0
+    for line in content.split('\n'):
+        # Count each line once (plus its newline) instead of re-encoding the growing chunk
+        line_tokens = len(encoding.encode(line, disallowed_special=())) + 1
+        if current_lines and current_tokens + line_tokens > max_tokens:
+            chunks.append('\n'.join(current_lines))
+            current_lines = []
+            current_tokens = 0
+        current_lines.append(line)
+        current_tokens += line_tokens
+    if current_lines and any(current_lines):
+        chunks.append('\n'.join(current_lines))
+    return chunks
+
+
+def max_chunk_tokens(system_instructions: str, purpose: str) -> int:
+    """Tokens of content that fit in one request next to the instructions and the user prompt."""
     system_tokens = num_tokens_from_string(system_instructions)
     user_tokens = num_tokens_from_string(
         f"Based on the content provided, generate {purpose}")
-    max_chunk_tokens = MAX_TOKENS - system_tokens - user_tokens - BUFFER
+    return MAX_TOKENS - system_tokens - user_tokens - BUFFER
+
+
+def plan_content_chunks(content: str, system_instructions: str, purpose: str) -> List[str]:
+    """The chunks generate_content_from_openai would send, one completion request each."""
+    return split_content(content, max_chunk_tokens(system_instructions, purpose))
 
-    chunks = split_content(content, max_chunk_tokens)
-    log.log_debug(f"Split content into {len(chunks)} chunks")
 
+def content_requests(content: str, system_instructions: str, purpose: str) -> List[List[dict]]:
+    """The messages of every completion request generate_content_from_openai sends, in order."""
     messages = [
         {"role": "system", "content": system_instructions},
         {"role": "user", "content": f"Based on the content provided, generate {purpose}"},
     ]
 
-    final_content = ""
-    for i, chunk in enumerate(chunks):
+    requests = []
+    for i, chunk in enumerate(plan_content_chunks(content, system_instructions, purpose)):
         chunk_messages = messages.copy()
         chunk_messages.append({"role": "user", "content": chunk})
         if i > 0:
             chunk_messages.append({"role": "user", "content": f"Continue generating the {
                                   purpose} based on this additional content."})
+        requests.append(chunk_messages)
+    return requests
+
+
+def cached_responses(content: str, system_instructions: str, purpose: str) -> List[Optional[str]]:
+    """
+    The cached response of every request generate_content_from_openai would send
+    for this content, None for each one that would go to the API.
+    """
+    return [llm_cache.peek(llm_cache.make_key(MODEL_TO_USE, messages, {}))
+            for messages in content_requests(content, system_instructions, purpose)]
+
+
+def create_chat_completion(messages: List[dict], **params) -> str:
+    """Run a chat completion, answering from the response cache when possible."""
+    key = llm_cache.make_key(MODEL_TO_USE, messages, params)
+    cached = llm_cache.get(key)
+    if cached is not None:
+        return cached
+
+    start = time.perf_counter()
+    completion = llm_limiter.call(
+        lambda: request_completion(messages, **params),
+        units=lambda completion: completion.usage.completion_tokens if completion.usage else None,
+    )
+    elapsed = time.perf_counter() - start
+    content = completion.choices[0].message.content
+    usage = completion.usage
+
+    with _llm_usage_lock:
+        for totals in (llm_usage,) + _llm_usage_scope.get():
+            totals["requests"] += 1
+            totals["seconds"] += elapsed
+            if usage:
+                totals["prompt_tokens"] += usage.prompt_tokens
+                totals["completion_tokens"] += usage.completion_tokens
+
+    llm_cache.put(key, content, usage.total_tokens if usage else 0)
+    return content
+
 
+def generate_content_from_openai(content: str, system_instructions: str, purpose: str) -> str:
+    log.log_debug(f"Generating {purpose} in chunks...")
+
+    def create_completion(messages: List[dict]) -> str:
+        return create_chat_completion(messages)
+
+    log.log_debug(f"Splitting content into chunks...")
+    log.log_debug(f"Content length: {len(content)}")
+
+    requests = content_requests(content, system_instructions, purpose)
+    log.log_debug(f"Split content into {len(requests)} chunks")
+
+    final_content = ""
+    for chunk_messages in requests:
         chunk_content = create_completion(chunk_messages)
         final_content += chunk_content
 
     log.log_debug(f"Generated {purpose} successfully, processed {
-                  len(chunks)} chunks")
+                  len(requests)} chunks")
     return final_content
@@ -1,3 +1,4 @@
+import asyncio
 
 from logger import CustomLogger
 from dotenv import load_dotenv
@@ -37,6 +38,7 @@ If 2 hosts:
 - Encourage the hosts to ask each other questions or respond to each other's points
 
 If 3 or more hosts:
+- Names of the hosts: Alex, Jane, Sam and Maya, the first {host_count} of them in that order.
 - Provide clear transitions between speakers
 - Include opportunities for each host to contribute unique insights or perspectives
 - Encourage the hosts to engage in a roundtable discussion format
@@ -63,7 +65,9 @@ async def generate_podcast_outline(analysis: str, host_count: int) -> str:
         
         si_instructions = PODCAST_OUTLINE_SYSTEM_INSTRUCTIONS.format(
             host_count=host_count)
-        outline = generate_content_from_openai(analysis, si_instructions, purpose="Podcast Outline")
+        # In a thread, so concurrent episodes of a series keep running while this one waits on the LLM
+        outline = await asyncio.to_thread(
+            generate_content_from_openai, analysis, si_instructions, purpose="Podcast Outline")
 
         return outline
     except Exception as e:
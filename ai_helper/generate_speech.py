@@ -1,11 +1,18 @@
+import asyncio
+import io
 import os
 import azure.cognitiveservices.speech as speechsdk
-import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+from xml.sax.saxutils import escape, quoteattr
 from dotenv import load_dotenv
 from pydub import AudioSegment
 
 from logger import CustomLogger
+from utils.adaptive_limiter import AdaptiveLimiter, ThrottledError
+from utils.request_hedger import RequestHedger
+from utils.script_parser import parse_script
 
 log = CustomLogger("SpeechGenerator", log_file="speech_generator.log")
 
@@ -19,31 +26,114 @@ service_region = os.getenv("AZURE_SPEECH_REGION")
 speech_config = speechsdk.SpeechConfig(
     subscription=speech_key, region=service_region)
 
-
-def create_speech(text, voice, output_file):
+# Requests in flight to Azure Speech adapt to the quota of the resource. Latency
+# is measured per character, so long turns are not mistaken for congestion.
+tts_limiter = AdaptiveLimiter("azure_speech", initial=4, max_limit=20)
+
+# Used with hedging enabled: a turn still synthesizing after the 95th percentile
+# of latencies for its length is requested again, for at most 5% of requests.
+# The duplicate takes a limiter slot of its own and is skipped when none is free.
+tts_hedger = RequestHedger("azure_speech", limiter=tts_limiter)
+
+# Cancellations that mean the service is throttling or overloaded rather than rejecting the request
+THROTTLING_ERRORS = (
+    speechsdk.CancellationErrorCode.TooManyRequests,
+    speechsdk.CancellationErrorCode.ServiceUnavailable,
+    speechsdk.CancellationErrorCode.ServiceTimeout,
+)
+
+# One distinct voice per name in utils.script_parser.HOST_NAMES
+HOST_VOICES = {
+    "Alex": "en-US-AndrewMultilingualNeural",
+    "Jane": "en-US-AvaMultilingualNeural",
+    "Sam": "en-US-BrianMultilingualNeural",
+    "Maya": "en-US-EmmaMultilingualNeural",
+}
+DEFAULT_VOICE = "en-US-BrandonMultilingualNeural"
+
+# Limits for packing several turns into one SSML request. Azure caps a single
+# request at 50 voice elements and 10 minutes of audio, so the character budget
+# is kept well below what a voice can read in that time.
+SSML_BATCH_MAX_CHARS = 6000
+SSML_BATCH_MAX_VOICES = 50
+
+# Bookmark offsets are reported in 100-nanosecond ticks
+TICKS_PER_MS = 10000
+
+
+def new_speech_config(voice: Optional[str] = None) -> speechsdk.SpeechConfig:
+    """A SpeechConfig of its own for one request, so concurrent requests never share a voice setting."""
+    config = speechsdk.SpeechConfig(subscription=speech_key, region=service_region)
+    if voice:
+        config.speech_synthesis_voice_name = voice
+    return config
+
+
+def raise_if_throttled(result) -> None:
+    if result.reason != speechsdk.ResultReason.Canceled:
+        return
+    cancellation_details = result.cancellation_details
+    if cancellation_details.reason == speechsdk.CancellationReason.Error \
+            and cancellation_details.error_code in THROTTLING_ERRORS:
+        # The Speech SDK does not pass on Retry-After, so the limiter backs off on its own
+        raise ThrottledError(f"Azure Speech: {cancellation_details.error_code}: "
+                             f"{cancellation_details.error_details}")
+
+
+def synthesize_text(text: str, voice: str) -> Optional[bytes]:
+    """
+    Synthesize text with one voice.
+
+    Returns:
+        The WAV audio data, or None if synthesis failed
+    Raises:
+        ThrottledError: The service is throttling or overloaded
+    """
+    speech_synthesizer = speechsdk.SpeechSynthesizer(
+        speech_config=new_speech_config(voice), audio_config=None)
+    result = speech_synthesizer.speak_text_async(text).get()
+
+    if result.reason == speechsdk.ResultReason.SynthesizingAudioCompleted:
+        return result.audio_data
+    raise_if_throttled(result)
+    if result.reason == speechsdk.ResultReason.Canceled:
+        log.log_error(f"Speech synthesis canceled: {result.cancellation_details.reason} "
+                      f"{result.cancellation_details.error_details}")
+    else:
+        log.log_error(f"Error synthesizing speech: {result.reason}")
+    return None
+
+
+def create_speech(text, voice, output_file, hedger: Optional[RequestHedger] = None):
+    """
+    Synthesize one turn into output_file.
+
+    Returns:
+        output_file, or None if no audio was written
+    """
     if not text.strip():
         log.log_warning(f"Warning: Empty text for {output_file}. Skipping this segment.")
-        return
+        return None
+
+    def synthesize():
+        if hedger:
+            return hedger.call(lambda: synthesize_text(text, voice), units=len(text))
+        return synthesize_text(text, voice)
 
     try:
-        speech_config.speech_synthesis_voice_name = voice
-        speech_synthesizer = speechsdk.SpeechSynthesizer(
-            speech_config=speech_config, audio_config=None)
-        
-        
-        result = speech_synthesizer.speak_text_async(text).get()
+        audio_data = tts_limiter.call(synthesize, units=len(text))
 
-        if result.reason == speechsdk.ResultReason.SynthesizingAudioCompleted:
-            audio_data = result.audio_data
+        if audio_data is not None:
             with open(output_file, "wb") as audio_file:
                 audio_file.write(audio_data)
             log.log_debug(f"Audio saved to {output_file}")
-        else:
-            log.log_error(f"Error synthesizing speech for {output_file}: {result.reason}")
+            return output_file
+        log.log_error(f"Error synthesizing speech for {output_file}")
 
     except Exception as e:
         log.log_error(f"Error creating speech for {output_file}: {str(e)}")
         log.log_error(f"Problematic text: '{text}'")
+    return None
 
 
 def create_speech_from_ssml(ssml, output_file):
@@ -75,6 +165,144 @@ def create_speech_from_ssml(ssml, output_file):
         log.log_error(f"Problematic SSML: '{ssml[:100]}...'")  # log.log_debug first 100 characters of SSML for debugging
         return None
 
+def synthesize_ssml_with_bookmarks(ssml: str) -> Tuple[Optional[bytes], Dict[str, float]]:
+    """
+    Synthesize an SSML document and collect the audio offset of every bookmark.
+
+    Returns:
+        The WAV audio data (or None on failure) and a mapping of bookmark name
+        to its offset in milliseconds.
+    Raises:
+        ThrottledError: The service is throttling or overloaded
+    """
+    bookmarks = {}
+
+    try:
+        speech_synthesizer = speechsdk.SpeechSynthesizer(
+            speech_config=new_speech_config(), audio_config=None)
+        speech_synthesizer.bookmark_reached.connect(
+            lambda evt: bookmarks.__setitem__(evt.text, evt.audio_offset / TICKS_PER_MS))
+
+        result = speech_synthesizer.speak_ssml_async(ssml).get()
+
+        if result.reason == speechsdk.ResultReason.SynthesizingAudioCompleted:
+            return result.audio_data, bookmarks
+        raise_if_throttled(result)
+        if result.reason == speechsdk.ResultReason.Canceled:
+            cancellation_details = result.cancellation_details
+            log.log_error(f"Batched speech synthesis canceled: {cancellation_details.reason}")
+            if cancellation_details.reason == speechsdk.CancellationReason.Error:
+                log.log_error(f"Error details: {cancellation_details.error_details}")
+        else:
+            log.log_error(f"Error synthesizing batched speech: {result.reason}")
+
+    except ThrottledError:
+        raise
+    except Exception as e:
+        log.log_error(f"Error creating batched speech: {str(e)}")
+        log.log_error(f"Problematic SSML: '{ssml[:100]}...'")
+
+    return None, bookmarks
+
+
+def get_voice_for_speaker(speaker: str) -> str:
+    """Pick the Azure voice for a speaker name, falling back to the default voice."""
+    for name, voice in HOST_VOICES.items():
+        if name in speaker:
+            return voice
+    return DEFAULT_VOICE
+
+
+def build_batch_ssml(segments: List[Tuple[int, str, str]]) -> str:
+    """
+    Build one SSML document for several consecutive turns.
+
+    Args:
+        segments: List of (segment index, voice, text) tuples
+    Returns:
+        SSML with a bookmark at the start of every turn, named after its segment index
+    """
+    voices = [
+        f'<voice name={quoteattr(voice)}><bookmark mark="segment_{index}"/>{escape(text)}</voice>'
+        for index, voice, text in segments
+    ]
+    return (
+        '<speak version="1.0" xmlns="http://www.w3.org/2001/10/synthesis" xml:lang="en-US">'
+        + "".join(voices)
+        + "</speak>"
+    )
+
+
+def batch_segments(segments: List[Tuple[int, str, str]],
+                   max_chars: int = SSML_BATCH_MAX_CHARS,
+                   max_voices: int = SSML_BATCH_MAX_VOICES) -> List[List[Tuple[int, str, str]]]:
+    """Pack consecutive (index, voice, text) segments into batches that fit one SSML request."""
+    batches = []
+    current = []
+    current_chars = 0
+
+    for segment in segments:
+        segment_chars = len(escape(segment[2]))
+        if current and (current_chars + segment_chars > max_chars or len(current) >= max_voices):
+            batches.append(current)
+            current = []
+            current_chars = 0
+        current.append(segment)
+        current_chars += segment_chars
+
+    if current:
+        batches.append(current)
+    return batches
+
+
+def create_speech_batch(segments: List[Tuple[int, str, str]], output_dir: Path,
+                        hedger: Optional[RequestHedger] = None) -> List[Path]:
+    """
+    Synthesize a batch of turns in a single request and split the audio back into
+    one WAV file per turn using the bookmark offsets.
+
+    Falls back to one request per turn if the batch fails or bookmarks are missing.
+
+    Returns:
+        The segment files written; turns that could not be synthesized are left out
+    """
+    ssml = build_batch_ssml(segments)
+    characters = sum(len(text) for _, _, text in segments)
+
+    def synthesize():
+        if hedger:
+            return hedger.call(lambda: synthesize_ssml_with_bookmarks(ssml), units=characters)
+        return synthesize_ssml_with_bookmarks(ssml)
+
+    try:
+        audio_data, bookmarks = tts_limiter.call(synthesize, units=characters)
+    except ThrottledError as e:
+        log.log_error(f"Batched synthesis of {len(segments)} turns still throttled after retries: {str(e)}")
+        audio_data, bookmarks = None, {}
+
+    offsets = [bookmarks.get(f"segment_{index}") for index, _, _ in segments]
+    if audio_data is None or any(offset is None for offset in offsets):
+        log.log_warning(f"Batched synthesis of {len(segments)} turns failed, falling back to per-turn requests")
+        segment_files = []
+        for index, voice, text in segments:
+            segment_file = output_dir / f"segment_{index:03d}.wav"
+            if create_speech(text, voice, str(segment_file), hedger):
+                segment_files.append(segment_file)
+        return segment_files
+
+    audio = AudioSegment.from_wav(io.BytesIO(audio_data))
+    boundaries = offsets[1:] + [len(audio)]
+
+    segment_files = []
+    for (index, _, _), start, end in zip(segments, offsets, boundaries):
+        segment_file = output_dir / f"segment_{index:03d}.wav"
+        audio[start:end].export(str(segment_file), format="wav")
+        segment_files.append(segment_file)
+
+    log.log_debug(f"Synthesized {len(segments)} turns in one request")
+    return segment_files
+
+
 def convert_wav_to_mp3(wav_file: Path, mp3_file: Path):
     try:
         audio = AudioSegment.from_wav(str(wav_file))
@@ -108,68 +336,79 @@ def convert_wav_to_mp3(wav_file: Path, mp3_file: Path):
     # else:
     #     return full_ssml, None
 
-async def text_to_speech(script: str, output_path: str):
-    # Convert output_path to Path object
-    output_path = Path(output_path)
-    
-    # Make sure the directory exists
-    output_path.parent.mkdir(parents=True, exist_ok=True)
 
-    # Split the script into lines
-    lines = script.split('\n')
-
-    # Initialize variables
-    current_speaker = ""
-    current_text = ""
-    audio_segments = []
-    line_number = 0
-
-    for line in lines:
-        line_number += 1
-        line = line.strip()
-
-        # Check for speaker lines in both formats
-        if ':' in line and (line.startswith('**') or any(name in line.split(':')[0] for name in ['Alex', 'Jane'])):
-            # New speaker
-            if current_speaker and current_text.strip():
-                audio_segments.append(
-                    (current_speaker, current_text.strip(), line_number - 1))
-            current_speaker = line.split(':')[0].strip('* ')
-            current_text = line.split(':', 1)[1].strip() + " "
-        elif line and not line.startswith('[') and not line.startswith('#'):
-            current_text += line + " "
-
-    # Add the last segment
-    if current_speaker and current_text.strip():
-        audio_segments.append(
-            (current_speaker, current_text.strip(), line_number))
-
-    # Create audio files for each segment
-    temp_segments = []
-    for i, (speaker, text, line_number) in enumerate(audio_segments):
-        if 'Alex' in speaker:
-            voice = "en-US-AndrewMultilingualNeural"
-        elif 'Jane' in speaker:
-            voice = "en-US-AvaMultilingualNeural"
-        else:
-            voice = "en-US-BrandonMultilingualNeural"  # Default voice
+def speech_segments(script: str, hosts: Optional[Sequence[str]] = None) -> List[Tuple[int, str, str]]:
+    """
+    Split a script into the turns to synthesize.
 
+    Args:
+        hosts: Host roster of the show (utils.script_parser.host_roster), default two hosts
+    Returns:
+        (segment index, voice, text) tuples. Indexes follow the turn order in the
+        script, so turns skipped for having no text leave gaps.
+    """
+    segments = []
+    for i, (speaker, text, line_number) in enumerate(parse_script(script, hosts)):
         clean_text = text.strip()
 
         if not clean_text:
             log.log_debug(f"Warning: Empty cleaned text for segment {i} (starting at line {line_number}). Original text: '{text}'")
             continue
 
-        # Create segment filename using parent directory of output_path
-        segment_file = output_path.parent / f"segment_{i:03d}.wav"
-        create_speech(clean_text, voice, str(segment_file))
-        temp_segments.append(segment_file)
-        log.log_debug(f"Created {segment_file} for {speaker}: {clean_text[:50]}...")
+        segments.append((i, get_voice_for_speaker(speaker), clean_text))
+    return segments
+
+
+async def synthesize_segments(segments: List[Tuple[int, str, str]], output_dir: Path,
+                              ssml_batching: bool = False, hedge: bool = False) -> None:
+    """
+    Synthesize (index, voice, text) segments concurrently into output_dir/segment_<index>.wav.
+
+    Raises:
+        RuntimeError: If any segment could not be synthesized, once all requests have finished
+    """
+    # Requests run concurrently; tts_limiter decides how many are in flight at once
+    hedger = tts_hedger if hedge else None
+    loop = asyncio.get_running_loop()
+    with ThreadPoolExecutor(max_workers=int(tts_limiter.max_limit)) as executor:
+        if ssml_batching:
+            batches = batch_segments(segments)
+            log.log_info(f"Packed {len(segments)} turns into {len(batches)} SSML requests")
+            written = await asyncio.gather(*[
+                loop.run_in_executor(executor, create_speech_batch, batch, output_dir, hedger)
+                for batch in batches
+            ])
+            written = {Path(f) for batch_files in written for f in batch_files}
+        else:
+            # Create audio files for each segment, named after the turn so order does not depend on completion
+            written = await asyncio.gather(*[
+                loop.run_in_executor(executor, create_speech, text, voice,
+                                     str(output_dir / f"segment_{i:03d}.wav"), hedger)
+                for i, voice, text in segments
+            ])
+            written = {Path(f) for f in written if f}
+
+    # An episode with missing turns is worse than no episode
+    failed = [i for i, _, _ in segments if output_dir / f"segment_{i:03d}.wav" not in written]
+    if failed:
+        raise RuntimeError(f"Speech synthesis failed for {len(failed)} of {len(segments)} segments: "
+                           f"{', '.join(str(i) for i in failed)}")
+
+    log.log_debug(f"Processed {len(segments)} segments. Azure Speech concurrency: {tts_limiter.metrics()}")
+
+
+async def text_to_speech(script: str, output_path: str, ssml_batching: bool = False,
+                         hosts: Optional[Sequence[str]] = None, hedge: bool = False):
+    # Convert output_path to Path object
+    output_path = Path(output_path)
+    
+    # Make sure the directory exists
+    output_path.parent.mkdir(parents=True, exist_ok=True)
 
-        # Add a short pause between segments
-        time.sleep(0.5)
+    # Split the script into speaker turns
+    segments = speech_segments(script, hosts)
 
-    log.log_debug(f"Processed {len(audio_segments)} segments.")
+    await synthesize_segments(segments, output_path.parent, ssml_batching=ssml_batching, hedge=hedge)
     return output_path
 
 # Example usage:
@@ -0,0 +1,187 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+from logger import CustomLogger
+
+log = CustomLogger("LLMCache", log_file="llm_cache.log")
+
+DEFAULT_CACHE_DIR = ".cache/llm"
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+DEFAULT_MAX_BYTES = 500 * 1024 * 1024
+
+
+class LLMCache:
+    """
+    Disk cache for chat completion responses.
+
+    Entries are keyed by the model, the exact messages and the sampling
+    parameters, expire after a TTL, and are evicted least-recently-used first
+    once the cache directory exceeds its size limit.
+
+    Args:
+        cache_dir: Directory holding one JSON file per response
+        ttl_seconds: Age after which an entry is ignored and removed
+        max_bytes: Size limit of the cache directory
+        enabled: When False the cache is bypassed entirely (no reads, no writes)
+        refresh: When True cached entries are ignored but fresh responses are stored
+    """
+
+    def __init__(self, cache_dir: Union[str, Path] = DEFAULT_CACHE_DIR,
+                 ttl_seconds: float = DEFAULT_TTL_SECONDS,
+                 max_bytes: int = DEFAULT_MAX_BYTES,
+                 enabled: bool = True, refresh: bool = False):
+        self.cache_dir = Path(cache_dir)
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.refresh = refresh
+
+        self.hits = 0
+        self.misses = 0
+        self.tokens_saved = 0
+        self.evictions = 0
+        self._size: Optional[int] = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "LLMCache":
+        """Build a cache configured by the LLM_CACHE_* environment variables."""
+        return cls(
+            cache_dir=os.getenv("LLM_CACHE_DIR", DEFAULT_CACHE_DIR),
+            ttl_seconds=float(os.getenv("LLM_CACHE_TTL_SECONDS", DEFAULT_TTL_SECONDS)),
+            max_bytes=int(float(os.getenv("LLM_CACHE_MAX_MB", DEFAULT_MAX_BYTES / (1024 * 1024))) * 1024 * 1024),
+            enabled=os.getenv("LLM_CACHE_BYPASS", "").lower() not in ("1", "true", "yes"),
+            refresh=os.getenv("LLM_CACHE_REFRESH", "").lower() in ("1", "true", "yes"),
+        )
+
+    @staticmethod
+    def make_key(model: str, messages: List[dict], params: Optional[Dict] = None) -> str:
+        payload = json.dumps({"model": model, "messages": messages, "params": params or {}},
+                             sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _entry_path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached response for a key, or None on a miss (or when bypassed/refreshing)."""
+        if not self.enabled:
+            return None
+        if self.refresh:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        entry_path = self._entry_path(key)
+        try:
+            with open(entry_path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            entry = None
+        except (OSError, json.JSONDecodeError) as e:
+            log.log_warning(f"Ignoring unreadable cache entry {entry_path}: {str(e)}")
+            entry = None
+
+        if entry is not None and time.time() - entry.get("created_at", 0) > self.ttl_seconds:
+            removed_size = self._remove(entry_path)
+            with self._lock:
+                if self._size is not None:
+                    self._size -= removed_size
+            entry = None
+
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.tokens_saved += entry.get("total_tokens", 0)
+
+        # Touch the entry so size-based eviction removes least recently used entries first
+        try:
+            os.utime(entry_path)
+        except OSError:
+            pass
+        return entry["content"]
+
+    def peek(self, key: str) -> Optional[str]:
+        """Like get(), but without counting a hit or miss, touching or expiring the entry (for dry runs)."""
+        if not self.enabled or self.refresh:
+            return None
+        try:
+            with open(self._entry_path(key), "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+        if time.time() - entry.get("created_at", 0) > self.ttl_seconds:
+            return None
+        return entry["content"]
+
+    def put(self, key: str, content: str, total_tokens: int = 0) -> None:
+        """Store a response and evict old entries if the cache grew past its size limit."""
+        if not self.enabled:
+            return
+
+        entry_path = self._entry_path(key)
+        entry_path.parent.mkdir(parents=True, exist_ok=True)
+        data = json.dumps({"created_at": time.time(), "total_tokens": total_tokens, "content": content})
+        temp_path = entry_path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(data)
+
+        with self._lock:
+            # A refreshed response replaces the entry, which no longer takes up its old size
+            try:
+                replaced_size = entry_path.stat().st_size
+            except OSError:
+                replaced_size = 0
+            os.replace(temp_path, entry_path)
+            if self._size is None:
+                self._size = sum(p.stat().st_size for p in self.cache_dir.rglob("*.json"))
+            else:
+                self._size += len(data.encode("utf-8")) - replaced_size
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _remove(self, entry_path: Path) -> int:
+        try:
+            size = entry_path.stat().st_size
+            entry_path.unlink()
+            return size
+        except OSError:
+            return 0
+
+    def _evict(self) -> None:
+        # Called with the lock held; drop least recently used entries down to 90% of the limit
+        entries = []
+        for path in self.cache_dir.rglob("*.json"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+
+        self._size = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        for _, _, path in entries:
+            if self._size <= target:
+                break
+            self._size -= self._remove(path)
+            self.evictions += 1
+
+    def report(self) -> Dict:
+        """Hit/miss counts and tokens saved since this cache was created."""
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "refresh": self.refresh,
+                "hits": self.hits,
+                "misses": self.misses,
+                "tokens_saved": self.tokens_saved,
+                "evictions": self.evictions,
+            }
@@ -1,5 +1,13 @@
+import asyncio
+import re
+from typing import List, Optional, Sequence, Tuple
+
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.metrics.pairwise import linear_kernel
+
 from ai_helper.ai_helper import generate_content_from_openai
 from logger import CustomLogger
+from utils.script_parser import Turn, host_roster, parse_script
 
 log = CustomLogger("ScriptGenerator", log_file="script_generator.log")
 
@@ -114,20 +122,250 @@ Expected Markdown Output Format:
 """
 
 
+MULTI_HOST_SCRIPT_INSTRUCTIONS = """
+---
+
+This episode has {host_count} hosts: {host_names}. Give every host a distinct personality and a fair share of the conversation, and use exactly these names.
+
+Expected Markdown Output Format:
+{output_format}
+"""
+
+
+def get_script_system_instructions(host_count: int) -> str:
+    """Pick the script prompt for the number of hosts."""
+    if host_count == 1:
+        return ONE_HOST_PODCAST_SCRIPT_SYSTEM_INSTRUCTIONS
+    if host_count == 2:
+        return TWO_HOST_PODCAST_SCRIPT_SYSTEM_INSTRUCTIONS
+    hosts = host_roster(host_count)
+    host_names = ", ".join(hosts[:-1]) + f" and {hosts[-1]}"
+    return TWO_HOST_PODCAST_SCRIPT_SYSTEM_INSTRUCTIONS.replace(
+        "two hosts: Alex and Jane", f"{host_count} hosts: {host_names}") + MULTI_HOST_SCRIPT_INSTRUCTIONS.format(
+        host_count=host_count, host_names=host_names,
+        output_format="\n".join(f"**{host}:** [Content]" for host in hosts))
+
+
 async def generate_podcast_script(outline: str, analysis: str, host_count: int) -> str:
     try:
         log.log_info("Generating podcast script")
 
-        if host_count == 1:
-            PODCAST_SCRIPT_SYSTEM_INSTRUCTIONS = ONE_HOST_PODCAST_SCRIPT_SYSTEM_INSTRUCTIONS
-        elif host_count > 1:
-            PODCAST_SCRIPT_SYSTEM_INSTRUCTIONS = TWO_HOST_PODCAST_SCRIPT_SYSTEM_INSTRUCTIONS
+        PODCAST_SCRIPT_SYSTEM_INSTRUCTIONS = get_script_system_instructions(host_count)
 
         final_content = f"{outline}\n\nContent Details:{analysis}"
 
-        script = generate_content_from_openai(content=final_content, system_instructions=PODCAST_SCRIPT_SYSTEM_INSTRUCTIONS, purpose="Podcast Script")
+        script = await asyncio.to_thread(
+            generate_content_from_openai, content=final_content, system_instructions=PODCAST_SCRIPT_SYSTEM_INSTRUCTIONS,
+            purpose="Podcast Script")
 
         return script
     except Exception as e:
         log.log_error(f"Error generating podcast script: {e}")
-        raise
\ No newline at end of file
+        raise
+
+SECTION_SCRIPT_INSTRUCTIONS = """
+---
+
+You are writing ONLY part {index} of {total} of this episode, covering the outline section given below. Other writers are producing the other sections at the same time.
+The full outline is included for context only; do not cover talking points that belong to other sections.
+{position}
+Keep the same hosts, names and Markdown output format. Do not add headings or stage directions.
+"""
+
+FIRST_SECTION_POSITION = "This is the opening section: start with the introduction of the hosts and the topic, and do not close the episode."
+MIDDLE_SECTION_POSITION = "This is a middle section: do not greet the listeners or introduce the hosts again, and do not close the episode."
+LAST_SECTION_POSITION = "This is the final section: do not greet the listeners or introduce the hosts again, and end with the closing remarks."
+
+TRANSITION_SYSTEM_INSTRUCTIONS = """
+You are editing a podcast script that was written in separate sections. You are given the last lines of one section and the first lines of the next.
+Rewrite ONLY these lines so the conversation flows naturally from one topic to the next: add a short bridge, remove repeated greetings or premature goodbyes, and keep every fact.
+Keep the same speakers in the same order and return the same number of lines in this exact format, with nothing else:
+**Name:** [Content]
+"""
+
+SECTION_PASSAGE_CHARS = 1500  # Source material is split into passages of roughly this size
+SECTION_CONTEXT_CHARS = 30000  # Source material given to each section
+SEAM_TURNS = 2  # Turns on each side of a section boundary given to the stitching pass
+MAX_CONCURRENT_SECTIONS = 4
+
+_HEADING = re.compile(r"^(#{1,6})\s+\S", re.MULTILINE)
+_NUMBERED_ITEM = re.compile(r"^\d+\.\s+\S", re.MULTILINE)
+
+
+def split_outline_sections(outline: str) -> List[str]:
+    """
+    Split a Markdown outline into its main talking points.
+
+    Uses the shallowest heading level that appears at least three times, falling
+    back to top-level numbered list items. Text before the first section (such as
+    the episode title) is kept with the first section.
+    """
+    starts = []
+    levels = [len(match.group(1)) for match in _HEADING.finditer(outline)]
+    for level in sorted(set(levels)):
+        if levels.count(level) >= 3:
+            starts = [match.start() for match in _HEADING.finditer(outline) if len(match.group(1)) == level]
+            break
+    if not starts:
+        starts = [match.start() for match in _NUMBERED_ITEM.finditer(outline)]
+    if len(starts) < 2:
+        return [outline.strip()] if outline.strip() else []
+
+    starts[0] = 0
+    boundaries = starts + [len(outline)]
+    return [outline[start:end].strip() for start, end in zip(boundaries, boundaries[1:]) if outline[start:end].strip()]
+
+
+def split_passages(analysis: str, passage_chars: int = SECTION_PASSAGE_CHARS) -> List[str]:
+    """Group the lines of the source material into passages of roughly passage_chars characters."""
+    passages = []
+    current = []
+    size = 0
+    for line in analysis.splitlines():
+        if not line.strip():
+            continue
+        current.append(line)
+        size += len(line) + 1
+        if size >= passage_chars:
+            passages.append("\n".join(current))
+            current = []
+            size = 0
+    if current:
+        passages.append("\n".join(current))
+    return passages
+
+
+def select_section_passages(sections: List[str], passages: List[str],
+                            max_chars: int = SECTION_CONTEXT_CHARS) -> List[str]:
+    """
+    Pick the passages most similar (TF-IDF cosine) to each section, up to max_chars,
+    keeping them in their original order.
+    """
+    if sum(len(passage) for passage in passages) <= max_chars:
+        return ["\n\n".join(passages)] * len(sections)
+
+    vectorizer = TfidfVectorizer(stop_words="english", sublinear_tf=True)
+    passage_vectors = vectorizer.fit_transform(passages)
+    similarities = linear_kernel(vectorizer.transform(sections), passage_vectors)
+
+    selected = []
+    for scores in similarities:
+        chosen = []
+        size = 0
+        for index in scores.argsort()[::-1]:
+            if size + len(passages[index]) > max_chars:
+                continue
+            chosen.append(index)
+            size += len(passages[index])
+        selected.append("\n\n".join(passages[index] for index in sorted(chosen)))
+    return selected
+
+
+def format_turns(turns: List[Turn]) -> str:
+    return "\n\n".join(f"**{turn.speaker}:** {turn.text}" for turn in turns)
+
+
+def seam_sizes(before: List[Turn], after: List[Turn]) -> Tuple[int, int]:
+    """Turns taken from the end of one section and the start of the next to stitch them."""
+    # Never take more than half of a section so neighbouring seams do not overlap
+    return min(SEAM_TURNS, len(before) // 2), min(SEAM_TURNS, len(after) // 2)
+
+
+async def stitch_sections(section_turns: List[List[Turn]], max_concurrency: int = MAX_CONCURRENT_SECTIONS,
+                          hosts: Optional[Sequence[str]] = None) -> str:
+    """
+    Smooth the boundaries between independently written sections by rewriting
+    the few turns on each side of every boundary, all boundaries concurrently.
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def stitch(index: int):
+        before = section_turns[index]
+        after = section_turns[index + 1]
+        tail, head = seam_sizes(before, after)
+        if not tail or not head:
+            return
+
+        seam = before[-tail:] + after[:head]
+        async with semaphore:
+            try:
+                rewritten = await asyncio.to_thread(
+                    generate_content_from_openai, format_turns(seam), TRANSITION_SYSTEM_INSTRUCTIONS,
+                    purpose="Section Transition")
+            except Exception as e:
+                log.log_warning(f"Could not stitch sections {index + 1} and {index + 2}: {e}")
+                return
+
+        rewritten_turns = parse_script(rewritten, hosts)
+        if len(rewritten_turns) != len(seam):
+            log.log_warning(f"Transition between sections {index + 1} and {index + 2} came back with "
+                            f"{len(rewritten_turns)} turns instead of {len(seam)}, keeping the original")
+            return
+        before[-tail:] = rewritten_turns[:tail]
+        after[:head] = rewritten_turns[tail:]
+
+    await asyncio.gather(*[stitch(index) for index in range(len(section_turns) - 1)])
+    return "\n\n".join(format_turns(turns) for turns in section_turns if turns)
+
+
+def section_requests(outline: str, analysis: str, host_count: int) -> List[Tuple[str, str]]:
+    """
+    Content and system instructions of every outline section's script request,
+    empty when the outline has no separate sections.
+    """
+    sections = split_outline_sections(outline)
+    if len(sections) < 2:
+        return []
+
+    system_instructions = get_script_system_instructions(host_count)
+    section_sources = select_section_passages(sections, split_passages(analysis))
+    requests = []
+    for index, (section, sources) in enumerate(zip(sections, section_sources)):
+        if index == 0:
+            position = FIRST_SECTION_POSITION
+        elif index == len(sections) - 1:
+            position = LAST_SECTION_POSITION
+        else:
+            position = MIDDLE_SECTION_POSITION
+        instructions = system_instructions + SECTION_SCRIPT_INSTRUCTIONS.format(
+            index=index + 1, total=len(sections), position=position)
+        content = f"Full outline:\n{outline}\n\nSection to write now:\n{section}\n\nContent Details:{sources}"
+        requests.append((content, instructions))
+    return requests
+
+
+async def generate_podcast_script_by_section(outline: str, analysis: str, host_count: int,
+                                             max_concurrency: int = MAX_CONCURRENT_SECTIONS) -> str:
+    """
+    Generate the script one outline section at a time, all sections concurrently.
+
+    Each section gets the full outline for context but only the source passages
+    most relevant to its own talking point. A stitching pass then rewrites the
+    turns around each section boundary so the episode flows as one conversation.
+    """
+    try:
+        requests = section_requests(outline, analysis, host_count)
+        if not requests:
+            log.log_info("Outline has no separate sections, generating the script in one pass")
+            return await generate_podcast_script(outline, analysis, host_count)
+
+        log.log_info(f"Generating podcast script for {len(requests)} outline sections concurrently")
+        hosts = host_roster(host_count)
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def generate_section(index: int, content: str, instructions: str) -> List[Turn]:
+            async with semaphore:
+                script = await asyncio.to_thread(
+                    generate_content_from_openai, content, instructions, purpose="Podcast Script Section")
+            turns = parse_script(script, hosts)
+            log.log_debug(f"Section {index + 1}/{len(requests)} produced {len(turns)} turns")
+            return turns
+
+        section_turns = await asyncio.gather(*[
+            generate_section(index, content, instructions)
+            for index, (content, instructions) in enumerate(requests)
+        ])
+        return await stitch_sections(list(section_turns), max_concurrency, hosts)
+    except Exception as e:
+        log.log_error(f"Error generating podcast script by section: {e}")
+        raise
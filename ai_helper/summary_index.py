@@ -0,0 +1,103 @@
+import asyncio
+import hashlib
+import json
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import Optional, Union
+
+from logger import CustomLogger
+from ai_helper.ai_helper import generate_content_from_openai
+
+log = CustomLogger("SummaryIndex", log_file="summary_index.log")
+
+# Bump whenever DOCUMENT_SUMMARY_SYSTEM_INSTRUCTIONS changes so stale summaries are not reused
+SUMMARY_PROMPT_VERSION = 1
+
+DOCUMENT_SUMMARY_SYSTEM_INSTRUCTIONS = """
+Act as a research assistant preparing source material for a podcast producer.
+Summarize the provided document as a detailed Markdown brief that a producer can outline an episode from without reading the original.
+
+Include:
+- The main topic and the key arguments or findings
+- Important facts, statistics, dates, names and historical context
+- Surprising or memorable details, anecdotes and examples
+- Open questions, disagreements or different perspectives raised in the document
+
+Keep specific numbers and names exactly as written. Do not add information that is not in the document.
+"""
+
+
+class SummaryIndex:
+    """
+    On-disk index of per-document summaries, keyed by the hash of the extracted
+    text and the summary prompt version, shared by every project that uses the
+    same index directory.
+    """
+
+    def __init__(self, index_dir: Union[str, Path]):
+        self.index_dir = Path(index_dir)
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def document_hash(content: str) -> str:
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def _entry_path(self, document_hash: str) -> Path:
+        return self.index_dir / f"{document_hash}_v{SUMMARY_PROMPT_VERSION}.json"
+
+    def get(self, content: str) -> Optional[str]:
+        """Return the cached summary of a document, if any."""
+        entry_path = self._entry_path(self.document_hash(content))
+        try:
+            with open(entry_path, "r", encoding="utf-8") as f:
+                return json.load(f)["summary"]
+        except FileNotFoundError:
+            return None
+        except (json.JSONDecodeError, KeyError) as e:
+            log.log_warning(f"Ignoring corrupt summary index entry {entry_path}: {str(e)}")
+            return None
+
+    def put(self, content: str, summary: str, source: str = "") -> None:
+        """Store a summary, writing through a temporary file so readers never see partial entries."""
+        document_hash = self.document_hash(content)
+        entry_path = self._entry_path(document_hash)
+        temp_path = entry_path.with_suffix(f".{os.getpid()}.tmp")
+        entry = {
+            "document_hash": document_hash,
+            "prompt_version": SUMMARY_PROMPT_VERSION,
+            "source": source,
+            "characters": len(content),
+            "created_at": datetime.now().isoformat(),
+            "summary": summary,
+        }
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f, indent=2)
+        os.replace(temp_path, entry_path)
+
+    async def summarize(self, content: str, source: str = "") -> str:
+        """
+        Return the summary of a document, generating and storing it on a cache miss.
+
+        Falls back to the full document text if the summary cannot be generated.
+        """
+        summary = self.get(content)
+        if summary is not None:
+            log.log_debug(f"Summary index hit for {source or 'document'}")
+            return summary
+
+        log.log_info(f"Summarizing {source or 'document'} ({len(content)} characters)")
+        try:
+            summary = await asyncio.to_thread(
+                generate_content_from_openai, content, DOCUMENT_SUMMARY_SYSTEM_INSTRUCTIONS,
+                purpose="Document Summary")
+        except Exception as e:
+            log.log_error(f"Error summarizing {source or 'document'}, using full text: {str(e)}")
+            return content
+
+        try:
+            self.put(content, summary, source)
+        except OSError as e:
+            # The summary is still good for this run, it just has to be generated again next time
+            log.log_error(f"Error storing the summary of {source or 'document'}: {str(e)}")
+        return summary
@@ -0,0 +1,80 @@
+"""
+Benchmark DOCX text extraction: the python-docx object model against streaming
+word/document.xml with lxml iterparse. Reports wall time and peak traced memory
+for growing documents and checks both extractors produce the same lines.
+
+Usage:
+    python -m benchmarks.bench_docx_extraction --paragraphs 2000 20000 100000
+"""
+import argparse
+import random
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+from pathlib import Path
+
+from docx import Document
+
+from document_processor import iter_docx_texts, iter_docx_texts_streaming, normalize_lines
+
+WORDS = ("data model energy policy history science system network market signal "
+         "pattern analysis growth region the of and to in is that for on with").split()
+
+
+def write_docx(path: Path, paragraphs: int, table_every: int = 50, seed: int = 0):
+    """Write a document of short paragraphs with a small formatted table every table_every paragraphs."""
+    rng = random.Random(seed)
+    document = Document()
+    for index in range(paragraphs):
+        paragraph = document.add_paragraph()
+        # Several runs per paragraph, like real exports with mixed formatting
+        for run_index in range(rng.randint(1, 4)):
+            run = paragraph.add_run(" ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 12))) + " ")
+            run.bold = run_index % 2 == 1
+        if index % table_every == table_every - 1:
+            table = document.add_table(rows=3, cols=3)
+            for row in table.rows:
+                for cell in row.cells:
+                    cell.text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 5)))
+    document.save(str(path))
+
+
+def measure(extract, path: Path):
+    # Time and memory are measured in separate passes, tracemalloc slows allocation-heavy code a lot
+    start = time.perf_counter()
+    lines = list(normalize_lines(extract(str(path))))
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    for _ in normalize_lines(extract(str(path))):
+        pass
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return lines, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--paragraphs", type=int, nargs="+", default=[2000, 20000, 100000])
+    args = parser.parse_args()
+
+    print(f"{'paragraphs':>10} {'size (MB)':>10} {'python-docx (s)':>16} {'streaming (s)':>14} "
+          f"{'speedup':>8} {'docx peak MB':>13} {'stream peak MB':>15} {'same lines':>11}")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for paragraphs in args.paragraphs:
+            path = Path(temp_dir) / f"document_{paragraphs}.docx"
+            write_docx(path, paragraphs)
+
+            docx_lines, docx_seconds, docx_peak = measure(iter_docx_texts, path)
+            stream_lines, stream_seconds, stream_peak = measure(iter_docx_texts_streaming, path)
+            # python-docx emits tables after all paragraphs, so compare the lines regardless of order
+            same = Counter(docx_lines) == Counter(stream_lines)
+
+            print(f"{paragraphs:>10} {path.stat().st_size / 1024 / 1024:>10.1f} {docx_seconds:>16.2f} "
+                  f"{stream_seconds:>14.2f} {docx_seconds / stream_seconds:>8.1f} "
+                  f"{docx_peak / 1024 / 1024:>13.1f} {stream_peak / 1024 / 1024:>15.1f} {str(same):>11}")
+
+
+if __name__ == "__main__":
+    main()
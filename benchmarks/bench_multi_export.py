@@ -0,0 +1,90 @@
+"""
+Benchmark publishing an episode in several formats: encoding the combined MP3
+and then decoding it again for every further format, against one PCM pass
+feeding all encoders and the waveform peaks at once.
+
+Usage:
+    python -m benchmarks.bench_multi_export --minutes 10 30 --exports mp3:64k opus peaks
+"""
+import argparse
+import json
+import subprocess
+import tempfile
+import time
+import wave
+from pathlib import Path
+
+import numpy as np
+
+from utils.combine_audio import combine_audio_files
+from utils.multi_export import ExportTarget, PeaksAccumulator, parse_export_spec
+
+SAMPLE_RATE = 24000
+SEGMENT_SECONDS = 8
+
+
+def write_segments(directory: Path, minutes: float, seed: int = 0):
+    """Write speech-like mono segments adding up to the given length."""
+    rng = np.random.default_rng(seed)
+    files = []
+    for index in range(int(minutes * 60 / SEGMENT_SECONDS)):
+        t = np.arange(SEGMENT_SECONDS * SAMPLE_RATE) / SAMPLE_RATE
+        envelope = 0.5 + 0.5 * np.sin(2 * np.pi * rng.uniform(2, 5) * t) ** 2
+        signal = envelope * (0.15 * np.sin(2 * np.pi * rng.uniform(120, 220) * t)
+                             + 0.02 * rng.standard_normal(len(t)))
+        path = directory / f"segment_{index:03d}.wav"
+        with wave.open(str(path), "wb") as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(SAMPLE_RATE)
+            wav.writeframes((signal * 32767).astype("<i2").tobytes())
+        files.append(path)
+    return files
+
+
+def export_by_redecoding(mp3_file: Path, target: ExportTarget):
+    """What publishing another format took before: a full decode of the combined MP3 per format."""
+    decode = subprocess.run(["ffmpeg", "-v", "error", "-i", str(mp3_file), "-f", "s16le", "-ac", "1",
+                             "-ar", str(SAMPLE_RATE), "pipe:1"], capture_output=True, check=True)
+    if target.format == "peaks":
+        accumulator = PeaksAccumulator(SAMPLE_RATE, 1, target.samples_per_pixel)
+        accumulator.add(decode.stdout)
+        target.path.write_text(json.dumps(accumulator.result()))
+        return
+    codec = ["-c:a", "libmp3lame", "-b:a", target.bitrate] if target.format == "mp3" else \
+        ["-c:a", "libopus", "-b:a", target.bitrate, "-ar", "48000", "-f", "ogg"]
+    subprocess.run(["ffmpeg", "-v", "error", "-y", "-f", "s16le", "-ar", str(SAMPLE_RATE), "-ac", "1",
+                    "-i", "pipe:0", *codec, str(target.path)], input=decode.stdout, check=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--minutes", type=float, nargs="+", default=[10, 30])
+    parser.add_argument("--exports", nargs="+", default=["mp3:64k", "opus", "peaks"])
+    args = parser.parse_args()
+
+    print(f"{'minutes':>8} {'re-decode (s)':>14} {'one pass (s)':>13} {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for minutes in args.minutes:
+            directory = Path(temp_dir) / f"{minutes:g}"
+            directory.mkdir()
+            segments = write_segments(directory, minutes)
+
+            before = directory / "before" / "podcast_combined.mp3"
+            start = time.perf_counter()
+            combine_audio_files(segments, before)
+            for spec in args.exports:
+                export_by_redecoding(before, parse_export_spec(spec, before))
+            redecode_seconds = time.perf_counter() - start
+
+            after = directory / "after" / "podcast_combined.mp3"
+            start = time.perf_counter()
+            combine_audio_files(segments, after, exports=[parse_export_spec(spec, after) for spec in args.exports])
+            single_pass_seconds = time.perf_counter() - start
+
+            print(f"{minutes:>8g} {redecode_seconds:>14.2f} {single_pass_seconds:>13.2f} "
+                  f"{redecode_seconds / single_pass_seconds:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
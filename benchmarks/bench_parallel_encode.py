@@ -0,0 +1,74 @@
+"""
+Benchmark MP3 encode wall time of the serial path against section-parallel encoding
+for increasing worker counts.
+
+Usage:
+    python -m benchmarks.bench_parallel_encode --minutes 30 --sample-rate 24000
+"""
+import argparse
+import os
+import tempfile
+import time
+import wave
+from pathlib import Path
+
+import numpy as np
+
+from utils.parallel_encode import encode_mp3_parallel, encode_pcm_to_mp3_frames
+
+
+def write_synthetic_speech(path: Path, minutes: float, sample_rate: int, seed: int = 0):
+    """Write a speech-like signal (modulated tones plus noise) in one-minute blocks."""
+    rng = np.random.default_rng(seed)
+    with wave.open(str(path), "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        offset = 0
+        for _ in range(int(np.ceil(minutes))):
+            t = (offset + np.arange(sample_rate * 60)) / sample_rate
+            envelope = 0.5 + 0.5 * np.sin(2 * np.pi * 4 * t) ** 2
+            signal = envelope * (0.2 * np.sin(2 * np.pi * 180 * t) + 0.1 * np.sin(2 * np.pi * 720 * t))
+            signal += 0.02 * rng.standard_normal(t.size)
+            wav.writeframes((signal * 32767).astype("<i2").tobytes())
+            offset += t.size
+
+
+def worker_counts(maximum: int):
+    count = 1
+    while count < maximum:
+        yield count
+        count *= 2
+    yield maximum
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--minutes", type=float, default=30)
+    parser.add_argument("--sample-rate", type=int, default=24000)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        wav_path = Path(temp_dir) / "episode.wav"
+        write_synthetic_speech(wav_path, args.minutes, args.sample_rate)
+
+        with wave.open(str(wav_path), "rb") as wav:
+            pcm = wav.readframes(wav.getnframes())
+        start = time.perf_counter()
+        encode_pcm_to_mp3_frames(pcm, args.sample_rate, 1)
+        serial = time.perf_counter() - start
+        del pcm
+
+        print(f"{args.minutes:g} min @ {args.sample_rate} Hz, {os.cpu_count()} CPUs")
+        print(f"{'workers':>8} {'wall (s)':>10} {'speedup':>8}")
+        print(f"{'serial':>8} {serial:10.2f} {1.0:8.2f}")
+        for workers in worker_counts(args.max_workers):
+            start = time.perf_counter()
+            encode_mp3_parallel(wav_path, Path(temp_dir) / f"episode_{workers}.mp3", workers=workers)
+            elapsed = time.perf_counter() - start
+            print(f"{workers:>8} {elapsed:10.2f} {serial / elapsed:8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,390 @@
+"""
+End-to-end pipeline benchmark.
+
+Generates a synthetic TXT/DOCX corpus and runs PodcastGenerator over it against
+stub LLM and TTS backends with configurable latency, then reports per-stage wall
+time, peak RSS and throughput as JSON so runs can be compared between commits.
+
+Usage:
+    python -m benchmarks.bench_pipeline --documents 20 --document-kb 200 --output before.json
+    python -m benchmarks.bench_pipeline --documents 20 --document-kb 200 --compare before.json
+    python -m benchmarks.bench_pipeline --documents 12 --series 3 --llm-latency 1 --tts-latency 0.3
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import random
+import re
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import wave
+from pathlib import Path
+from types import SimpleNamespace
+from xml.sax.saxutils import unescape
+
+import numpy as np
+from docx import Document
+
+# The pipeline modules build their API clients and the LLM cache at import time
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+os.environ.setdefault("AZURE_SPEECH_KEY", "benchmark")
+os.environ.setdefault("AZURE_SPEECH_REGION", "eastus")
+os.environ["LLM_CACHE_BYPASS"] = "1"
+
+import ai_helper.ai_helper as ai_helper  # noqa: E402
+import ai_helper.generate_speech as generate_speech  # noqa: E402
+from utils.adaptive_limiter import ThrottledError  # noqa: E402
+from main import PodcastGenerator  # noqa: E402
+
+STAGES = ["process_documents", "generate_outline", "generate_script", "generate_audio", "combine_audio_files"]
+SERIES_STAGES = ["process_documents", "plan_series", "generate_episodes"]
+
+TTS_SAMPLE_RATE = 16000  # Azure's default output format is 16 kHz 16-bit mono
+HOSTS = ("Alex", "Jane")
+
+WORDS = (
+    "ocean climate carbon research data model energy policy history science "
+    "system network market economy signal pattern analysis growth region species "
+    "measurement evidence theory result method sample change average risk impact "
+    "the of and to in is that for on with as by from at an be this which are"
+).split()
+
+
+def sentence(rng: random.Random, min_words: int = 6, max_words: int = 24) -> str:
+    words = [rng.choice(WORDS) for _ in range(rng.randint(min_words, max_words))]
+    return " ".join(words).capitalize() + "."
+
+
+def paragraph(rng: random.Random) -> str:
+    return " ".join(sentence(rng) for _ in range(rng.randint(3, 8)))
+
+
+def write_corpus(corpus_dir: Path, documents: int, document_kb: int, formats, seed: int = 0) -> int:
+    """Write synthetic documents cycling through formats and return the total character count."""
+    rng = random.Random(seed)
+    total_chars = 0
+    for index in range(documents):
+        doc_format = formats[index % len(formats)]
+        paragraphs = []
+        size = 0
+        while size < document_kb * 1024:
+            paragraphs.append(paragraph(rng))
+            size += len(paragraphs[-1]) + 1
+        total_chars += size
+
+        path = corpus_dir / f"document_{index:03d}.{doc_format}"
+        if doc_format == "txt":
+            path.write_text("\n".join(paragraphs), encoding="utf-8")
+        else:
+            document = Document()
+            for i, text in enumerate(paragraphs):
+                if i % 25 == 24:
+                    # Exercise table extraction as well as paragraphs
+                    table = document.add_table(rows=2, cols=2)
+                    for cell, cell_text in zip((c for row in table.rows for c in row.cells), text.split(". ")):
+                        cell.text = cell_text
+                else:
+                    document.add_paragraph(text)
+            document.save(str(path))
+    return total_chars
+
+
+class StubCompletions:
+    """Stands in for client.chat.completions, answering with an outline-shaped script after a delay."""
+
+    def __init__(self, latency: float, sections: int, turns_per_section: int, seed: int = 0):
+        self.latency = latency
+        self.sections = sections
+        self.turns_per_section = turns_per_section
+        self.seed = seed
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def create(self, model: str, messages, **params):
+        with self._lock:
+            self.calls += 1
+            rng = random.Random(self.seed + self.calls)
+        time.sleep(self.latency)
+
+        lines = []
+        for section in range(self.sections):
+            lines.append(f"## Section {section + 1}: {sentence(rng, 2, 5)}")
+            for turn in range(self.turns_per_section):
+                text = " ".join(sentence(rng) for _ in range(rng.randint(1, 4)))
+                lines.append(f"**{HOSTS[turn % len(HOSTS)]}:** {text}")
+        content = "\n\n".join(lines)
+
+        prompt_tokens = sum(len(message["content"]) for message in messages) // 4
+        completion_tokens = len(content) // 4
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+            usage=SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                                  total_tokens=prompt_tokens + completion_tokens),
+        )
+
+
+class StubSpeech:
+    """Stands in for Azure TTS, returning speech-like audio whose length follows the text length."""
+
+    def __init__(self, latency: float, chars_per_second: float, quota: int = 0,
+                 slow_fraction: float = 0.0, slow_factor: float = 10.0, seed: int = 0):
+        self.latency = latency
+        self.chars_per_second = chars_per_second
+        self.quota = quota
+        # A slow_fraction of requests take slow_factor times the latency, like a backend's tail
+        self.slow_fraction = slow_fraction
+        self.slow_factor = slow_factor
+        self._rng = random.Random(seed)
+        self.requests = 0
+        self.characters = 0
+        self.throttled = 0
+        self.in_flight = 0
+        self._lock = threading.Lock()
+        t = np.arange(TTS_SAMPLE_RATE) / TTS_SAMPLE_RATE
+        tone = (0.5 + 0.5 * np.sin(2 * np.pi * 4 * t) ** 2) * 0.2 * np.sin(2 * np.pi * 180 * t)
+        self._second = (tone * 32767).astype("<i2").tobytes()
+
+    def _pcm(self, text: str) -> bytes:
+        samples = int(len(text) / self.chars_per_second * TTS_SAMPLE_RATE)
+        repeats = samples // TTS_SAMPLE_RATE + 1
+        return (self._second * repeats)[:samples * 2]
+
+    def _wav(self, pcm: bytes) -> bytes:
+        buffer = io.BytesIO()
+        with wave.open(buffer, "wb") as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(TTS_SAMPLE_RATE)
+            wav.writeframes(pcm)
+        return buffer.getvalue()
+
+    def _request(self, characters: int):
+        with self._lock:
+            if self.quota and self.in_flight >= self.quota:
+                # Like a 429: rejected right away, without using the quota
+                self.throttled += 1
+                raise ThrottledError("stub TTS quota exceeded")
+            self.requests += 1
+            self.characters += characters
+            self.in_flight += 1
+            slow = self._rng.random() < self.slow_fraction
+        try:
+            time.sleep(self.latency * (self.slow_factor if slow else 1))
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def synthesize_text(self, text, voice):
+        self._request(len(text))
+        return self._wav(self._pcm(text))
+
+    def synthesize_ssml_with_bookmarks(self, ssml: str):
+        turns = re.findall(r'<bookmark mark="([^"]+)"/>(.*?)</voice>', ssml, re.DOTALL)
+        self._request(sum(len(text) for _, text in turns))
+        pcm = []
+        bookmarks = {}
+        offset_ms = 0.0
+        for mark, text in turns:
+            bookmarks[mark] = offset_ms
+            pcm.append(self._pcm(unescape(text)))
+            offset_ms += len(pcm[-1]) / 2 / TTS_SAMPLE_RATE * 1000
+        return self._wav(b"".join(pcm)), bookmarks
+
+
+def peak_rss_mb() -> dict:
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return {
+        "self": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1),
+        "children": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale, 1),
+    }
+
+
+def audio_seconds(segment_files) -> float:
+    total = 0.0
+    for segment_file in segment_files:
+        with wave.open(str(segment_file), "rb") as wav:
+            total += wav.getnframes() / wav.getframerate()
+    return total
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def run_once(args, corpus_dir: Path, output_dir: Path) -> dict:
+    generator = PodcastGenerator(
+        str(corpus_dir), str(output_dir), "benchmark", host_count=len(HOSTS),
+        ssml_batching=args.ssml_batching, normalize_audio=args.normalize_audio,
+        parallel_encode=args.parallel_encode, encode_workers=args.encode_workers,
+        use_summary_index=args.summary_index, parallel_script=args.parallel_script,
+        hedge_tts=args.hedge_tts,
+    )
+    start = time.perf_counter()
+    if args.series:
+        series = asyncio.run(generator.generate_series(args.series))
+        episodes = [json.loads((Path(episode["output_directory"]) / "metadata.json").read_text(encoding="utf-8"))
+                    for episode in series["episodes"] if "error" not in episode]
+    else:
+        episodes = [asyncio.run(generator.generate_podcast())]
+    total = time.perf_counter() - start
+    segment_files = [segment for metadata in episodes for segment in metadata["audio_segments"]]
+    run = {
+        "stages": dict(generator.stage_timings),
+        "total_seconds": round(total, 3),
+        "llm_requests": generator.llm_usage["requests"],
+        "llm_prompt_tokens": generator.llm_usage["prompt_tokens"],
+        "audio_seconds": audio_seconds(segment_files),
+        "segments": len(segment_files),
+        "concurrency": episodes[-1]["concurrency"],
+        "tts_hedging": episodes[-1].get("tts_hedging"),
+    }
+    if args.series:
+        # Stage time the episodes spent between them; above generate_episodes' wall time they overlapped
+        run["episodes"] = len(episodes)
+        run["episode_stage_seconds"] = round(sum(sum(metadata["stage_timings"].values()) for metadata in episodes), 3)
+    return run
+
+
+def summarize_runs(runs, corpus_chars: int, documents: int, speech: StubSpeech) -> dict:
+    stages = {stage: round(statistics.median(run["stages"].get(stage, 0.0) for run in runs), 3)
+              for stage in (SERIES_STAGES if "episodes" in runs[0] else STAGES)}
+    run = runs[0]
+
+    def rate(amount, seconds):
+        return round(amount / seconds, 2) if seconds else None
+
+    return {
+        "stages": stages,
+        "total_seconds": round(statistics.median(r["total_seconds"] for r in runs), 3),
+        "peak_rss_mb": peak_rss_mb(),
+        "counts": {
+            "documents": documents,
+            "document_characters": corpus_chars,
+            "llm_requests": run["llm_requests"],
+            "llm_prompt_tokens": run["llm_prompt_tokens"],
+            "tts_requests": speech.requests // len(runs),
+            "tts_throttled": speech.throttled // len(runs),
+            "tts_characters": speech.characters // len(runs),
+            "segments": run["segments"],
+            "audio_seconds": round(run["audio_seconds"], 1),
+        },
+        "throughput": {
+            "extraction_chars_per_second": rate(corpus_chars, stages["process_documents"]),
+            "tts_chars_per_second": rate(speech.characters // len(runs), stages.get("generate_audio")),
+            "combine_audio_seconds_per_second": rate(run["audio_seconds"], stages.get("combine_audio_files")),
+            "audio_seconds_per_second": rate(run["audio_seconds"], statistics.median(r["total_seconds"] for r in runs)),
+        },
+        "runs": runs,
+    }
+
+
+def compare(result: dict, baseline: dict, max_regression: float) -> bool:
+    """Print stage-by-stage changes against a baseline; return False if any stage regressed too far."""
+    out = sys.stderr
+    print(f"{'stage':<22} {'baseline (s)':>12} {'current (s)':>12} {'change':>8}", file=out)
+    ok = True
+    rows = [(stage, baseline["stages"].get(stage), result["stages"].get(stage)) for stage in result["stages"]]
+    rows.append(("total", baseline.get("total_seconds"), result["total_seconds"]))
+    for name, before, after in rows:
+        if not before or after is None:
+            print(f"{name:<22} {'-':>12} {after if after is not None else '-':>12}", file=out)
+            continue
+        change = (after - before) / before
+        flag = ""
+        if name != "total" and change > max_regression:
+            flag = "  REGRESSION"
+            ok = False
+        print(f"{name:<22} {before:12.3f} {after:12.3f} {change:+8.1%}{flag}", file=out)
+    before_rss = baseline.get("peak_rss_mb", {}).get("self")
+    if before_rss:
+        after_rss = result["peak_rss_mb"]["self"]
+        print(f"{'peak RSS (MB)':<22} {before_rss:12.1f} {after_rss:12.1f} {(after_rss - before_rss) / before_rss:+8.1%}", file=out)
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=10)
+    parser.add_argument("--document-kb", type=int, default=100)
+    parser.add_argument("--formats", default="txt,docx", help="Comma separated document formats to cycle through")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Seconds per stub LLM request")
+    parser.add_argument("--tts-latency", type=float, default=0.0, help="Seconds per stub TTS request")
+    parser.add_argument("--tts-chars-per-second", type=float, default=15.0,
+                        help="Speaking rate of the stub TTS audio")
+    parser.add_argument("--tts-quota", type=int, default=0,
+                        help="Concurrent stub TTS requests allowed before it throttles (0: unlimited)")
+    parser.add_argument("--tts-slow-fraction", type=float, default=0.0,
+                        help="Fraction of stub TTS requests that take --tts-slow-factor times the latency")
+    parser.add_argument("--tts-slow-factor", type=float, default=10.0)
+    parser.add_argument("--sections", type=int, default=4, help="Sections in every stub LLM response")
+    parser.add_argument("--turns-per-section", type=int, default=6)
+    parser.add_argument("--repeat", type=int, default=1, help="Runs to take the median stage times over")
+    parser.add_argument("--ssml-batching", action="store_true")
+    parser.add_argument("--normalize-audio", action="store_true")
+    parser.add_argument("--parallel-encode", action="store_true")
+    parser.add_argument("--encode-workers", type=int, default=None)
+    parser.add_argument("--summary-index", action="store_true")
+    parser.add_argument("--parallel-script", action="store_true")
+    parser.add_argument("--hedge-tts", action="store_true")
+    parser.add_argument("--series", type=int, default=0, metavar="N",
+                        help="Generate a series of up to N concurrent episodes instead of one episode")
+    parser.add_argument("--output", help="Write the JSON result to this file instead of stdout")
+    parser.add_argument("--compare", help="Baseline JSON result to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2,
+                        help="Fail the comparison if a stage is slower than the baseline by more than this fraction")
+    args = parser.parse_args()
+
+    completions = StubCompletions(args.llm_latency, args.sections, args.turns_per_section)
+    ai_helper.client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    speech = StubSpeech(args.tts_latency, args.tts_chars_per_second, args.tts_quota,
+                        args.tts_slow_fraction, args.tts_slow_factor)
+    generate_speech.synthesize_text = speech.synthesize_text
+    generate_speech.synthesize_ssml_with_bookmarks = speech.synthesize_ssml_with_bookmarks
+
+    formats = [f.strip().lower() for f in args.formats.split(",") if f.strip()]
+    with tempfile.TemporaryDirectory() as temp_dir:
+        corpus_dir = Path(temp_dir) / "corpus"
+        corpus_dir.mkdir()
+        corpus_chars = write_corpus(corpus_dir, args.documents, args.document_kb, formats)
+
+        # A fresh output directory per run so extraction and summary caches start cold
+        runs = [run_once(args, corpus_dir, Path(temp_dir) / f"output_{i}") for i in range(args.repeat)]
+
+    result = summarize_runs(runs, corpus_chars, args.documents, speech)
+    result["config"] = {key: value for key, value in vars(args).items()
+                        if key not in ("output", "compare", "max_regression")}
+    result["environment"] = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+    report = json.dumps(result, indent=2)
+    if args.output:
+        Path(args.output).write_text(report + "\n", encoding="utf-8")
+    else:
+        print(report)
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if not compare(result, baseline, args.max_regression):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
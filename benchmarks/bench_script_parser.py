@@ -0,0 +1,115 @@
+"""
+Benchmark the speaker-turn parser against the original line-splitting loop.
+
+Usage:
+    python -m benchmarks.bench_script_parser --lines 100000
+"""
+import argparse
+import random
+import time
+
+from utils.script_parser import DEFAULT_HOSTS, ScriptParser, parse_script
+
+SENTENCES = [
+    "That's a great point, and it ties into what we discussed earlier.",
+    "Let's dig into the numbers for a second.",
+    "Here's a fun fact: it took almost a decade to get right.",
+    "I never thought about it that way!",
+    "So what does this mean for our listeners?",
+]
+
+EXTRA_HOSTS = ("Priya", "Marcus", "Lena", "Tomas", "Aiko", "Rafael")
+
+
+def generate_script(line_count: int, hosts=DEFAULT_HOSTS, continuation: float = 0.1,
+                    bold: bool = True, seed: int = 0) -> str:
+    """Build a synthetic script with headings, notes and continuation lines."""
+    rng = random.Random(seed)
+    lines = []
+    while len(lines) < line_count:
+        roll = rng.random()
+        if roll < 0.02:
+            lines.append(f"## Section {len(lines)}")
+        elif roll < 0.04:
+            lines.append("[Music transition]")
+        elif roll < 0.04 + continuation:
+            lines.append(rng.choice(SENTENCES))
+        else:
+            speaker = rng.choice(hosts)
+            line = f"**{speaker}:** " if bold else f"{speaker}: "
+            lines.append(line + rng.choice(SENTENCES))
+    return "\n".join(lines)
+
+
+def legacy_parse(script: str, hosts=DEFAULT_HOSTS):
+    """The parsing loop previously inlined in text_to_speech, with the roster made configurable."""
+    current_speaker = ""
+    current_text = ""
+    audio_segments = []
+    line_number = 0
+
+    for line in script.split('\n'):
+        line_number += 1
+        line = line.strip()
+        if ':' in line and (line.startswith('**') or any(name in line.split(':')[0] for name in hosts)):
+            if current_speaker and current_text.strip():
+                audio_segments.append((current_speaker, current_text.strip(), line_number - 1))
+            current_speaker = line.split(':')[0].strip('* ')
+            current_text = line.split(':', 1)[1].strip() + " "
+        elif line and not line.startswith('[') and not line.startswith('#'):
+            current_text += line + " "
+
+    if current_speaker and current_text.strip():
+        audio_segments.append((current_speaker, current_text.strip(), line_number))
+    return audio_segments
+
+
+def parse_streamed(script: str, hosts=DEFAULT_HOSTS, chunk_size: int = 64 * 1024):
+    parser = ScriptParser(hosts)
+    turns = []
+    for offset in range(0, len(script), chunk_size):
+        turns.extend(parser.feed(script[offset:offset + chunk_size]))
+    turns.extend(parser.close())
+    return turns
+
+
+def timed(fn, *args, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run_scenario(name: str, script: str, hosts, repeat: int):
+    turns = parse_script(script, hosts)
+    legacy_time = timed(legacy_parse, script, hosts, repeat=repeat)
+    parser_time = timed(parse_script, script, hosts, repeat=repeat)
+    streamed_time = timed(parse_streamed, script, hosts, repeat=repeat)
+
+    print(f"{name}: {script.count(chr(10)) + 1} lines, {len(script)} chars, {len(turns)} turns")
+    print(f"  legacy loop:       {legacy_time * 1000:8.1f} ms")
+    print(f"  parse_script:      {parser_time * 1000:8.1f} ms ({legacy_time / parser_time:.2f}x)")
+    print(f"  streamed (64 KiB): {streamed_time * 1000:8.1f} ms ({legacy_time / streamed_time:.2f}x)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--lines", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    roster = DEFAULT_HOSTS + EXTRA_HOSTS
+    scenarios = [
+        ("two hosts, bold", generate_script(args.lines), DEFAULT_HOSTS),
+        ("two hosts, plain", generate_script(args.lines, bold=False), DEFAULT_HOSTS),
+        ("eight hosts, plain", generate_script(args.lines, hosts=roster, bold=False), roster),
+        ("long turns", generate_script(args.lines, continuation=0.9), DEFAULT_HOSTS),
+    ]
+    for name, script, hosts in scenarios:
+        run_scenario(name, script, hosts, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
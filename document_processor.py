@@ -1,9 +1,17 @@
+import asyncio
+import codecs
+import io
 import os
+import posixpath
+import zipfile
 from pathlib import Path
 from azure.core.credentials import AzureKeyCredential
 from azure.ai.formrecognizer import DocumentAnalysisClient
+from azure.ai.formrecognizer.aio import DocumentAnalysisClient as AsyncDocumentAnalysisClient
 import docx
-from typing import Optional
+from lxml import etree
+from PyPDF2 import PdfReader, PdfWriter
+from typing import Iterable, Iterator, List, Optional, Tuple
 from dotenv import load_dotenv
 
 from logger import CustomLogger
@@ -12,6 +20,37 @@ log = CustomLogger("DocumentProcessor", log_file="document_processor.log")
 
 load_dotenv()
 
+SUPPORTED_FILE_TYPES = ['.pdf', '.doc', '.docx', '.txt']
+
+# Encodings tried in order when decoding text files
+TEXT_ENCODINGS = ['utf-8', 'latin-1', 'cp1252', 'iso-8859-1']
+ENCODING_SAMPLE_SIZE = 64 * 1024  # Bytes inspected to pick an encoding
+READ_CHUNK_SIZE = 64 * 1024
+BLOCK_CHARS = 64 * 1024  # Characters of normalized text per block of normalize_blocks
+
+# Large PDFs are split into page ranges that are analyzed concurrently
+PDF_PAGES_PER_SHARD = 50
+PDF_SHARD_MIN_BYTES = 4 * 1024 * 1024  # Smaller PDFs are uploaded whole without being opened locally
+PDF_MAX_CONCURRENT_SHARDS = 4
+PDF_SHARD_MAX_RETRIES = 3
+PDF_SHARD_RETRY_DELAY = 2.0  # Seconds, doubled after every failed attempt
+
+# WordprocessingML names used by the streaming DOCX extractor
+W_NAMESPACE = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+W_P = f'{{{W_NAMESPACE}}}p'
+W_TBL = f'{{{W_NAMESPACE}}}tbl'
+W_T = f'{{{W_NAMESPACE}}}t'
+MC_FALLBACK = '{http://schemas.openxmlformats.org/markup-compatibility/2006}Fallback'
+# Run content that stands for a character, as python-docx renders it
+W_SPECIAL_CHARACTERS = {
+    f'{{{W_NAMESPACE}}}tab': '\t',
+    f'{{{W_NAMESPACE}}}ptab': '\t',
+    f'{{{W_NAMESPACE}}}br': '\n',
+    f'{{{W_NAMESPACE}}}cr': '\n',
+    f'{{{W_NAMESPACE}}}noBreakHyphen': '-',
+}
+OFFICE_DOCUMENT_RELATIONSHIP = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument'
+
 class UnsupportedFileTypeError(Exception):
     pass
 
@@ -19,67 +58,368 @@ def get_file_type(file_path: str) -> str:
     """Determine file type from extension."""
     return Path(file_path).suffix.lower()
 
+def detect_text_encoding(file_path: str, sample_size: int = ENCODING_SAMPLE_SIZE) -> str:
+    """Pick the first encoding in TEXT_ENCODINGS that decodes a prefix sample of the file."""
+    with open(file_path, 'rb') as file:
+        sample = file.read(sample_size)
+
+    for encoding in TEXT_ENCODINGS:
+        try:
+            # Incremental decode so a multi-byte character cut off at the end of the sample is not an error
+            codecs.getincrementaldecoder(encoding)().decode(sample, final=False)
+            return encoding
+        except UnicodeDecodeError:
+            continue
+    raise ValueError(f"Failed to decode text file with encodings: {', '.join(TEXT_ENCODINGS)}")
+
+def _iter_decoded_chunks(file_path: str, encoding: str) -> Iterator[str]:
+    """Decode a file chunk by chunk, raising UnicodeDecodeError as soon as a chunk does not decode."""
+    decoder = codecs.getincrementaldecoder(encoding)()
+    with open(file_path, 'rb') as file:
+        while True:
+            chunk = file.read(READ_CHUNK_SIZE)
+            yield decoder.decode(chunk, final=not chunk)
+            if not chunk:
+                break
+
+def iter_txt_text(file_path: str) -> Iterator[Optional[str]]:
+    """
+    Decode a text file in chunks with the encoding detected from its prefix.
+
+    The sample can be misleading if invalid bytes only appear later in the file.
+    Decoding then starts over with the next encoding in TEXT_ENCODINGS, and None
+    is yielded first: the text received so far is void. A file is read once
+    unless its sample misleads.
+    """
+    encoding = detect_text_encoding(file_path)
+    for candidate in TEXT_ENCODINGS[TEXT_ENCODINGS.index(encoding):]:
+        if candidate != encoding:
+            log.log_warning(f"{file_path} is not valid {encoding} past the sample, decoding it as {candidate}")
+            yield None
+        try:
+            yield from _iter_decoded_chunks(file_path, candidate)
+            return
+        except UnicodeDecodeError:
+            continue
+    raise ValueError(f"Failed to decode text file with encodings: {', '.join(TEXT_ENCODINGS)}")
+
 def read_txt_file(file_path: str) -> str:
     """Read content from a text file."""
-    try:
-        with open(file_path, 'r', encoding='utf-8') as file:
-            return file.read()
-    except UnicodeDecodeError:
-        # Try different encodings if UTF-8 fails
-        encodings = ['latin-1', 'cp1252', 'iso-8859-1']
-        for encoding in encodings:
-            try:
-                with open(file_path, 'r', encoding=encoding) as file:
-                    return file.read()
-            except UnicodeDecodeError:
-                continue
-        raise UnicodeDecodeError("Failed to decode text file with multiple encodings")
+    chunks = []
+    for chunk in iter_txt_text(file_path):
+        if chunk is None:
+            chunks = []
+        else:
+            chunks.append(chunk)
+    return ''.join(chunks)
 
-def read_docx_file(file_path: str) -> str:
-    """Extract text from a DOCX file."""
+def iter_txt_lines(file_path: str) -> Iterator[Optional[str]]:
+    """
+    Stream the lines of a text file, decoded with the same encoding read_txt_file
+    uses for the whole file. None means decoding started over, as in iter_txt_text.
+    """
+    pending = ''
+    for text in iter_txt_text(file_path):
+        if text is None:
+            pending = ''
+            yield None
+            continue
+        lines = (pending + text).split('\n')
+        pending = lines.pop()
+        yield from lines
+
+    if pending:
+        yield pending
+
+def iter_docx_texts(file_path: str) -> Iterator[str]:
+    """Yield the non-empty paragraph texts and then table cell texts of a DOCX file."""
     doc = docx.Document(file_path)
-    full_text = []
-    
+
     # Extract text from paragraphs
     for paragraph in doc.paragraphs:
         if paragraph.text.strip():
-            full_text.append(paragraph.text)
-    
+            yield paragraph.text
+
     # Extract text from tables
     for table in doc.tables:
         for row in table.rows:
             for cell in row.cells:
                 if cell.text.strip():
-                    full_text.append(cell.text)
-    
-    return '\n'.join(full_text)
+                    yield cell.text
+
+def _docx_main_part(package: zipfile.ZipFile) -> str:
+    """Name of the main document part, as declared by the package relationships."""
+    try:
+        relationships = etree.fromstring(package.read('_rels/.rels'))
+        for relationship in relationships:
+            if relationship.get('Type') == OFFICE_DOCUMENT_RELATIONSHIP:
+                return posixpath.normpath(relationship.get('Target').lstrip('/'))
+    except (KeyError, etree.XMLSyntaxError):
+        pass
+    return 'word/document.xml'
+
+def iter_docx_texts_streaming(file_path: str) -> Iterator[str]:
+    """
+    Yield the non-empty paragraph texts of a DOCX file in document order,
+    including paragraphs inside tables, without building the python-docx object model.
+
+    The main document part is parsed straight out of the zip with iterparse and
+    every paragraph and table is freed once its text has been emitted, so memory
+    stays flat regardless of the document size.
+    """
+    with zipfile.ZipFile(file_path) as package:
+        with package.open(_docx_main_part(package)) as document_xml:
+            for _, element in etree.iterparse(document_xml, events=('end',), tag=(W_P, W_TBL),
+                                              huge_tree=True, resolve_entities=False):
+                if element.tag == W_P:
+                    # Text boxes are stored twice, as the modern shape and as a VML fallback
+                    if not any(ancestor.tag == MC_FALLBACK for ancestor in element.iterancestors()):
+                        parts = []
+                        for node in element.iter():
+                            if node.tag == W_T:
+                                parts.append(node.text or '')
+                            elif node.tag in W_SPECIAL_CHARACTERS:
+                                parts.append(W_SPECIAL_CHARACTERS[node.tag])
+                        text = ''.join(parts)
+                        if text.strip():
+                            yield text
+
+                # Paragraphs nested in this element were emitted already; clearing it also
+                # keeps them out of the text of an enclosing paragraph (text boxes)
+                element.clear(keep_tail=True)
+                while element.getprevious() is not None:
+                    del element.getparent()[0]
+
+def read_docx_file(file_path: str) -> str:
+    """Extract text from a DOCX file."""
+    return '\n'.join(iter_docx_texts(file_path))
+
+def get_azure_credentials(endpoint: Optional[str] = None, key: Optional[str] = None) -> Tuple[str, str]:
+    """Use provided credentials or fall back to environment variables."""
+    endpoint = endpoint or os.getenv("AZURE_DOCUMENT_INTELLIGENCE_ENDPOINT")
+    key = key or os.getenv("AZURE_DOCUMENT_INTELLIGENCE_KEY")
+
+    if not endpoint or not key:
+        raise ValueError("Azure Document Intelligence credentials not configured")
+    return endpoint, key
 
 def read_pdf_with_azure(file_path: str, endpoint: Optional[str] = None, key: Optional[str] = None) -> str:
     """Extract text from PDF using Azure Document Intelligence."""
     try:
-        # Use provided credentials or fall back to environment variables
-        endpoint = endpoint or os.getenv("AZURE_DOCUMENT_INTELLIGENCE_ENDPOINT")
-        key = key or os.getenv("AZURE_DOCUMENT_INTELLIGENCE_KEY")
-        
-        if not endpoint or not key:
-            raise ValueError("Azure Document Intelligence credentials not configured")
+        endpoint, key = get_azure_credentials(endpoint, key)
         
         document_analysis_client = DocumentAnalysisClient(
             endpoint=endpoint, credential=AzureKeyCredential(key)
         )
 
+        # Upload the file as a stream rather than reading it into memory first
         with open(file_path, "rb") as file:
-            document_bytes = file.read()
-
-        poller = document_analysis_client.begin_analyze_document(
-            "prebuilt-read", document_bytes
-        )
-        result = poller.result()
+            poller = document_analysis_client.begin_analyze_document(
+                "prebuilt-read", file
+            )
+            result = poller.result()
         return result.content
     except Exception as e:
         log.log_error(f"Azure PDF processing failed: {str(e)}")
         raise
 
+def plan_page_ranges(page_count: int, pages_per_shard: int = PDF_PAGES_PER_SHARD) -> List[Tuple[int, int]]:
+    """Split a page count into consecutive (first, last) page ranges, 1-based and inclusive."""
+    return [
+        (first, min(first + pages_per_shard - 1, page_count))
+        for first in range(1, page_count + 1, pages_per_shard)
+    ]
+
+def extract_pdf_pages(reader: PdfReader, first: int, last: int) -> bytes:
+    """Write pages first..last (1-based, inclusive) of a PDF into a new in-memory PDF."""
+    writer = PdfWriter()
+    for index in range(first - 1, last):
+        writer.add_page(reader.pages[index])
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+async def _analyze_pdf_range(client: AsyncDocumentAnalysisClient, file_path: str, reader: Optional[PdfReader],
+                             page_range: Tuple[int, int], semaphore: asyncio.Semaphore,
+                             max_retries: int) -> str:
+    """Analyze one page range, retrying only this range on failure."""
+    first, last = page_range
+    async with semaphore:
+        # Shards are only materialized while they hold a slot, bounding memory by the concurrency
+        document = extract_pdf_pages(reader, first, last) if reader is not None else None
+
+        for attempt in range(max_retries + 1):
+            try:
+                if document is None:
+                    with open(file_path, "rb") as file:
+                        poller = await client.begin_analyze_document("prebuilt-read", file)
+                        result = await poller.result()
+                else:
+                    poller = await client.begin_analyze_document("prebuilt-read", document)
+                    result = await poller.result()
+                log.log_debug(f"Analyzed pages {first}-{last} of {file_path}")
+                return result.content or ""
+            except Exception as e:
+                if attempt == max_retries:
+                    log.log_error(f"Pages {first}-{last} of {file_path} failed after {max_retries + 1} attempts: {str(e)}")
+                    raise
+                delay = PDF_SHARD_RETRY_DELAY * (2 ** attempt)
+                log.log_warning(f"Pages {first}-{last} of {file_path} failed ({str(e)}), retrying in {delay:.0f}s")
+                await asyncio.sleep(delay)
+
+def _open_pdf_for_sharding(file, file_path: str) -> Optional[PdfReader]:
+    """
+    Open a PDF with PyPDF2 to split it into pages, or return None to upload it
+    as a single stream when PyPDF2 cannot read it (encrypted or malformed).
+    """
+    try:
+        reader = PdfReader(file)
+        if reader.is_encrypted:
+            raise ValueError("the PDF is encrypted")
+        len(reader.pages)
+        return reader
+    except Exception as e:
+        log.log_warning(f"Cannot split {file_path} into page ranges ({str(e)}), uploading it whole")
+        return None
+
+async def read_pdf_with_azure_sharded(file_path: str, endpoint: Optional[str] = None, key: Optional[str] = None,
+                                      pages_per_shard: int = PDF_PAGES_PER_SHARD,
+                                      max_concurrency: int = PDF_MAX_CONCURRENT_SHARDS,
+                                      max_retries: int = PDF_SHARD_MAX_RETRIES,
+                                      shard_min_bytes: int = PDF_SHARD_MIN_BYTES) -> str:
+    """
+    Extract text from a PDF using Azure Document Intelligence, analyzing page ranges concurrently.
+
+    PDFs of at least shard_min_bytes and longer than pages_per_shard are split
+    into page ranges that are uploaded and analyzed through the async client, at
+    most max_concurrency at a time. Each range is retried on its own, and the
+    results are joined in page order. Other PDFs are streamed to the service whole.
+    """
+    try:
+        endpoint, key = get_azure_credentials(endpoint, key)
+
+        with open(file_path, "rb") as file:
+            reader = None
+            page_ranges = []
+            if os.path.getsize(file_path) >= shard_min_bytes:
+                # Reading from the open file keeps PyPDF2 from loading the whole PDF into memory
+                reader = _open_pdf_for_sharding(file, file_path)
+            if reader is not None:
+                page_ranges = plan_page_ranges(len(reader.pages), pages_per_shard)
+                if len(page_ranges) <= 1:
+                    reader = None
+            log.log_info(f"Analyzing {file_path} in {len(page_ranges) if reader else 1} page range(s)")
+
+            semaphore = asyncio.Semaphore(max_concurrency)
+            async with AsyncDocumentAnalysisClient(endpoint=endpoint, credential=AzureKeyCredential(key)) as client:
+                contents = await asyncio.gather(*[
+                    _analyze_pdf_range(client, file_path, reader, page_range, semaphore, max_retries)
+                    for page_range in (page_ranges if reader else [(1, 1)])
+                ])
+        return "\n".join(contents)
+    except Exception as e:
+        log.log_error(f"Azure PDF processing failed: {str(e)}")
+        raise
+
+def normalize_lines(lines: Iterable[str]) -> Iterator[str]:
+    """Strip whitespace from every line and drop empty lines."""
+    for line in lines:
+        for part in line.splitlines():
+            part = part.strip()
+            if part:
+                yield part
+
+def normalize_blocks(lines: Iterable[Optional[str]], block_chars: int = BLOCK_CHARS) -> Iterator[Optional[str]]:
+    """
+    Normalize lines like normalize_lines and group them into blocks of about
+    block_chars characters, so a document can be written out without holding
+    all of its text. The blocks concatenate to the normalized lines joined by
+    newlines. A None line (decoding started over) is passed on and the blocks
+    start over after it.
+    """
+    block = []
+    size = 0
+    started = False
+    for line in lines:
+        if line is None:
+            block, size, started = [], 0, False
+            yield None
+            continue
+        for part in normalize_lines((line,)):
+            if started:
+                block.append('\n')
+            block.append(part)
+            size += len(part) + 1
+            started = True
+            if size >= block_chars:
+                yield ''.join(block)
+                block, size = [], 0
+    if block:
+        yield ''.join(block)
+
+def join_blocks(blocks: Iterable[Optional[str]]) -> str:
+    """The text of normalize_blocks blocks, without what came before the last None."""
+    parts = []
+    for block in blocks:
+        if block is None:
+            parts = []
+        else:
+            parts.append(block)
+    return ''.join(parts)
+
+def _check_document(file_path: str) -> str:
+    """Validate that a document exists and is supported, returning its file type."""
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"File not found: {file_path}")
+
+    file_type = get_file_type(file_path)
+    if file_type not in SUPPORTED_FILE_TYPES:
+        raise UnsupportedFileTypeError(f"Unsupported file type: {file_type}")
+    if file_type == '.doc':
+        # For now, we'll raise an error for .doc files
+        # You might want to add doc to docx conversion here
+        raise UnsupportedFileTypeError("DOC format is not supported, please convert to DOCX")
+    return file_type
+
+def iter_document_lines(file_path: str) -> Iterator[Optional[str]]:
+    """Yield the raw text lines of a supported document; None as for iter_txt_lines."""
+    file_type = _check_document(file_path)
+
+    if file_type == '.txt':
+        yield from iter_txt_lines(file_path)
+    elif file_type == '.docx':
+        try:
+            lines = iter_docx_texts_streaming(file_path)
+            # Surface a malformed package before anything is yielded so the fallback starts clean
+            first = next(lines, None)
+        except (zipfile.BadZipFile, KeyError, etree.XMLSyntaxError) as e:
+            log.log_warning(f"Streaming DOCX extraction failed for {file_path}, using python-docx: {str(e)}")
+            yield from iter_docx_texts(file_path)
+        else:
+            if first is not None:
+                yield first
+                yield from lines
+    elif file_type == '.pdf':
+        yield from read_pdf_with_azure(file_path).splitlines()
+
+async def analyze_document_blocks(file_path: str) -> Iterator[Optional[str]]:
+    """
+    Extract a document as normalize_blocks blocks. PDFs are analyzed before this
+    returns; the other formats are read as the blocks are consumed.
+
+    Args:
+        file_path: Path to the local file
+    """
+    file_path = str(Path(file_path))  # Normalize path
+    file_type = _check_document(file_path)
+
+    log.log_info(f"Processing {file_type} file: {file_path}")
+
+    if file_type == '.pdf':
+        log.log_info("Processing PDF file using Azure Document Intelligence")
+        return normalize_blocks((await read_pdf_with_azure_sharded(file_path)).splitlines())
+    return normalize_blocks(iter_document_lines(file_path))
+
 async def analyze_document(file_path: str) -> str:
     """
     Analyze document from various file formats.
@@ -91,42 +431,13 @@ async def analyze_document(file_path: str) -> str:
         Extracted text content from the document
     """
     try:
-        # Verify file exists
-        if not os.path.exists(file_path):
-            raise FileNotFoundError(f"File not found: {file_path}")
-
-        file_path = str(Path(file_path))  # Normalize path
-        file_type = get_file_type(file_path)
-        
-        if file_type not in ['.pdf', '.doc', '.docx', '.txt']:
-            raise UnsupportedFileTypeError(f"Unsupported file type: {file_type}")
-
-        log.log_info(f"Processing {file_type} file: {file_path}")
-
-        # Process based on file type
-        if file_type == '.txt':
-            log.log_info("Processing TXT file")
-            full_text = read_txt_file(file_path)
-            
-        elif file_type in ['.doc', '.docx']:
-            log.log_info("Processing DOC/DOCX file")
-            if file_type == '.doc':
-                # For now, we'll raise an error for .doc files
-                # You might want to add doc to docx conversion here
-                raise UnsupportedFileTypeError("DOC format is not supported, please convert to DOCX")
-            full_text = read_docx_file(file_path)
-            
-        elif file_type == '.pdf':
-            log.log_info("Processing PDF file using Azure Document Intelligence")
-            full_text = read_pdf_with_azure(file_path)
+        full_text = join_blocks(await analyze_document_blocks(file_path))
 
         # Post-processing
         if not full_text:
             raise ValueError("No text content extracted from document")
 
-        # Remove excessive whitespace and normalize line endings
-        full_text = '\n'.join(line.strip() for line in full_text.splitlines() if line.strip())
-        log.log_info(f"Successfully extracted {len(full_text)} characters from {file_type} file")
+        log.log_info(f"Successfully extracted {len(full_text)} characters from {file_path}")
         
         return full_text
 
@@ -143,8 +454,7 @@ def validate_file_type(file_path: str) -> bool:
     Validate if the file type is supported.
     Returns True if supported, False otherwise.
     """
-    allowed_extensions = {'.pdf', '.doc', '.docx', '.txt'}
-    return get_file_type(file_path) in allowed_extensions
+    return get_file_type(file_path) in SUPPORTED_FILE_TYPES
 
 async def get_document_metadata(file_path: str) -> dict:
     """
@@ -1,13 +1,18 @@
 
-from typing import Annotated
-
+from typing import Annotated, Dict, List, Optional, Tuple
+import gzip
+import re
+from pathlib import Path
+from urllib.parse import urlsplit
 
 from logger import CustomLogger
 import aiohttp
 from bs4 import BeautifulSoup
+from bs4.dammit import EncodingDetector
 import asyncio
 from cachetools import TTLCache
 import aiodns
+from lxml import etree
 import time
 
 logger = CustomLogger(name="MyPodify_Helpers", log_file="mypodify_helpers.log")
@@ -18,11 +23,40 @@ content_cache = TTLCache(maxsize=1000, ttl=3600)
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
 ALLOWED_EXTENSIONS = {'pdf'}
 
+# Web sources listed in the input directory
+URL_LIST_SUFFIXES = {'.url', '.txt'}
+SITEMAP_SUFFIXES = {'.xml'}
+URL_PATTERN = re.compile(r'^https?://\S+$', re.IGNORECASE)
+URL_LIST_SAMPLE_SIZE = 64 * 1024  # Bytes of a .txt file inspected to tell link lists from documents
+MAX_SITEMAP_URLS = 500  # Pages taken from one sitemap source, child sitemaps included
+MAX_CONCURRENT_FETCHES = 16
+MAX_FETCHES_PER_HOST = 4
+FETCH_TIMEOUT = 20  # Seconds per page
+FETCH_CHUNK_SIZE = 64 * 1024  # Bytes read at a time, so oversized bodies are abandoned early
+WEB_PAGE_MAX_AGE = 24 * 3600  # Seconds a fetched page is reused from the extraction cache
+USER_AGENT = "MyPodify/1.0 (+https://github.com/shagunmistry/MyPodifyAPI_OpenSource)"
+
 # Rate limiting parameters
 rate_limit = 10  # requests per second
 last_request_time = time.time()
 request_count = 0
 
+def html_to_text(html_content: str) -> str:
+    """Visible text of an HTML page, one phrase per line."""
+    soup = BeautifulSoup(html_content, 'html.parser')
+
+    # Remove script and style elements
+    for script in soup(["script", "style"]):
+        script.decompose()
+
+    # Get text content
+    text = soup.get_text()
+
+    # Clean up text
+    lines = (line.strip() for line in text.splitlines())
+    chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
+    return '\n'.join(chunk for chunk in chunks if chunk)
+
 async def get_website_content(website_link: str, timeout: int = 10) -> str | None:
     global last_request_time, request_count
 
@@ -46,19 +80,7 @@ async def get_website_content(website_link: str, timeout: int = 10) -> str | Non
             async with session.get(website_link, timeout=timeout, allow_redirects=True) as response:
                 if response.status == 200:
                     html_content = await response.text()
-                    soup = BeautifulSoup(html_content, 'html.parser')
-                    
-                    # Remove script and style elements
-                    for script in soup(["script", "style"]):
-                        script.decompose()
-                    
-                    # Get text content
-                    text = soup.get_text()
-                    
-                    # Clean up text
-                    lines = (line.strip() for line in text.splitlines())
-                    chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-                    text = '\n'.join(chunk for chunk in chunks if chunk)
+                    text = html_to_text(html_content)
                     
                     # Cache the result
                     content_cache[website_link] = text
@@ -74,4 +96,176 @@ async def get_website_content(website_link: str, timeout: int = 10) -> str | Non
         return None
     except Exception as e:
         logger.log_error(f"Unknown error fetching website content: {str(e)}")
-        return None
\ No newline at end of file
+        return None
+
+
+def read_url_list(file_path: Path) -> Optional[List[str]]:
+    """
+    URLs listed in a .url shortcut or a .txt link list, or None if the file is not one.
+
+    A .txt file counts as a link list when every non-empty line that is not a
+    # comment is an http(s) URL.
+    """
+    file_path = Path(file_path)
+    if file_path.suffix.lower() not in URL_LIST_SUFFIXES:
+        return None
+    with open(file_path, 'rb') as f:
+        sample = f.read(URL_LIST_SAMPLE_SIZE + 1)
+    if len(sample) > URL_LIST_SAMPLE_SIZE and file_path.suffix.lower() == '.txt':
+        return None  # Too long to be a link list, treat it as a document
+    lines = [line.strip() for line in sample.decode('utf-8', errors='replace').splitlines()]
+
+    if file_path.suffix.lower() == '.url':
+        # Internet shortcut ([InternetShortcut] / URL=...) or plain URLs
+        urls = [line[4:].strip() if line.upper().startswith('URL=') else line for line in lines]
+        return [url for url in urls if URL_PATTERN.match(url)]
+
+    entries = [line for line in lines if line and not line.startswith('#')]
+    if entries and all(URL_PATTERN.match(entry) for entry in entries):
+        return entries
+    return None
+
+def parse_sitemap(data: bytes) -> Tuple[List[str], List[str]]:
+    """
+    Page URLs and child sitemap URLs of a (possibly gzipped) sitemap or sitemap index.
+
+    Raises:
+        ValueError: If the data is not a sitemap
+    """
+    if data[:2] == b'\x1f\x8b':
+        data = gzip.decompress(data)
+    try:
+        root = etree.fromstring(data, parser=etree.XMLParser(resolve_entities=False, no_network=True))
+    except etree.XMLSyntaxError as e:
+        raise ValueError(f"Not a sitemap: {str(e)}")
+
+    kind = etree.QName(root).localname
+    if kind not in ('urlset', 'sitemapindex'):
+        raise ValueError(f"Not a sitemap: root element is <{kind}>")
+    locations = [element.text.strip() for element in root.iter('{*}loc') if element.text and element.text.strip()]
+    return (locations, []) if kind == 'urlset' else ([], locations)
+
+def is_sitemap_file(file_path: Path) -> bool:
+    file_path = Path(file_path)
+    if file_path.suffix.lower() not in SITEMAP_SUFFIXES:
+        return False
+    with open(file_path, 'rb') as f:
+        head = f.read(4096)
+    return b'<urlset' in head or b'<sitemapindex' in head
+
+def is_web_source(file_path: Path) -> bool:
+    """Whether an input file lists web pages (link list or sitemap) rather than being a document."""
+    return is_sitemap_file(file_path) or read_url_list(file_path) is not None
+
+def is_sitemap_url(url: str) -> bool:
+    path = urlsplit(url).path.lower()
+    return path.endswith('.xml') or path.endswith('.xml.gz')
+
+def web_session(max_concurrent: int = MAX_CONCURRENT_FETCHES,
+                max_per_host: int = MAX_FETCHES_PER_HOST) -> aiohttp.ClientSession:
+    """Client session whose connection pool bounds total and per-host concurrency."""
+    return aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=max_concurrent, limit_per_host=max_per_host),
+        headers={"User-Agent": USER_AGENT},
+    )
+
+async def fetch_bytes(session: aiohttp.ClientSession, url: str,
+                      timeout: float = FETCH_TIMEOUT) -> Tuple[Optional[bytes], str, Optional[str]]:
+    """Body, content type and declared charset of a URL, or (None, '', None) on any failure."""
+    try:
+        async with session.get(url, timeout=aiohttp.ClientTimeout(total=timeout), allow_redirects=True) as response:
+            if response.status != 200:
+                logger.log_warning(f"Fetching {url} failed with status {response.status}")
+                return None, '', None
+            if response.content_length and response.content_length > MAX_FILE_SIZE:
+                logger.log_warning(f"Skipping {url}: {response.content_length} bytes is over the size limit")
+                return None, '', None
+            # Content-Length may be missing (chunked responses) or wrong, so count what arrives
+            body = bytearray()
+            async for chunk in response.content.iter_chunked(FETCH_CHUNK_SIZE):
+                body.extend(chunk)
+                if len(body) > MAX_FILE_SIZE:
+                    logger.log_warning(f"Skipping {url}: body is over the size limit of {MAX_FILE_SIZE} bytes")
+                    return None, '', None
+            return bytes(body), response.content_type or '', response.charset
+    except asyncio.TimeoutError:
+        logger.log_error(f"Timeout fetching {url}")
+    except aiohttp.ClientError as e:
+        logger.log_error(f"Error fetching {url}: {str(e)}")
+    return None, '', None
+
+def decode_page(body: bytes, content_type: str, charset: Optional[str]) -> str:
+    """
+    Decode a page with the charset of its Content-Type header or, for HTML
+    without one, of its <meta> tag, falling back to utf-8.
+    """
+    if not charset and content_type in ('text/html', 'application/xhtml+xml'):
+        charset = EncodingDetector.find_declared_encoding(body, is_html=True)
+    if charset:
+        try:
+            return body.decode(charset, errors='replace')
+        except LookupError:
+            logger.log_warning(f"Unknown charset {charset}, decoding as utf-8")
+    return body.decode('utf-8', errors='replace')
+
+async def fetch_page_text(session: aiohttp.ClientSession, url: str, timeout: float = FETCH_TIMEOUT) -> Optional[str]:
+    """Readable text of an HTML or plain text page, or None if it cannot be fetched or used."""
+    body, content_type, charset = await fetch_bytes(session, url, timeout)
+    if body is None:
+        return None
+    text = decode_page(body, content_type, charset)
+    if content_type in ('text/html', 'application/xhtml+xml'):
+        text = html_to_text(text)
+    elif not content_type.startswith('text/'):
+        logger.log_warning(f"Skipping {url}: unsupported content type {content_type}")
+        return None
+    return text if text.strip() else None
+
+async def expand_sitemaps(session: aiohttp.ClientSession, page_urls: List[str], sitemap_urls: List[str],
+                          max_urls: int = MAX_SITEMAP_URLS) -> List[str]:
+    """Follow child sitemaps level by level, collecting up to max_urls page URLs in sitemap order."""
+    pages = list(page_urls[:max_urls])
+    seen = set(sitemap_urls)
+    pending = list(sitemap_urls)
+    while pending and len(pages) < max_urls:
+        responses = await asyncio.gather(*[fetch_bytes(session, url) for url in pending])
+        pending = []
+        for body, _, _ in responses:
+            if body is None:
+                continue
+            try:
+                child_pages, child_sitemaps = parse_sitemap(body)
+            except ValueError as e:
+                logger.log_warning(str(e))
+                continue
+            pages.extend(child_pages[:max_urls - len(pages)])
+            for child in child_sitemaps:
+                if child not in seen:
+                    seen.add(child)
+                    pending.append(child)
+    return pages
+
+async def collect_source_urls(file_path: Path, session: aiohttp.ClientSession) -> Optional[List[str]]:
+    """
+    Page URLs of a link list or sitemap file in the input directory, with
+    sitemaps expanded in place, or None if the file is an ordinary document.
+    """
+    file_path = Path(file_path)
+    if is_sitemap_file(file_path):
+        with open(file_path, 'rb') as f:
+            page_urls, sitemap_urls = parse_sitemap(f.read())
+        return await expand_sitemaps(session, page_urls, sitemap_urls)
+
+    urls = read_url_list(file_path)
+    if urls is None:
+        return None
+
+    async def expand(url: str) -> List[str]:
+        return await expand_sitemaps(session, [], [url]) if is_sitemap_url(url) else [url]
+
+    return [page for pages in await asyncio.gather(*[expand(url) for url in urls]) for page in pages]
+
+async def fetch_page_texts(session: aiohttp.ClientSession, urls: List[str]) -> Dict[str, Optional[str]]:
+    """Fetch many pages concurrently, bounded by the session's connection limits."""
+    texts = await asyncio.gather(*[fetch_page_text(session, url) for url in urls])
+    return dict(zip(urls, texts))
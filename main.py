@@ -1,33 +1,105 @@
 import os
 import argparse
 import json
+import math
+import time
+from contextlib import contextmanager, nullcontext
 from pathlib import Path
 import asyncio
 from datetime import datetime
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple
+from urllib.parse import urlsplit
 
-from document_processor import analyze_document, UnsupportedFileTypeError
+from document_processor import analyze_document_blocks, normalize_lines, validate_file_type, UnsupportedFileTypeError
+from helpers import (collect_source_urls, fetch_page_texts, is_web_source, web_session,
+                     WEB_PAGE_MAX_AGE)
 from logger import CustomLogger
-from ai_helper.generate_outline import generate_podcast_outline
-from ai_helper.script_generator import generate_podcast_script
-from ai_helper.generate_speech import text_to_speech
+from ai_helper.generate_outline import generate_podcast_outline, PODCAST_OUTLINE_SYSTEM_INSTRUCTIONS
+from ai_helper.script_generator import (generate_podcast_script, generate_podcast_script_by_section,
+                                        get_script_system_instructions, format_turns, seam_sizes,
+                                        section_requests, split_outline_sections, MAX_CONCURRENT_SECTIONS, SECTION_CONTEXT_CHARS,
+                                        SEAM_TURNS, SECTION_SCRIPT_INSTRUCTIONS, TRANSITION_SYSTEM_INSTRUCTIONS)
+from ai_helper.generate_speech import (text_to_speech, speech_segments, batch_segments, synthesize_segments,
+                                       SSML_BATCH_MAX_CHARS, tts_hedger, tts_limiter)
+from ai_helper.summary_index import SummaryIndex, DOCUMENT_SUMMARY_SYSTEM_INSTRUCTIONS
+from ai_helper.ai_helper import (cached_responses, llm_cache, llm_limiter, max_chunk_tokens, new_llm_usage,
+                                  num_tokens_from_string, track_llm_usage)
 from utils.combine_audio import combine_audio_files
+from utils.duration_budget import DurationModel, budget_script, measure_speech
+from utils.audio_processing import process_audio_segments, DEFAULT_PAUSE_MS
+from utils.artifact_store import ArtifactStore, REF_SUFFIX
+from utils.episode_index import (build_indexed_episode, diff_segments, export_episode, load_index, segment_file,
+                                 rerender_episode, INDEX_NAME)
+from utils.extraction_cache import ExtractionCache
+from utils.multi_export import parse_export_spec
+from utils.planner import RunHistory, chunks_for_tokens, estimate_run, CHARS_PER_TOKEN
+from utils.script_parser import host_roster, parse_script
+from utils.series_planner import plan_series
+from utils.stage_profiler import StageProfiler
+from utils.work_queue import DONE, WorkQueue
+from worker import EXTRACT, SYNTHESIZE, ENCODE, drain, run_worker, start_local_workers, stop_local_workers
 
 # Set up logging
 log = CustomLogger("PodcastGenerator", log_file="podcast_generator.log")
 
 class PodcastGenerator:
     def __init__(self, input_dir: str, output_dir: str, project_name: str, 
-                 host_count: int = 2, description: str = ""):
+                 host_count: int = 2, description: str = "", ssml_batching: bool = False,
+                 normalize_audio: bool = False, pause_ms: int = DEFAULT_PAUSE_MS,
+                 parallel_encode: bool = False, encode_workers: Optional[int] = None,
+                 use_summary_index: bool = False, parallel_script: bool = False,
+                 profile: bool = False, work_queue: Optional[str] = None, queue_workers: int = 0,
+                 use_artifact_store: bool = False, hedge_tts: bool = False,
+                 exports: Optional[List[str]] = None, segment_index: bool = False,
+                 source_files: Optional[List[str]] = None, target_minutes: Optional[float] = None):
         self.input_dir = Path(input_dir)
+        # Only these files of the input directory are used, e.g. one episode's share of a series
+        self.source_files = [Path(f) for f in source_files] if source_files is not None else None
+        # Input file of every document of the last process_documents(), web pages under their list file
+        self.document_files: List[Path] = []
         self.output_dir = Path(output_dir)
         self.project_name = project_name
         self.host_count = host_count
+        # Speaker names the script is parsed with, each voiced by its own HOST_VOICES voice
+        self.hosts = host_roster(host_count)
         self.description = description
+        self.ssml_batching = ssml_batching
+        self.normalize_audio = normalize_audio
+        self.pause_ms = pause_ms
+        self.parallel_encode = parallel_encode
+        self.encode_workers = encode_workers
+        self.parallel_script = parallel_script
+        self.hedge_tts = hedge_tts
+        # Trim the script to this length before synthesis; the predicted length is always reported
+        self.target_minutes = target_minutes
+        self.duration_report: Optional[Dict] = None
+        # Encode turns separately and index their offsets so rerender() can splice in edits
+        self.segment_index = segment_index
+        # Further formats of the episode, e.g. ["mp3:64k", "opus", "peaks"]; parsed now to fail before any work
+        self.exports = list(exports or [])
+        for spec in self.exports:
+            parse_export_spec(spec, "podcast_combined.mp3")
+        # Summaries are shared by every project under the same output directory
+        self.summary_index = SummaryIndex(self.output_dir / "summary_index") if use_summary_index else None
+        self.summary_tasks: List[asyncio.Task] = []
+        self.extraction_cache = ExtractionCache(self.output_dir / "extraction_cache")
+        self.run_history = RunHistory(self.output_dir / "run_history.jsonl")
+        # Blobs are shared by every project under the same output directory
+        self.artifacts = ArtifactStore(self.output_dir / "artifacts") if use_artifact_store else None
+        self.stage_timings: Dict[str, float] = {}
+        self.stage_llm_requests: Dict[str, int] = {}
+        # Completions sent by this generator alone, while other episodes of a series run alongside it
+        self.llm_usage = new_llm_usage()
+        self.summary_lengths: List[int] = []
         self.project_dir = self.output_dir / self.sanitize_filename(project_name)
         
         # Create output directories
         self.project_dir.mkdir(parents=True, exist_ok=True)
+        self.profiler = StageProfiler(self.project_dir / "profile") if profile else None
+        # Extraction, synthesis and encoding become queue tasks that other worker processes can share
+        self.work_queue = WorkQueue(work_queue) if work_queue else None
+        self.queue_workers = queue_workers
+        self.local_workers = []
         (self.project_dir / "documents").mkdir(exist_ok=True)
         (self.project_dir / "outlines").mkdir(exist_ok=True)
         (self.project_dir / "scripts").mkdir(exist_ok=True)
@@ -38,29 +110,168 @@ class PodcastGenerator:
         """Convert string to valid filename."""
         return "".join(c for c in filename if c.isalnum() or c in (' ', '-', '_')).strip()
 
-    async def process_documents(self) -> List[str]:
-        """Process all documents in the input directory."""
+    @contextmanager
+    def _stage(self, name: str):
+        """Record wall time and LLM requests of a pipeline stage, profiling it when enabled."""
+        requests_before = self.llm_usage["requests"]
+        start = time.perf_counter()
+        try:
+            with self.profiler.profile(name) if self.profiler else nullcontext():
+                yield
+        finally:
+            self.stage_timings[name] = round(time.perf_counter() - start, 3)
+            self.stage_llm_requests[name] = self.llm_usage["requests"] - requests_before
+
+    def save_artifact(self, path: Path, content: str) -> Path:
+        """Write a text artifact, or a ref to it in the artifact store when enabled."""
+        if self.artifacts:
+            return self.artifacts.save_text(path, content)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        return path
+
+    async def extract_document(self, file_path: Path) -> str:
+        """Extract a document's text, reusing a previous extraction of identical content."""
+        cache_key = self.extraction_cache.key_for_file(file_path)
+        content = self.extraction_cache.get(cache_key)
+        if content is not None:
+            log.log_info(f"Using cached extraction for: {file_path}")
+            return content
+
+        log.log_info(f"Processing document: {file_path}")
+        # The normalized text is written to the cache as it is extracted and only held whole once read back
+        blocks = await analyze_document_blocks(str(file_path))
+        if not await asyncio.to_thread(self.extraction_cache.put_blocks, cache_key, blocks):
+            raise ValueError(f"No text content extracted from {file_path}")
+        return self.extraction_cache.get(cache_key)
+
+    async def run_queued_tasks(self, kind: str, payloads: List[Dict]) -> List[Dict]:
+        """
+        Enqueue tasks for this project and work on them, together with any other
+        workers on the queue, until all of them are done or failed.
+
+        Returns:
+            State, result and error of every task, in payload order
+        """
+        project = str(self.project_dir.resolve())
+        task_ids = [self.work_queue.enqueue(project, kind, payload) for payload in payloads]
+        if self.queue_workers and not self.local_workers:
+            self.local_workers = start_local_workers(self.work_queue, self.queue_workers, project=project)
+
+        log.log_info(f"Queued {len(task_ids)} {kind} tasks")
+        states = await asyncio.to_thread(drain, self.work_queue, task_ids, project)
+        failed = [task_id for task_id in task_ids if states[task_id]["state"] != DONE]
+        for task_id in failed:
+            log.log_error(f"{kind} task {task_id} failed: {states[task_id]['error']}")
+        return [states[task_id] for task_id in task_ids]
+
+    async def fetch_web_sources(self, source_paths: List[Path]) -> Tuple[Dict[Path, List[str]], Dict[str, str]]:
+        """
+        Expand link lists and sitemaps into page URLs and fetch the pages concurrently,
+        reusing pages fetched recently from the extraction cache.
+
+        Returns:
+            The page URLs of every source (each URL only under its first source) and
+            the normalized text of every page that could be fetched
+        """
+        source_urls = {}
+        pages = {}
+        async with web_session() as session:
+            expanded = await asyncio.gather(*[collect_source_urls(path, session) for path in source_paths],
+                                            return_exceptions=True)
+            seen = set()
+            for path, urls in zip(source_paths, expanded):
+                if isinstance(urls, Exception):
+                    log.log_error(f"Error reading web source {path}: {str(urls)}")
+                    continue
+                source_urls[path] = [url for url in urls if not (url in seen or seen.add(url))]
+
+            missing = []
+            for url in seen:
+                content = self.extraction_cache.get(ExtractionCache.key_for_url(url), max_age=WEB_PAGE_MAX_AGE)
+                if content is None:
+                    missing.append(url)
+                else:
+                    pages[url] = content
+
+            log.log_info(f"Fetching {len(missing)} web pages ({len(seen) - len(missing)} cached)")
+            for url, text in (await fetch_page_texts(session, missing)).items():
+                content = '\n'.join(normalize_lines(text.splitlines())) if text else ''
+                if not content:
+                    log.log_error(f"Skipping web page without usable text: {url}")
+                    continue
+                self.extraction_cache.put(ExtractionCache.key_for_url(url), content)
+                pages[url] = content
+
+        return source_urls, pages
+
+    async def _add_document(self, document_contents: List[str], content: str, source: str,
+                            output_path: Path, summarize: bool) -> None:
+        document_contents.append(content)
+
+        if self.summary_index and summarize:
+            # Summarize in the background while the remaining documents are extracted
+            self.summary_tasks.append(asyncio.create_task(
+                self.summary_index.summarize(content, source=source)))
+            await asyncio.sleep(0)
+
+        # Save processed content
+        self.save_artifact(output_path, content)
+
+    async def process_documents(self, summarize: bool = True) -> List[str]:
+        """
+        Process all documents in the input directory.
+
+        Args:
+            summarize: Start background summaries when the summary index is enabled
+        """
         document_contents = []
+        self.document_files = []
         
         if not self.input_dir.exists():
             raise FileNotFoundError(f"Input directory not found: {self.input_dir}")
 
-        for file_path in self.input_dir.rglob('*'):
-            if file_path.is_file():
-                try:
-                    log.log_info(f"Processing document: {file_path}")
-                    content = await analyze_document(str(file_path))
-                    document_contents.append(content)
-                    
-                    # Save processed content
-                    output_path = self.project_dir / "documents" / f"{file_path.stem}_processed.txt"
-                    with open(output_path, 'w', encoding='utf-8') as f:
-                        f.write(content)
-                    
-                except UnsupportedFileTypeError as e:
-                    log.log_error(f"Skipping unsupported file {file_path}: {str(e)}")
-                except Exception as e:
-                    log.log_error(f"Error processing file {file_path}: {str(e)}")
+        if self.source_files is not None:
+            file_paths = [file_path for file_path in self.source_files if file_path.is_file()]
+        else:
+            file_paths = [file_path for file_path in sorted(self.input_dir.rglob('*')) if file_path.is_file()]
+
+        # Link lists (.url, .txt of URLs) and sitemaps stand for the web pages they list
+        source_urls, pages = {}, {}
+        web_source_paths = [file_path for file_path in file_paths if is_web_source(file_path)]
+        if web_source_paths:
+            source_urls, pages = await self.fetch_web_sources(web_source_paths)
+
+        if self.work_queue:
+            # Extract into the shared extraction cache, which the loop below then reads from
+            await self.run_queued_tasks(EXTRACT, [
+                {"file_path": str(file_path.resolve()), "cache_dir": str(self.extraction_cache.cache_dir.resolve())}
+                for file_path in file_paths
+                if file_path not in web_source_paths and validate_file_type(str(file_path))
+            ])
+
+        for file_path in file_paths:
+            if file_path in web_source_paths:
+                # Pages take the place of their list file, in the order they were listed
+                for url in source_urls.get(file_path, []):
+                    if url in pages:
+                        host = self.sanitize_filename(urlsplit(url).hostname or "web")
+                        url_hash = ExtractionCache.key_for_url(url)[:8]
+                        output_path = self.project_dir / "documents" / f"web_{host}_{url_hash}_processed.txt"
+                        await self._add_document(document_contents, pages[url], url, output_path, summarize)
+                        self.document_files.append(file_path)
+                continue
+
+            try:
+                content = await self.extract_document(file_path)
+                output_path = self.project_dir / "documents" / f"{file_path.stem}_processed.txt"
+                await self._add_document(document_contents, content, str(file_path), output_path, summarize)
+                self.document_files.append(file_path)
+                
+            except UnsupportedFileTypeError as e:
+                log.log_error(f"Skipping unsupported file {file_path}: {str(e)}")
+            except Exception as e:
+                log.log_error(f"Error processing file {file_path}: {str(e)}")
 
         return document_contents
 
@@ -69,6 +280,13 @@ class PodcastGenerator:
         log.log_info("Generating podcast outline")
 
         log.log_debug(document_contents[0][:100])
+
+        if self.summary_tasks:
+            # Start from the per-document summaries instead of the raw text
+            document_contents = await asyncio.gather(*self.summary_tasks)
+            self.summary_tasks = []
+            self.summary_lengths = [len(summary) for summary in document_contents]
+            log.log_info(f"Generating outline from {len(document_contents)} document summaries")
         
         # Combine all document contents with description
         combined_content = "\n\n".join([self.description] + document_contents)
@@ -79,8 +297,7 @@ class PodcastGenerator:
         # Save outline
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         outline_path = self.project_dir / "outlines" / f"outline_{timestamp}.md"
-        with open(outline_path, 'w', encoding='utf-8') as f:
-            f.write(outline)
+        self.save_artifact(outline_path, outline)
             
         return outline
 
@@ -92,13 +309,15 @@ class PodcastGenerator:
         combined_content = "\n\n".join(document_contents)
         
         # Generate script
-        script = await generate_podcast_script(outline, combined_content, self.host_count)
+        if self.parallel_script:
+            script = await generate_podcast_script_by_section(outline, combined_content, self.host_count)
+        else:
+            script = await generate_podcast_script(outline, combined_content, self.host_count)
         
         # Save script
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         script_path = self.project_dir / "scripts" / f"script_{timestamp}.md"
-        with open(script_path, 'w', encoding='utf-8') as f:
-            f.write(script)
+        self.save_artifact(script_path, script)
             
         return script
     
@@ -119,42 +338,494 @@ class PodcastGenerator:
         
         # Create the full audio file path
         audio_path = audio_dir / f"podcast_{timestamp}.mp3"
-        
-        await text_to_speech(script, str(audio_path))
+
+        # Segments of an earlier run of the project must not end up in this episode
+        for stale in list(audio_dir.glob("segment_*.wav")) + list(audio_dir.glob(f"segment_*.wav{REF_SUFFIX}")):
+            stale.unlink()
+
+        if self.work_queue:
+            await self.synthesize_queued(speech_segments(script, self.hosts), audio_dir)
+        else:
+            await text_to_speech(script, str(audio_path), ssml_batching=self.ssml_batching, hosts=self.hosts,
+                                 hedge=self.hedge_tts)
         
         return str(audio_path)
 
+    async def synthesize_queued(self, segments: List[Tuple[int, str, str]], output_dir: Path) -> None:
+        """
+        Synthesize (index, voice, text) segments into output_dir as work queue tasks.
+
+        Raises:
+            RuntimeError: If any task failed, like synthesize_segments does for missing audio
+        """
+        groups = batch_segments(segments) if self.ssml_batching else [[segment] for segment in segments]
+        states = await self.run_queued_tasks(SYNTHESIZE, [
+            {"segments": group, "output_dir": str(output_dir.resolve()), "ssml_batching": self.ssml_batching,
+             "hedge": self.hedge_tts}
+            for group in groups
+        ])
+        failed = [state for state in states if state["state"] != DONE]
+        if failed:
+            raise RuntimeError(f"{len(failed)} of {len(states)} synthesize tasks failed")
+
+    async def rerender(self, script_path: str) -> Dict:
+        """
+        Re-render the episode for an edited script: only turns that are new or
+        changed against the indexed episode are synthesized, everything else is
+        copied byte for byte from the current MP3.
+        """
+        audio_dir = self.project_dir / "audio"
+        index = load_index(audio_dir)
+        with open(script_path, 'r', encoding='utf-8') as f:
+            script = f.read()
+
+        segments = speech_segments(script, self.hosts)
+        reused, removed = diff_segments(index, segments)
+        changed = [segment for segment, entry in zip(segments, reused) if entry is None]
+        log.log_info(f"Re-rendering {len(segments)} turns: {len(changed)} new or changed, {len(removed)} removed")
+
+        staging_dir = audio_dir / "rerender_staging"
+        staging_dir.mkdir(exist_ok=True)
+        if any(staging_dir.iterdir()):
+            raise RuntimeError(f"{staging_dir} still holds segment audio of a failed re-render, "
+                               f"restore or delete it first")
+        try:
+            with self._stage("generate_audio"):
+                if changed and self.work_queue:
+                    await self.synthesize_queued(changed, staging_dir)
+                elif changed:
+                    await synthesize_segments(changed, staging_dir, ssml_batching=self.ssml_batching,
+                                              hedge=self.hedge_tts)
+            with self._stage("combine_audio_files"):
+                index = rerender_episode(index, segments, reused, removed, audio_dir, staging_dir,
+                                         workers=self.encode_workers)
+        finally:
+            # Only newly synthesized turns are dropped; reused audio is moved back by rerender_episode
+            # and anything still parked here after a failure is kept for recovery
+            for i, _, _ in changed:
+                segment_file(staging_dir, i).unlink(missing_ok=True)
+            if any(staging_dir.iterdir()):
+                log.log_warning(f"Kept the segment audio left in {staging_dir} after a failed re-render")
+            else:
+                staging_dir.rmdir()
+
+        audio_combined_path = audio_dir / index["episode"]
+        if self.exports:
+            with self._stage("export_audio"):
+                export_episode(audio_combined_path, index,
+                               [parse_export_spec(spec, audio_combined_path) for spec in self.exports])
+
+        # Reused turns are already archived, only the newly synthesized ones are still plain WAVs
+        new_wavs = [audio_dir / entry["wav"] for entry in index["segments"] if (audio_dir / entry["wav"]).exists()]
+        if self.artifacts and new_wavs:
+            with self._stage("archive_artifacts"):
+                self.artifacts.archive_wavs(new_wavs)
+
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.save_artifact(self.project_dir / "scripts" / f"script_{timestamp}.md", script)
+
+        metadata_path = self.project_dir / "metadata.json"
+        metadata = {}
+        if metadata_path.exists():
+            with open(metadata_path, 'r') as f:
+                metadata = json.load(f)
+        metadata.update({
+            "project_name": self.project_name,
+            "timestamp": datetime.now().isoformat(),
+            "output_directory": str(self.project_dir),
+            "audio_segments": [str(path if path.exists() else ArtifactStore.ref_path(path))
+                               for path in (audio_dir / entry["wav"] for entry in index["segments"])],
+            "audio_combined_file": str(audio_combined_path),
+            "segment_index": str(audio_dir / INDEX_NAME),
+            "stage_timings": self.stage_timings,
+            "rerender": {"script": str(script_path), "reused": len(segments) - len(changed),
+                         "synthesized": len(changed), "removed": len(removed)},
+        })
+        if self.exports:
+            metadata["audio_exports"] = [str(parse_export_spec(spec, audio_combined_path).path)
+                                         for spec in self.exports]
+        with open(metadata_path, 'w') as f:
+            json.dump(metadata, f, indent=2)
+        return metadata
+
+    def episode_generator(self, project_name: str, description: str, source_files: List[Path],
+                          episode: int = 0, episodes: int = 1) -> "PodcastGenerator":
+        """
+        A generator with this one's settings for one episode of a series.
+
+        The episodes run concurrently, so episode (0-based) of episodes gets its
+        share of the queue and encode workers rather than the full count.
+        """
+        def share(total: int) -> int:
+            return total // episodes + (1 if episode < total % episodes else 0)
+
+        return PodcastGenerator(
+            str(self.input_dir), str(self.output_dir), project_name, self.host_count, description,
+            ssml_batching=self.ssml_batching, normalize_audio=self.normalize_audio, pause_ms=self.pause_ms,
+            parallel_encode=self.parallel_encode,
+            encode_workers=max(1, share(self.encode_workers or os.cpu_count() or 1)),
+            use_summary_index=self.summary_index is not None, parallel_script=self.parallel_script,
+            profile=self.profiler is not None,
+            work_queue=str(self.work_queue.db_path) if self.work_queue else None,
+            queue_workers=share(self.queue_workers),
+            use_artifact_store=self.artifacts is not None, hedge_tts=self.hedge_tts, exports=self.exports,
+            segment_index=self.segment_index, source_files=[str(f) for f in source_files],
+            target_minutes=self.target_minutes,
+        )
+
+    async def generate_series(self, episodes: int) -> Dict:
+        """
+        Split the input documents into episodes of related documents and generate
+        the episodes concurrently, each from its own documents only.
+
+        Each episode is a project of its own, named "<project> - Episode <n>",
+        and shares the LLM and TTS concurrency limits with the others.
+        """
+        with self._stage("process_documents"):
+            document_contents = await self.process_documents(summarize=False)
+        if not document_contents:
+            raise ValueError("No valid documents found to process")
+
+        # Cluster input files, so the pages of a link list stay together
+        file_texts: Dict[Path, List[str]] = {}
+        for file_path, content in zip(self.document_files, document_contents):
+            file_texts.setdefault(file_path, []).append(content)
+        with self._stage("plan_series"):
+            series_plan = await asyncio.to_thread(
+                plan_series, [str(f) for f in file_texts], ["\n\n".join(texts) for texts in file_texts.values()],
+                episodes)
+
+        generators = []
+        for number, episode in enumerate(series_plan, start=1):
+            description = self.description
+            if episode["topic_terms"]:
+                description = (f"{description}\n\n" if description else "") + \
+                    f"Episode {number} of {len(series_plan)}, focusing on: {', '.join(episode['topic_terms'])}"
+            generators.append(self.episode_generator(f"{self.project_name} - Episode {number}", description,
+                                                     [Path(f) for f in episode["sources"]],
+                                                     episode=number - 1, episodes=len(series_plan)))
+
+        log.log_info(f"Generating {len(generators)} episodes concurrently")
+        # Every episode counts its own LLM usage; this generator's usage adds them all up
+        with self._stage("generate_episodes"), track_llm_usage(self.llm_usage):
+            results = await asyncio.gather(*[generator.generate_podcast() for generator in generators],
+                                           return_exceptions=True)
+
+        series = {
+            "project_name": self.project_name,
+            "timestamp": datetime.now().isoformat(),
+            "output_directory": str(self.project_dir),
+            "stage_timings": self.stage_timings,
+            "episodes": [],
+        }
+        for generator, episode, result in zip(generators, series_plan, results):
+            entry = {"project_name": generator.project_name, "output_directory": str(generator.project_dir),
+                     "sources": episode["sources"], "topic_terms": episode["topic_terms"]}
+            if isinstance(result, Exception):
+                log.log_error(f"Episode {generator.project_name} failed: {str(result)}")
+                entry["error"] = str(result)
+            else:
+                entry["audio_combined_file"] = result["audio_combined_file"]
+            series["episodes"].append(entry)
+
+        series_path = self.project_dir / "series.json"
+        with open(series_path, 'w') as f:
+            json.dump(series, f, indent=2)
+        if all(isinstance(result, Exception) for result in results):
+            raise RuntimeError("Every episode of the series failed")
+        return series
+
+    async def plan(self) -> Dict:
+        """
+        Dry run: extract (from cache where possible) and tokenize the documents,
+        then estimate requests, TTS volume and wall time from the run history
+        without calling the LLM or TTS services.
+        """
+        start = time.perf_counter()
+        document_contents = await self.process_documents(summarize=False)
+        if not document_contents:
+            raise ValueError("No valid documents found to process")
+        extraction_seconds = time.perf_counter() - start
+
+        throughput = self.run_history.throughput()
+        prompt_tokens = 0
+
+        # Summaries: one request per chunk of every document not yet in the index or the response cache
+        summary_requests = 0
+        missing_summaries = 0
+        outline_sources = document_contents
+        if self.summary_index:
+            outline_sources = []
+            for content in document_contents:
+                summary = self.summary_index.get(content)
+                if summary is None:
+                    responses = cached_responses(content, DOCUMENT_SUMMARY_SYSTEM_INSTRUCTIONS, "Document Summary")
+                    if None in responses:
+                        summary_requests += responses.count(None)
+                        prompt_tokens += num_tokens_from_string(content)
+                        missing_summaries += 1
+                        continue
+                    summary = "".join(responses)
+                outline_sources.append(summary)
+
+        # Outline over the description plus documents (or summaries, estimating the ones not written yet)
+        outline_instructions = PODCAST_OUTLINE_SYSTEM_INSTRUCTIONS.format(host_count=self.host_count)
+        outline = None
+        if missing_summaries:
+            outline_tokens = (num_tokens_from_string("\n\n".join([self.description] + outline_sources))
+                              + int(missing_summaries * throughput["summary_chars"] / CHARS_PER_TOKEN))
+            outline_requests = chunks_for_tokens(
+                outline_tokens, max_chunk_tokens(outline_instructions, "Podcast Outline"))
+        else:
+            outline_content = "\n\n".join([self.description] + outline_sources)
+            responses = cached_responses(outline_content, outline_instructions, "Podcast Outline")
+            outline_requests = responses.count(None)
+            outline_tokens = num_tokens_from_string(outline_content) if outline_requests else 0
+            if not outline_requests:
+                # The whole outline is cached, so the script requests are known exactly
+                outline = "".join(responses)
+        prompt_tokens += outline_tokens
+
+        document_tokens = num_tokens_from_string("\n\n".join(document_contents))
+        script_requests, script_rounds, script_tokens = self.plan_script(
+            outline, "\n\n".join(document_contents), document_tokens, throughput)
+        prompt_tokens += script_tokens
+
+        plan = estimate_run(
+            document_count=len(document_contents),
+            document_chars=sum(len(content) for content in document_contents),
+            document_tokens=document_tokens,
+            extraction_seconds=extraction_seconds,
+            summary_requests=summary_requests,
+            outline_requests=outline_requests,
+            script_requests=script_requests,
+            prompt_tokens=prompt_tokens,
+            throughput=throughput,
+            tts_batch_chars=SSML_BATCH_MAX_CHARS if self.ssml_batching else 0,
+            script_rounds=script_rounds,
+        )
+        plan["project_name"] = self.project_name
+        plan["timestamp"] = datetime.now().isoformat()
+
+        plan_path = self.project_dir / "plan.json"
+        with open(plan_path, 'w') as f:
+            json.dump(plan, f, indent=2)
+        log.log_info(f"Plan saved to {plan_path}")
+        return plan
+
+    def plan_script(self, outline: Optional[str], analysis: str, document_tokens: int,
+                    throughput: Dict) -> Tuple[int, int, int]:
+        """
+        Script requests not answered from the response cache, for plan().
+
+        With the outline known (cached) the requests are built exactly as the
+        script stage builds them; otherwise they are estimated from the outline
+        length and, for --parallel-script, the section count of past runs.
+
+        Returns:
+            Requests, requests that wait on each other, and prompt tokens
+        """
+        script_instructions = get_script_system_instructions(self.host_count)
+        # Stitching requests rewrite the turns around a section boundary
+        seam_tokens = int(2 * SEAM_TURNS * throughput["tts_chars_per_segment"] / CHARS_PER_TOKEN)
+        requests = section_requests(outline, analysis, self.host_count) \
+            if outline is not None and self.parallel_script else []
+
+        if outline is not None and not requests:
+            content = f"{outline}\n\nContent Details:{analysis}"
+            missing = cached_responses(content, script_instructions, "Podcast Script").count(None)
+            return missing, missing, num_tokens_from_string(content) if missing else 0
+
+        if outline is None and not self.parallel_script:
+            script_tokens = document_tokens + int(throughput["outline_chars"] / CHARS_PER_TOKEN)
+            script_requests = chunks_for_tokens(
+                script_tokens, max_chunk_tokens(script_instructions, "Podcast Script"))
+            return script_requests, script_requests, script_tokens
+
+        if requests:
+            # Sections go out concurrently, then one stitching request per boundary
+            section_requests_sent = 0
+            prompt_tokens = 0
+            section_scripts = []
+            for content, instructions in requests:
+                responses = cached_responses(content, instructions, "Podcast Script Section")
+                if None in responses:
+                    section_requests_sent += responses.count(None)
+                    prompt_tokens += num_tokens_from_string(content)
+                section_scripts.append(None if None in responses else "".join(responses))
+
+            stitch_requests = 0
+            if None in section_scripts:
+                stitch_requests = len(requests) - 1
+                prompt_tokens += stitch_requests * seam_tokens
+            else:
+                section_turns = [parse_script(script, self.hosts) for script in section_scripts]
+                for before, after in zip(section_turns, section_turns[1:]):
+                    tail, head = seam_sizes(before, after)
+                    if tail and head:
+                        seam = format_turns(before[-tail:] + after[:head])
+                        if None in cached_responses(seam, TRANSITION_SYSTEM_INSTRUCTIONS, "Section Transition"):
+                            stitch_requests += 1
+                            prompt_tokens += num_tokens_from_string(seam)
+        else:
+            # Outline not written yet: as many sections as past outlines had, each with its share of sources
+            sections = max(2, round(throughput["outline_sections"]))
+            outline_tokens = int(throughput["outline_chars"] / CHARS_PER_TOKEN)
+            section_tokens = outline_tokens + min(document_tokens, int(SECTION_CONTEXT_CHARS / CHARS_PER_TOKEN))
+            section_requests_sent = sections * chunks_for_tokens(section_tokens, max_chunk_tokens(
+                script_instructions + SECTION_SCRIPT_INSTRUCTIONS, "Podcast Script Section"))
+            stitch_requests = sections - 1
+            prompt_tokens = sections * section_tokens + stitch_requests * seam_tokens
+
+        rounds = (math.ceil(section_requests_sent / MAX_CONCURRENT_SECTIONS)
+                  + math.ceil(stitch_requests / MAX_CONCURRENT_SECTIONS))
+        return section_requests_sent + stitch_requests, rounds, prompt_tokens
+
+    def budget_duration(self, script: str) -> str:
+        """
+        Predict the episode length from the script's turns with speaking rates
+        measured on past runs, trimming low-priority turns to fit --target-minutes
+        before any of them is synthesized.
+
+        Returns:
+            The script to synthesize
+        """
+        pause_seconds = self.pause_ms / 1000 if self.normalize_audio else 0.0
+        model = DurationModel(self.run_history.speech_rates(), pause_seconds=pause_seconds)
+        turns = parse_script(script, self.hosts)
+        target_seconds = self.target_minutes * 60 if self.target_minutes else None
+        budgeted, self.duration_report = budget_script(script, turns, speech_segments(script, self.hosts), model, target_seconds)
+        log.log_info(f"Predicted episode length: {self.duration_report['predicted_seconds'] / 60:.1f} minutes")
+
+        if budgeted != script:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            self.save_artifact(self.project_dir / "scripts" / f"script_{timestamp}_trimmed.md", budgeted)
+        return budgeted
+
+    def record_run(self, document_contents: List[str], outline: str, script: str, segment_count: int,
+                   speech: Optional[Dict[str, Dict[str, float]]] = None) -> None:
+        """Append this run's measured throughput to the run history used by plan()."""
+        turns = parse_script(script, self.hosts)
+        tts_chars = sum(len(turn.text) for turn in turns)
+        self.run_history.record({
+            "project_name": self.project_name,
+            "timestamp": datetime.now().isoformat(),
+            "stage_seconds": self.stage_timings,
+            "llm_requests": self.llm_usage["requests"],
+            "llm_seconds": round(self.llm_usage["seconds"], 3),
+            "llm_prompt_tokens": self.llm_usage["prompt_tokens"],
+            "llm_completion_tokens": self.llm_usage["completion_tokens"],
+            "script_llm_requests": self.stage_llm_requests.get("generate_script", 0),
+            "document_tokens": num_tokens_from_string("\n\n".join(document_contents)),
+            "outline_chars": len(outline),
+            "outline_sections": len(split_outline_sections(outline)),
+            "summary_chars": sum(self.summary_lengths) / len(self.summary_lengths) if self.summary_lengths else None,
+            "script_chars": len(script),
+            "tts_chars": tts_chars,
+            "tts_segments": segment_count,
+            "speech_chars_by_voice": speech["chars"] if speech else None,
+            "speech_seconds_by_voice": speech["seconds"] if speech else None,
+        })
+
     async def generate_podcast(self) -> Dict:
         """Generate complete podcast from documents."""
+        with track_llm_usage(self.llm_usage):
+            return await self._generate_podcast()
+
+    async def _generate_podcast(self) -> Dict:
         try:
             # Process all documents
-            document_contents = await self.process_documents()
+            with self._stage("process_documents"):
+                document_contents = await self.process_documents()
             if not document_contents:
                 raise ValueError("No valid documents found to process")
             
             log.log_info(f"Processed {len(document_contents)} documents")
 
             # Generate outline
-            outline = await self.generate_outline(document_contents)
+            with self._stage("generate_outline"):
+                outline = await self.generate_outline(document_contents)
             
             log.log_debug(outline[:100])
 
             # Generate script
-            script = await self.generate_script(outline, document_contents)
+            with self._stage("generate_script"):
+                script = await self.generate_script(outline, document_contents)
+
+            # Predict the length, and trim to the target, before paying for synthesis
+            # The synchronous steps below run in threads so the other episodes of a series are not held up
+            with self._stage("budget_duration"):
+                script = await asyncio.to_thread(self.budget_duration, script)
 
             # Generate audio
-            audio_path = await self.generate_audio(script)
+            with self._stage("generate_audio"):
+                audio_path = await self.generate_audio(script)
 
-            # Get all segment files
+            # The segment files of this script's turns, in order
             audio_dir = Path(self.project_dir) / "audio"
-            segment_files = sorted(list(audio_dir.glob("segment_*.wav")))
-            
+            turn_segments = speech_segments(script, self.hosts)
+            segment_files = [segment_file(audio_dir, i) for i, _, _ in turn_segments]
             if not segment_files:
                 raise ValueError("No audio segments found to combine")
+            missing = [f.name for f in segment_files if not f.exists()]
+            if missing:
+                raise ValueError(f"No audio for segments {', '.join(missing)}")
+
+            # Speaking rate per voice, measured before the WAVs are archived, calibrates later predictions
+            speech = await asyncio.to_thread(measure_speech, turn_segments, audio_dir)
+
+            with self._stage("combine_audio_files"):
+                # Trim, normalize and space out the segments before encoding
+                files_to_combine = segment_files
+                audio_processed_path = audio_dir / "podcast_processed.wav" \
+                    if self.normalize_audio and not self.segment_index else None
+                audio_combined_path = audio_dir / "podcast_combined.mp3"
+                # Turns of the episode, for the segment index
+                segments = turn_segments if self.segment_index else None
+
+                if self.work_queue:
+                    [encode_state] = await self.run_queued_tasks(ENCODE, [{
+                        "input_files": [str(f.resolve()) for f in segment_files],
+                        "processed_file": str(audio_processed_path.resolve()) if audio_processed_path else None,
+                        "pause_ms": self.pause_ms,
+                        "output_file": str(audio_combined_path.resolve()),
+                        "parallel_encode": self.parallel_encode,
+                        "encode_workers": self.encode_workers,
+                        "exports": self.exports,
+                        "segment_index": {"segments": segments, "normalize": self.normalize_audio}
+                        if segments is not None else None,
+                    }])
+                    if encode_state["state"] != DONE:
+                        raise RuntimeError(f"Encoding the episode failed: {encode_state['error']}")
+                elif segments is not None:
+                    # Normalization, if on, happens per segment so each turn's audio stands alone
+                    index = await asyncio.to_thread(
+                        build_indexed_episode, segments, audio_dir, audio_combined_path,
+                        normalize=self.normalize_audio, pause_ms=self.pause_ms, workers=self.encode_workers)
+                    if self.exports:
+                        await asyncio.to_thread(
+                            export_episode, audio_combined_path, index,
+                            [parse_export_spec(spec, audio_combined_path) for spec in self.exports])
+                else:
+                    if audio_processed_path:
+                        await asyncio.to_thread(process_audio_segments, segment_files, audio_processed_path,
+                                                pause_ms=self.pause_ms)
+                        files_to_combine = [audio_processed_path]
 
-            # Combine all the audio files into a single file
-            audio_combined_path = audio_dir / "podcast_combined.mp3"
-            combine_audio_files(segment_files, audio_combined_path)
+                    # Combine all the audio files into a single file, and any further formats in the same pass
+                    await asyncio.to_thread(
+                        combine_audio_files, files_to_combine, audio_combined_path,
+                        parallel_encode=self.parallel_encode, encode_workers=self.encode_workers,
+                        exports=[parse_export_spec(spec, audio_combined_path) for spec in self.exports])
+
+            if self.artifacts:
+                # The intermediate WAVs are only needed again to re-render, keep them as FLAC
+                with self._stage("archive_artifacts"):
+                    wav_files = segment_files + ([audio_processed_path] if audio_processed_path else [])
+                    archived = await asyncio.to_thread(self.artifacts.archive_wavs, wav_files)
+                    segment_files = archived[:len(segment_files)]
+                    if audio_processed_path:
+                        audio_processed_path = archived[-1]
 
             # Save project metadata
             metadata = {
@@ -166,19 +837,124 @@ class PodcastGenerator:
                 "output_directory": str(self.project_dir),
                 "audio_segments": [str(f) for f in segment_files],
                 "audio_combined_file": str(audio_combined_path),
+                "llm_cache": llm_cache.report(),
+                "stage_timings": self.stage_timings,
+                # Adaptive concurrency of this process; queue workers adapt their own
+                "concurrency": {"openai": llm_limiter.metrics(), "azure_speech": tts_limiter.metrics()},
             }
+            if audio_processed_path:
+                metadata["audio_processed_file"] = str(audio_processed_path)
+            if self.profiler:
+                metadata["profiles"] = self.profiler.reports
+            if self.hedge_tts:
+                metadata["tts_hedging"] = tts_hedger.metrics()
+            if self.exports:
+                metadata["audio_exports"] = [str(parse_export_spec(spec, audio_combined_path).path)
+                                             for spec in self.exports]
+            if self.segment_index:
+                metadata["segment_index"] = str(audio_dir / INDEX_NAME)
+            if self.duration_report:
+                metadata["duration"] = dict(self.duration_report,
+                                            speech_seconds=round(sum(speech["seconds"].values()), 1))
             
             metadata_path = Path(self.project_dir) / "metadata.json"
             with open(metadata_path, 'w') as f:
                 json.dump(metadata, f, indent=2)
 
+            self.record_run(document_contents, outline, script, len(segment_files), speech)
+
             return metadata
 
         except Exception as e:
             log.log_error(f"Error generating podcast: {str(e)}")
             raise
+        finally:
+            # Summaries still running when a stage failed are of no use any more
+            for task in self.summary_tasks:
+                task.cancel()
+            if self.summary_tasks:
+                await asyncio.gather(*self.summary_tasks, return_exceptions=True)
+                self.summary_tasks = []
+            if self.local_workers:
+                stop_local_workers(self.local_workers)
+                self.local_workers = []
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate a podcast from the documents in my_docs")
+    parser.add_argument("--ssml-batching", action="store_true",
+                        help="Pack consecutive speaker turns into shared SSML synthesis requests")
+    parser.add_argument("--normalize-audio", action="store_true",
+                        help="Trim silence, normalize loudness and insert pauses between segments")
+    parser.add_argument("--pause-ms", type=int, default=DEFAULT_PAUSE_MS,
+                        help="Pause inserted between speaker turns when normalizing audio")
+    parser.add_argument("--parallel-encode", action="store_true",
+                        help="Encode the final MP3 in frame-aligned sections across a process pool")
+    parser.add_argument("--encode-workers", type=int, default=None,
+                        help="Number of encoder processes for --parallel-encode (default: CPU count)")
+    parser.add_argument("--summary-index", action="store_true",
+                        help="Outline from cached per-document summaries shared across projects")
+    parser.add_argument("--parallel-script", action="store_true",
+                        help="Write each outline section concurrently and stitch the transitions")
+    parser.add_argument("--profile", action="store_true",
+                        help="Write cProfile stats and tracemalloc allocation reports per stage to the project directory")
+    parser.add_argument("--work-queue", metavar="DB",
+                        help="Run extraction, speech synthesis and encoding as tasks in this SQLite work queue")
+    parser.add_argument("--queue-workers", type=int, default=0,
+                        help="Local worker processes to start for --work-queue")
+    parser.add_argument("--worker", action="store_true",
+                        help="Run as a worker draining the --work-queue (default: output/work_queue.db) instead of generating")
+    parser.add_argument("--worker-exit-idle", type=float, default=None, metavar="SECONDS",
+                        help="Stop the worker after this long without tasks (default: run until interrupted)")
+    parser.add_argument("--artifact-store", action="store_true",
+                        help="Keep outlines, scripts, documents and WAV segments as compressed, deduplicated blobs "
+                             "referenced from the project directory")
+    parser.add_argument("--gc", nargs="?", const="output", metavar="OUTPUT_DIR",
+                        help="Remove artifact store blobs no project references any more and extraction cache "
+                             "entries unused for 30 days (default: output) and exit")
+    parser.add_argument("--hedge-tts", action="store_true",
+                        help="Send a duplicate TTS request when one runs past the 95th percentile of recent latencies "
+                             "for its length (at most 5%% of requests)")
+    parser.add_argument("--export", nargs="+", default=[], metavar="FORMAT[:OPTION]",
+                        help="Also write the episode as mp3:BITRATE, opus[:BITRATE] or peaks[:SAMPLES_PER_PIXEL] "
+                             "(waveform JSON), all from the same pass over the audio")
+    parser.add_argument("--segment-index", action="store_true",
+                        help="Encode each speaker turn separately and index its offset in the MP3, so --rerender "
+                             "can later rebuild the episode from an edited script")
+    parser.add_argument("--rerender", metavar="SCRIPT",
+                        help="Rebuild an indexed episode of the project from an edited script, synthesizing only "
+                             "new or changed turns")
+    parser.add_argument("--series", type=int, default=None, metavar="N",
+                        help="Cluster the documents by topic into N episodes and generate them concurrently")
+    parser.add_argument("--target-minutes", type=float, default=None, metavar="MINUTES",
+                        help="Trim the script's lowest-priority turns before synthesis so the predicted episode fits")
+    parser.add_argument("--no-llm-cache", action="store_true",
+                        help="Bypass the LLM response cache (no reads, no writes)")
+    parser.add_argument("--refresh-llm-cache", action="store_true",
+                        help="Ignore cached LLM responses but store the fresh ones")
+    parser.add_argument("--plan", action="store_true",
+                        help="Dry run: estimate requests, tokens, TTS characters and wall time without generating")
+    return parser.parse_args()
 
 def main():
+    args = parse_args()
+    if args.no_llm_cache:
+        llm_cache.enabled = False
+    if args.refresh_llm_cache:
+        llm_cache.refresh = True
+
+    if args.worker:
+        try:
+            run_worker(WorkQueue(args.work_queue or "output/work_queue.db"), exit_when_idle=args.worker_exit_idle)
+        except KeyboardInterrupt:
+            # Whatever this worker was running is retried by another one once its lease expires
+            log.log_info("Worker stopped")
+        return
+
+    if args.gc:
+        ExtractionCache(Path(args.gc) / "extraction_cache").prune()
+        ArtifactStore(Path(args.gc) / "artifacts").gc([args.gc])
+        return
+
     input_dir = 'my_docs'
     output_dir = input("Enter the output directory for generated files (default: output): ") or 'output'
     project_name = input("Enter the name of the project: ")
@@ -191,12 +967,67 @@ def main():
             output_dir,
             project_name,
             int(host_count),
-            description
+            description,
+            ssml_batching=args.ssml_batching,
+            normalize_audio=args.normalize_audio,
+            pause_ms=args.pause_ms,
+            parallel_encode=args.parallel_encode,
+            encode_workers=args.encode_workers,
+            use_summary_index=args.summary_index,
+            parallel_script=args.parallel_script,
+            profile=args.profile,
+            work_queue=args.work_queue,
+            queue_workers=args.queue_workers,
+            use_artifact_store=args.artifact_store,
+            hedge_tts=args.hedge_tts,
+            exports=args.export,
+            segment_index=args.segment_index,
+            target_minutes=args.target_minutes
         )
 
+        if args.series:
+            series = asyncio.run(generator.generate_series(args.series))
+            for episode in series["episodes"]:
+                status = episode.get("audio_combined_file") or f"failed: {episode['error']}"
+                log.log_info(f"{episode['project_name']} ({len(episode['sources'])} documents): {status}")
+            log.log_info(f"Series plan is in: {series['output_directory']}")
+            return
+
+        if args.rerender:
+            metadata = asyncio.run(generator.rerender(args.rerender))
+            report = metadata["rerender"]
+            log.log_info(f"Episode re-rendered: {report['reused']} turns reused, {report['synthesized']} synthesized, "
+                         f"{report['removed']} removed")
+            log.log_info(f"Output files are in: {metadata['output_directory']}")
+            return
+
+        if args.plan:
+            plan = asyncio.run(generator.plan())
+            log.log_info(f"LLM requests: {plan['llm_requests']['total']}, prompt tokens: {plan['llm_prompt_tokens']}")
+            log.log_info(f"TTS characters: {plan['tts']['characters']}, segments: {plan['tts']['segments']}, "
+                         f"requests: {plan['tts']['requests']}")
+            log.log_info(f"Estimated wall time: {plan['estimated_seconds']['total']:.0f}s "
+                         f"(from {plan['throughput']['runs']} recorded runs)")
+            return
+
         metadata = asyncio.run(generator.generate_podcast())
         log.log_info("Podcast generation completed successfully!")
         log.log_info(f"Output files are in: {metadata['output_directory']}")
+        cache_report = metadata["llm_cache"]
+        log.log_info(f"LLM cache: {cache_report['hits']} hits, {cache_report['misses']} misses, "
+                     f"{cache_report['tokens_saved']} tokens saved")
+        if "duration" in metadata:
+            duration = metadata["duration"]
+            log.log_info(f"Episode length: {duration['speech_seconds'] / 60:.1f} minutes of speech "
+                         f"(predicted {duration['predicted_seconds'] / 60:.1f}, {duration['trimmed_turns']} turns trimmed)")
+        if "tts_hedging" in metadata:
+            hedging = metadata["tts_hedging"]
+            log.log_info(f"TTS hedging: {hedging['hedged']} of {hedging['calls']} requests hedged, "
+                         f"{hedging['hedge_wins']} won by the duplicate")
+        for service, limiter_report in metadata["concurrency"].items():
+            log.log_info(f"{service} concurrency: limit {limiter_report['limit']} "
+                         f"(peak {limiter_report['peak_in_flight']} in flight), "
+                         f"{limiter_report['throttled']} throttled, {limiter_report['retries']} retries")
 
     except Exception as e:
         log.log_error(f"Error: {str(e)}")
@@ -0,0 +1,113 @@
+"""
+Sharded PDF analysis against a local stub of the Document Intelligence
+analyze endpoint. Pages are blank and told apart by their width, which the
+stub reads back from each uploaded shard.
+"""
+import asyncio
+import io
+from collections import Counter
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from PyPDF2 import PdfReader, PdfWriter
+
+import document_processor
+
+PAGE_COUNT = 7
+PAGES_PER_SHARD = 3
+BASE_WIDTH = 100
+
+
+def write_pdf(path, page_count: int):
+    writer = PdfWriter()
+    for page in range(1, page_count + 1):
+        writer.add_blank_page(width=BASE_WIDTH + page, height=100)
+    with open(path, "wb") as f:
+        writer.write(f)
+
+
+class StubAnalyzeService:
+    """Answers analyze requests with "page N" for every page, failing the first attempt of one range."""
+
+    def __init__(self, failing_first_page: int):
+        self.failing_first_page = failing_first_page
+        self.attempts = Counter()
+        self.results = {}
+
+    async def analyze(self, request: web.Request) -> web.Response:
+        reader = PdfReader(io.BytesIO(await request.read()))
+        pages = [int(float(page.mediabox.width)) - BASE_WIDTH for page in reader.pages]
+        self.attempts[pages[0]] += 1
+        if pages[0] == self.failing_first_page and self.attempts[pages[0]] == 1:
+            # Not a status the SDK retries by itself, so the retry under test is ours
+            return web.json_response({"error": {"code": "InvalidRequest", "message": "stub failure"}}, status=400)
+
+        operation = f"op-{pages[0]}-{self.attempts[pages[0]]}"
+        self.results[operation] = "\n".join(f"page {page}" for page in pages)
+        location = f"{request.scheme}://{request.host}/formrecognizer/operations/{operation}"
+        return web.Response(status=202, headers={"Operation-Location": location, "Retry-After": "0"})
+
+    async def operation(self, request: web.Request) -> web.Response:
+        return web.json_response({
+            "status": "succeeded",
+            "createdDateTime": "2024-01-01T00:00:00Z",
+            "lastUpdatedDateTime": "2024-01-01T00:00:00Z",
+            "analyzeResult": {
+                "apiVersion": "2023-07-31",
+                "modelId": "prebuilt-read",
+                "stringIndexType": "unicodeCodePoint",
+                "content": self.results[request.match_info["operation"]],
+                "pages": [],
+            },
+        })
+
+
+async def analyze_with_stub(pdf_path, service: StubAnalyzeService, **kwargs) -> str:
+    app = web.Application()
+    app.router.add_post("/formrecognizer/documentModels/{model}", service.analyze)
+    app.router.add_get("/formrecognizer/operations/{operation}", service.operation)
+    server = TestServer(app)
+    await server.start_server()
+    try:
+        return await document_processor.read_pdf_with_azure_sharded(
+            str(pdf_path), endpoint=str(server.make_url("")), key="stub-key", **kwargs)
+    finally:
+        await server.close()
+
+
+def test_shards_join_in_page_order_and_only_failed_range_retries(tmp_path, monkeypatch):
+    monkeypatch.setattr(document_processor, "PDF_SHARD_RETRY_DELAY", 0)
+    pdf_path = tmp_path / "document.pdf"
+    write_pdf(pdf_path, PAGE_COUNT)
+    service = StubAnalyzeService(failing_first_page=4)
+
+    text = asyncio.run(analyze_with_stub(pdf_path, service, pages_per_shard=PAGES_PER_SHARD, shard_min_bytes=0))
+
+    assert text.splitlines() == [f"page {page}" for page in range(1, PAGE_COUNT + 1)]
+    assert service.attempts == {1: 1, 4: 2, 7: 1}
+
+
+def test_small_pdf_is_uploaded_whole_without_sharding(tmp_path):
+    pdf_path = tmp_path / "document.pdf"
+    write_pdf(pdf_path, PAGE_COUNT)
+    service = StubAnalyzeService(failing_first_page=0)
+
+    text = asyncio.run(analyze_with_stub(pdf_path, service, pages_per_shard=PAGES_PER_SHARD))
+
+    assert text.splitlines() == [f"page {page}" for page in range(1, PAGE_COUNT + 1)]
+    assert service.attempts == {1: 1}
+
+
+def test_unreadable_pdf_falls_back_to_single_upload(tmp_path, monkeypatch):
+    pdf_path = tmp_path / "document.pdf"
+    write_pdf(pdf_path, PAGE_COUNT)
+    service = StubAnalyzeService(failing_first_page=0)
+
+    def unreadable(*args, **kwargs):
+        raise ValueError("malformed PDF")
+
+    monkeypatch.setattr(document_processor, "PdfReader", unreadable)
+    text = asyncio.run(analyze_with_stub(pdf_path, service, pages_per_shard=PAGES_PER_SHARD, shard_min_bytes=0))
+
+    assert text.splitlines() == [f"page {page}" for page in range(1, PAGE_COUNT + 1)]
+    assert service.attempts == {1: 1}
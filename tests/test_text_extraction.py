@@ -0,0 +1,77 @@
+"""
+Streaming text extraction: normalized blocks must add up to the text a whole
+read gives, also when decoding has to start over with another encoding.
+"""
+import asyncio
+import os
+import time
+
+import document_processor
+from utils.extraction_cache import ExtractionCache
+
+
+def expected_text(raw: str) -> str:
+    return "\n".join(line.strip() for line in raw.splitlines() if line.strip())
+
+
+def test_blocks_join_to_the_normalized_text(tmp_path):
+    raw = "".join(f"  line {n} with some words  \n\n" for n in range(2000))
+    path = tmp_path / "doc.txt"
+    path.write_text(raw, encoding="utf-8")
+
+    blocks = list(document_processor.normalize_blocks(document_processor.iter_document_lines(str(path)),
+                                                      block_chars=1000))
+
+    assert len(blocks) > 10
+    assert all(len(block) < 1100 for block in blocks)
+    assert "".join(blocks) == expected_text(raw)
+
+
+def test_late_invalid_byte_restarts_with_next_encoding(tmp_path):
+    # Valid utf-8 for the sample and well past it, then a latin-1 byte
+    raw = "café line\n" * 20000 + "naïve\n"
+    data = raw[:-7].encode("utf-8") + "naïve\n".encode("latin-1")
+    path = tmp_path / "doc.txt"
+    path.write_bytes(data)
+
+    blocks = list(document_processor.normalize_blocks(document_processor.iter_document_lines(str(path)),
+                                                      block_chars=512))
+
+    assert None in blocks
+    text = document_processor.join_blocks(blocks)
+    assert text == expected_text(data.decode("latin-1"))
+    assert text == expected_text(document_processor.read_txt_file(str(path)))
+
+
+def test_extraction_cache_stores_only_text_after_a_restart(tmp_path):
+    cache = ExtractionCache(tmp_path / "cache")
+
+    assert cache.put_blocks("key", iter(["discarded", None, "kept", "\nlines"])) == len("kept\nlines")
+    assert cache.get("key") == "kept\nlines"
+    assert cache.put_blocks("empty", iter([])) == 0
+    assert cache.get("empty") is None
+
+
+def test_analyze_document_matches_the_block_stream(tmp_path):
+    raw = "  Title  \n\nFirst paragraph.\n   Second paragraph.   \n"
+    path = tmp_path / "doc.txt"
+    path.write_text(raw, encoding="utf-8")
+
+    assert asyncio.run(document_processor.analyze_document(str(path))) == expected_text(raw)
+
+
+def test_extraction_cache_prunes_unused_and_outdated_entries(tmp_path):
+    cache = ExtractionCache(tmp_path / "cache")
+    cache.put("used", "kept text " * 1000)
+    cache.put("unused", "old text")
+    (tmp_path / "cache" / "old_v1.txt").write_text("outdated format")
+    month_ago = time.time() - 31 * 24 * 3600
+    os.utime(cache._entry_path("used"), (month_ago, month_ago))
+    os.utime(cache._entry_path("unused"), (month_ago, month_ago))
+
+    assert cache._entry_path("used").stat().st_size < len("kept text " * 1000)
+    assert cache.get("used") == "kept text " * 1000
+    assert cache.prune()["removed"] == 2
+    assert cache.get("used") == "kept text " * 1000
+    assert cache.get("unused") is None
+    assert [path.name for path in (tmp_path / "cache").iterdir()] == [cache._entry_path("used").name]
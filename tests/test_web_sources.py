@@ -0,0 +1,138 @@
+"""
+Web sources (link lists and sitemaps) against a local stub site. Every page
+answers with its own path as text, so the fetched texts show which pages were
+read and in which order.
+"""
+import asyncio
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+import helpers
+
+PAGE_COUNT = 6
+PAGE_DELAY = 0.05  # Seconds a page takes, long enough for requests to overlap
+LARGE_PAGE_CHUNKS = helpers.MAX_FILE_SIZE // (1024 * 1024) + 2  # MiB sent by /chunked
+
+
+def urlset(urls) -> str:
+    entries = "".join(f"<url><loc>{url}</loc></url>" for url in urls)
+    return f'<?xml version="1.0" encoding="UTF-8"?><urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{entries}</urlset>'
+
+
+def sitemap_index(urls) -> str:
+    entries = "".join(f"<sitemap><loc>{url}</loc></sitemap>" for url in urls)
+    return f'<?xml version="1.0" encoding="UTF-8"?><sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{entries}</sitemapindex>'
+
+
+class StubSite:
+    """Serves /page/<n>, a nested sitemap under /sitemaps/ and 404 for anything else."""
+
+    def __init__(self):
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.base = ""
+
+    async def page(self, request: web.Request) -> web.Response:
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(PAGE_DELAY)
+            return web.Response(text=f"<html><body><p>{request.path}</p></body></html>", content_type="text/html")
+        finally:
+            self.in_flight -= 1
+
+    async def latin1_page(self, request: web.Request) -> web.Response:
+        return web.Response(body="<p>Café crème</p>".encode("latin-1"),
+                            headers={"Content-Type": "text/html; charset=iso-8859-1"})
+
+    async def chunked_page(self, request: web.Request) -> web.StreamResponse:
+        # No Content-Length, so only counting the body can tell it is too large
+        response = web.StreamResponse(headers={"Content-Type": "text/plain"})
+        response.enable_chunked_encoding()
+        await response.prepare(request)
+        for _ in range(LARGE_PAGE_CHUNKS):
+            await response.write(b"x" * 1024 * 1024)
+        await response.write_eof()
+        return response
+
+    async def sitemap_root(self, request: web.Request) -> web.Response:
+        return web.Response(text=sitemap_index([f"{self.base}/sitemaps/child.xml"]), content_type="application/xml")
+
+    async def sitemap_child(self, request: web.Request) -> web.Response:
+        return web.Response(text=urlset([f"{self.base}/page/{n}" for n in range(1, 4)]), content_type="application/xml")
+
+
+async def with_stub_site(run):
+    site = StubSite()
+    app = web.Application()
+    app.router.add_get("/page/{n}", site.page)
+    app.router.add_get("/latin1", site.latin1_page)
+    app.router.add_get("/chunked", site.chunked_page)
+    app.router.add_get("/sitemaps/root.xml", site.sitemap_root)
+    app.router.add_get("/sitemaps/child.xml", site.sitemap_child)
+    server = TestServer(app)
+    await server.start_server()
+    site.base = str(server.make_url("")).rstrip("/")
+    try:
+        return await run(site), site
+    finally:
+        await server.close()
+
+
+def test_link_list_pages_are_fetched_in_order_and_404_is_skipped(tmp_path):
+    async def run(site):
+        links = tmp_path / "links.txt"
+        links.write_text(f"# reading list\n{site.base}/page/1\n{site.base}/missing\n{site.base}/page/2\n")
+        async with helpers.web_session() as session:
+            urls = await helpers.collect_source_urls(links, session)
+            return urls, await helpers.fetch_page_texts(session, urls)
+
+    (urls, texts), site = asyncio.run(with_stub_site(run))
+
+    assert urls == [f"{site.base}/page/1", f"{site.base}/missing", f"{site.base}/page/2"]
+    assert texts == {f"{site.base}/page/1": "/page/1", f"{site.base}/missing": None, f"{site.base}/page/2": "/page/2"}
+
+
+def test_nested_sitemap_is_expanded_to_its_pages(tmp_path):
+    async def run(site):
+        sitemap = tmp_path / "sitemap.xml"
+        sitemap.write_text(sitemap_index([f"{site.base}/sitemaps/root.xml"]))
+        async with helpers.web_session() as session:
+            return await helpers.collect_source_urls(sitemap, session)
+
+    urls, site = asyncio.run(with_stub_site(run))
+
+    assert urls == [f"{site.base}/page/{n}" for n in range(1, 4)]
+
+
+def test_fetches_to_one_host_are_capped(tmp_path):
+    async def run(site):
+        urls = [f"{site.base}/page/{n}" for n in range(1, PAGE_COUNT + 1)]
+        async with helpers.web_session(max_per_host=2) as session:
+            return await helpers.fetch_page_texts(session, urls)
+
+    texts, site = asyncio.run(with_stub_site(run))
+
+    assert list(texts.values()) == [f"/page/{n}" for n in range(1, PAGE_COUNT + 1)]
+    assert site.max_in_flight == 2
+
+
+def test_page_is_decoded_with_its_declared_charset():
+    async def run(site):
+        async with helpers.web_session() as session:
+            return await helpers.fetch_page_text(session, f"{site.base}/latin1")
+
+    text, _ = asyncio.run(with_stub_site(run))
+
+    assert text == "Café crème"
+
+
+def test_chunked_page_over_the_size_limit_is_skipped():
+    async def run(site):
+        async with helpers.web_session() as session:
+            return await helpers.fetch_bytes(session, f"{site.base}/chunked")
+
+    result, _ = asyncio.run(with_stub_site(run))
+
+    assert result == (None, '', None)
@@ -0,0 +1,203 @@
+import random
+import threading
+import time
+from typing import Callable, Dict, Optional, TypeVar, Union
+
+from logger import CustomLogger
+
+log = CustomLogger("AdaptiveLimiter", log_file="adaptive_limiter.log")
+
+T = TypeVar("T")
+
+DEFAULT_MAX_RETRIES = 5
+BACKOFF_SECONDS = 1.0  # Doubled after every throttled attempt the service gave no Retry-After for
+MAX_BACKOFF_SECONDS = 60.0
+RECENT_LATENCY_WEIGHT = 0.3  # Weight of a new sample in the recent latency average
+BASELINE_LATENCY_WEIGHT = 0.05  # Weight of a new sample in the long-term baseline
+LATENCY_SPIKE_FACTOR = 2.0  # Recent latency per unit this many times the baseline counts as congestion
+LATENCY_WARMUP_SAMPLES = 10  # Successful calls before latency spikes are acted on
+
+
+class ThrottledError(Exception):
+    """
+    A call was rejected because the service is rate limiting or overloaded.
+
+    Args:
+        retry_after: Seconds the service asked us to wait, if it said
+    """
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class LimiterBusy(Exception):
+    """No slot was free for a call that may not wait for one."""
+
+
+class AdaptiveLimiter:
+    """
+    Concurrency limit for calls to a rate-limited service, adjusted with AIMD.
+
+    Every successful call made while the limit was fully used raises the limit
+    by increase / limit, so it grows by about `increase` per limit's worth of
+    calls. A throttled call (ThrottledError) or a latency spike multiplies it by
+    `decrease`; calls that were already in flight when the limit was cut do not
+    cut it again. A latency spike is the recent average latency per unit of work
+    rising well above its long-term average, so single slow calls do not count.
+    Retry-After from the service pauses every caller of the limiter, not just
+    the one that was throttled.
+
+    The limit is per process: worker processes each adapt their own.
+
+    Args:
+        name: Name used in logs and metrics
+        initial: Starting limit
+        min_limit, max_limit: Bounds of the limit
+        max_retries: Retries of a throttled call before its ThrottledError is raised
+    """
+
+    def __init__(self, name: str, initial: float = 4, min_limit: float = 1, max_limit: float = 32,
+                 increase: float = 1.0, decrease: float = 0.5, max_retries: int = DEFAULT_MAX_RETRIES,
+                 latency_spike_factor: Optional[float] = LATENCY_SPIKE_FACTOR):
+        self.name = name
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase = increase
+        self.decrease = decrease
+        self.max_retries = max_retries
+        self.latency_spike_factor = latency_spike_factor
+
+        self._condition = threading.Condition()
+        self._limit = float(min(max(initial, min_limit), max_limit))
+        self._in_flight = 0
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        self._latency_recent: Optional[float] = None
+        self._latency_baseline: Optional[float] = None
+        self._latency_samples = 0
+        self._peak_in_flight = 0
+        self._counters = {"calls": 0, "throttled": 0, "latency_spikes": 0, "retries": 0, "failed": 0,
+                          "decreases": 0, "wait_seconds": 0.0}
+
+    @property
+    def limit(self) -> int:
+        return max(1, int(self._limit))
+
+    def _acquire(self, wait: bool = True) -> tuple:
+        """
+        Wait for a free slot; returns (start time, whether the limit was fully used).
+
+        Raises:
+            LimiterBusy: wait is False and no slot is free right now
+        """
+        waited_from = time.monotonic()
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                if not wait and (now < self._paused_until or self._in_flight >= self.limit):
+                    raise LimiterBusy(f"{self.name}: no free slot")
+                if now < self._paused_until:
+                    self._condition.wait(self._paused_until - now)
+                elif self._in_flight >= self.limit:
+                    self._condition.wait()
+                else:
+                    break
+            self._in_flight += 1
+            self._peak_in_flight = max(self._peak_in_flight, self._in_flight)
+            self._counters["wait_seconds"] += now - waited_from
+            return now, self._in_flight >= self.limit
+
+    def _decrease(self, started: float, reason: str) -> None:
+        # Called with the condition held. Calls started before the last cut saw the old limit.
+        if started < self._last_decrease:
+            return
+        self._last_decrease = time.monotonic()
+        self._limit = max(self.min_limit, self._limit * self.decrease)
+        self._counters["decreases"] += 1
+        log.log_info(f"{self.name}: {reason}, concurrency limit cut to {self.limit}")
+
+    def _release(self, started: float, saturated: bool, units: Optional[float],
+                 throttled: Optional[ThrottledError] = None) -> None:
+        with self._condition:
+            self._in_flight -= 1
+            self._counters["calls"] += 1
+
+            if throttled is not None:
+                self._counters["throttled"] += 1
+                if throttled.retry_after:
+                    self._paused_until = max(self._paused_until, time.monotonic() + throttled.retry_after)
+                self._decrease(started, "throttled")
+            elif units is not None:
+                latency = (time.monotonic() - started) / max(units, 1)
+                if self._latency_baseline is None:
+                    self._latency_recent = self._latency_baseline = latency
+                else:
+                    self._latency_recent += RECENT_LATENCY_WEIGHT * (latency - self._latency_recent)
+                    self._latency_baseline += BASELINE_LATENCY_WEIGHT * (latency - self._latency_baseline)
+                self._latency_samples += 1
+
+                ratio = self._latency_recent / self._latency_baseline if self._latency_baseline else 1.0
+                if (self.latency_spike_factor is not None and self._latency_samples >= LATENCY_WARMUP_SAMPLES
+                        and ratio > self.latency_spike_factor):
+                    self._counters["latency_spikes"] += 1
+                    self._decrease(started, f"latency {ratio:.1f}x the baseline")
+                    # Measure the next spike from here, not from the one just acted on
+                    self._latency_recent = self._latency_baseline
+                elif saturated:
+                    self._limit = min(self.max_limit, self._limit + self.increase / self._limit)
+
+            self._condition.notify_all()
+
+    def call(self, fn: Callable[[], T], units: Union[float, Callable[[T], float]] = 1.0,
+             wait: bool = True) -> T:
+        """
+        Run fn in a slot, retrying it while it raises ThrottledError.
+
+        Args:
+            fn: The call to make, without arguments
+            units: Size of the work (characters, tokens) latency is measured against,
+                   or a function computing it from fn's result
+            wait: Wait for a free slot (also before each retry); when False the
+                  call is given up instead, for optional work such as hedged duplicates
+        Returns:
+            fn's result
+        Raises:
+            ThrottledError: The call was still throttled after max_retries retries
+            LimiterBusy: wait is False and no slot was free
+        """
+        for attempt in range(self.max_retries + 1):
+            started, saturated = self._acquire(wait)
+            try:
+                result = fn()
+            except ThrottledError as e:
+                self._release(started, saturated, None, throttled=e)
+                if attempt == self.max_retries:
+                    with self._condition:
+                        self._counters["failed"] += 1
+                    raise
+                with self._condition:
+                    self._counters["retries"] += 1
+                if not e.retry_after:
+                    # Full jitter so throttled callers do not come back in lockstep
+                    time.sleep(random.uniform(0, min(MAX_BACKOFF_SECONDS, BACKOFF_SECONDS * 2 ** attempt)))
+                continue
+            except BaseException:
+                self._release(started, saturated, None)
+                raise
+            self._release(started, saturated, units(result) if callable(units) else units)
+            return result
+
+    def metrics(self) -> Dict:
+        """Current limit and counters, for run metadata and logs."""
+        with self._condition:
+            return {
+                "limit": self.limit,
+                "min_limit": self.min_limit,
+                "max_limit": self.max_limit,
+                "in_flight": self._in_flight,
+                "peak_in_flight": self._peak_in_flight,
+                "paused_seconds": round(max(0.0, self._paused_until - time.monotonic()), 3),
+                **{key: round(value, 3) if isinstance(value, float) else value
+                   for key, value in self._counters.items()},
+            }
@@ -0,0 +1,239 @@
+import gzip
+import hashlib
+import json
+import os
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Union
+
+from logger import CustomLogger
+
+try:
+    import zstandard
+except ImportError:  # Optional: text blobs fall back to gzip
+    zstandard = None
+
+log = CustomLogger("ArtifactStore", log_file="artifact_store.log")
+
+REF_SUFFIX = ".ref"
+ZSTD_LEVEL = 10
+GZIP_LEVEL = 6
+FLAC_COMPRESSION_LEVEL = 5
+GC_GRACE_SECONDS = 3600  # Blobs younger than this are kept even if unreferenced, a run may still be writing refs
+
+# Codec of a blob -> file extension
+CODEC_EXTENSIONS = {"zstd": ".zst", "gzip": ".gz", "flac": ".flac"}
+
+
+class ArtifactStore:
+    """
+    Content-addressed, compressed storage for project artifacts.
+
+    Blobs are named after the SHA-256 of their original content, so identical
+    outlines, scripts, documents and audio segments from repeated runs are stored
+    once. Text is compressed with zstd when the zstandard package is installed and
+    gzip otherwise; WAV audio is stored as FLAC, which decodes back to the same
+    samples (the WAV header may differ). Projects keep small JSON `.ref` files in
+    place of the artifacts; blobs no ref points to are removed by gc().
+    """
+
+    def __init__(self, root: Union[str, Path]):
+        self.root = Path(root)
+        self.objects_dir = self.root / "objects"
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+
+    def _blob_path(self, digest: str, codec: str) -> Path:
+        return self.objects_dir / digest[:2] / f"{digest}{CODEC_EXTENSIONS[codec]}"
+
+    def _find_blob(self, digest: str, codecs: Iterable[str]) -> Optional[Path]:
+        """
+        Find a stored blob of the content and mark it as just written, so gc()
+        gives the refs about to be written to it the same grace period as for a new blob.
+        """
+        for codec in codecs:
+            blob_path = self._blob_path(digest, codec)
+            try:
+                os.utime(blob_path)
+                return blob_path
+            except FileNotFoundError:
+                continue
+        return None
+
+    @staticmethod
+    def _temp_path(path: Path) -> Path:
+        return path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+
+    def _write_blob(self, blob_path: Path, data: bytes) -> None:
+        blob_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = self._temp_path(blob_path)
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, blob_path)
+
+    def put_text(self, content: str) -> Dict:
+        """Store text and return its ref (digest, codec and original size)."""
+        data = content.encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()
+        blob_path = self._find_blob(digest, ("zstd", "gzip"))
+        if blob_path is None:
+            if zstandard is not None:
+                codec = "zstd"
+                compressed = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+            else:
+                codec = "gzip"
+                compressed = gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+            blob_path = self._blob_path(digest, codec)
+            self._write_blob(blob_path, compressed)
+        codec = "zstd" if blob_path.suffix == CODEC_EXTENSIONS["zstd"] else "gzip"
+        return {"digest": digest, "codec": codec, "size": len(data)}
+
+    def put_wav(self, wav_file: Union[str, Path]) -> Dict:
+        """Store a WAV file as FLAC and return its ref."""
+        wav_file = Path(wav_file)
+        digest = hashlib.sha256()
+        with open(wav_file, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        digest = digest.hexdigest()
+
+        blob_path = self._find_blob(digest, ("flac",))
+        if blob_path is None:
+            blob_path = self._blob_path(digest, "flac")
+            blob_path.parent.mkdir(parents=True, exist_ok=True)
+            temp_path = self._temp_path(blob_path)
+            result = subprocess.run(
+                ["ffmpeg", "-v", "error", "-y", "-i", str(wav_file), "-map_metadata", "-1",
+                 "-c:a", "flac", "-compression_level", str(FLAC_COMPRESSION_LEVEL), "-f", "flac", str(temp_path)],
+                capture_output=True, check=False,
+            )
+            if result.returncode != 0:
+                temp_path.unlink(missing_ok=True)
+                raise RuntimeError(f"ffmpeg FLAC encode of {wav_file} failed: "
+                                   f"{result.stderr.decode(errors='replace').strip()}")
+            os.replace(temp_path, blob_path)
+        return {"digest": digest, "codec": "flac", "size": wav_file.stat().st_size}
+
+    @staticmethod
+    def ref_path(artifact_path: Union[str, Path]) -> Path:
+        artifact_path = Path(artifact_path)
+        return artifact_path.with_name(artifact_path.name + REF_SUFFIX)
+
+    def write_ref(self, artifact_path: Union[str, Path], ref: Dict) -> Path:
+        """Write the ref for an artifact next to where the artifact itself would be."""
+        ref_path = self.ref_path(artifact_path)
+        ref = dict(ref, name=Path(artifact_path).name, created_at=datetime.now().isoformat())
+        temp_path = self._temp_path(ref_path)
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(ref, f, indent=2)
+        os.replace(temp_path, ref_path)
+        return ref_path
+
+    def save_text(self, artifact_path: Union[str, Path], content: str) -> Path:
+        return self.write_ref(artifact_path, self.put_text(content))
+
+    def archive_wav(self, wav_file: Union[str, Path]) -> Path:
+        """Move a WAV file into the store, leaving a ref in its place."""
+        ref_path = self.write_ref(wav_file, self.put_wav(wav_file))
+        Path(wav_file).unlink()
+        return ref_path
+
+    def archive_wavs(self, wav_files: List[Union[str, Path]], workers: Optional[int] = None) -> List[Path]:
+        """archive_wav for many files, running the FLAC encoders concurrently."""
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+            return list(executor.map(self.archive_wav, wav_files))
+
+    @staticmethod
+    def load_ref(ref_path: Union[str, Path]) -> Dict:
+        with open(ref_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def read_text(self, path: Union[str, Path]) -> str:
+        """Read a text artifact from its ref (path of the ref or of the artifact it replaces)."""
+        path = Path(path)
+        ref = self.load_ref(path if path.suffix == REF_SUFFIX else self.ref_path(path))
+        with open(self._blob_path(ref["digest"], ref["codec"]), "rb") as f:
+            data = f.read()
+        if ref["codec"] == "zstd":
+            if zstandard is None:
+                raise RuntimeError("The zstandard package is required to read zstd-compressed artifacts")
+            return zstandard.ZstdDecompressor().decompress(data).decode("utf-8")
+        return gzip.decompress(data).decode("utf-8")
+
+    def materialize(self, path: Union[str, Path], destination: Optional[Union[str, Path]] = None) -> Path:
+        """
+        Restore an artifact from its ref, decoding FLAC back to WAV.
+
+        Args:
+            destination: Where to write the artifact, defaults to the path the ref replaced
+        """
+        path = Path(path)
+        ref_path = path if path.suffix == REF_SUFFIX else self.ref_path(path)
+        ref = self.load_ref(ref_path)
+        destination = Path(destination) if destination else ref_path.with_name(ref["name"])
+
+        if ref["codec"] == "flac":
+            temp_path = self._temp_path(destination)
+            result = subprocess.run(
+                ["ffmpeg", "-v", "error", "-y", "-i", str(self._blob_path(ref["digest"], "flac")),
+                 "-c:a", "pcm_s16le", "-f", "wav", str(temp_path)],
+                capture_output=True, check=False,
+            )
+            if result.returncode != 0:
+                temp_path.unlink(missing_ok=True)
+                raise RuntimeError(f"ffmpeg FLAC decode for {ref_path} failed: "
+                                   f"{result.stderr.decode(errors='replace').strip()}")
+            os.replace(temp_path, destination)
+        else:
+            temp_path = self._temp_path(destination)
+            with open(temp_path, "w", encoding="utf-8") as f:
+                f.write(self.read_text(ref_path))
+            os.replace(temp_path, destination)
+        return destination
+
+    def gc(self, roots: Iterable[Union[str, Path]], grace_seconds: float = GC_GRACE_SECONDS,
+           dry_run: bool = False) -> Dict:
+        """
+        Remove blobs that no ref under the given directories points to.
+
+        Blobs modified within grace_seconds are kept so a run that has stored a
+        blob but not yet written its ref does not lose it.
+        """
+        referenced = set()
+        ref_count = 0
+        for root in roots:
+            for ref_path in Path(root).rglob(f"*{REF_SUFFIX}"):
+                try:
+                    referenced.add(self.load_ref(ref_path)["digest"])
+                    ref_count += 1
+                except (OSError, json.JSONDecodeError, KeyError) as e:
+                    log.log_warning(f"Ignoring unreadable ref {ref_path}: {str(e)}")
+
+        now = time.time()
+        removed = 0
+        freed = 0
+        kept = 0
+        for blob_path in self.objects_dir.glob("*/*"):
+            digest = blob_path.name.split(".", 1)[0]
+            try:
+                stat = blob_path.stat()
+            except OSError:
+                continue
+            if digest in referenced or now - stat.st_mtime < grace_seconds:
+                kept += 1
+                continue
+            if not dry_run:
+                try:
+                    blob_path.unlink()
+                except OSError as e:
+                    log.log_warning(f"Could not remove {blob_path}: {str(e)}")
+                    continue
+            removed += 1
+            freed += stat.st_size
+
+        log.log_info(f"Artifact GC: {ref_count} refs, kept {kept} blobs, "
+                     f"{'would remove' if dry_run else 'removed'} {removed} ({freed / 1024 / 1024:.1f} MiB)")
+        return {"refs": ref_count, "kept": kept, "removed": removed, "freed_bytes": freed}
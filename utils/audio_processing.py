@@ -0,0 +1,302 @@
+import math
+import wave
+from pathlib import Path
+from typing import Iterator, List, Tuple, Union
+
+import numpy as np
+from scipy.signal import lfilter
+
+from logger import CustomLogger
+
+log = CustomLogger("AudioProcessing", log_file="audio_processing.log")
+
+TARGET_LUFS = -16.0  # Common loudness target for spoken-word podcasts
+MAX_GAIN_DB = 20.0
+PEAK_CEILING_DB = -1.0
+SILENCE_THRESHOLD_DB = -50.0
+SILENCE_PADDING_MS = 60
+DEFAULT_PAUSE_MS = 400
+
+# Analysis resolution. The processing block is a whole number of gating blocks,
+# and a gating block is a whole number of silence windows, so blocks can be
+# reshaped directly without carrying partial windows between reads.
+SILENCE_WINDOW_MS = 10
+GATING_BLOCK_MS = 400
+GATING_BLOCKS_PER_READ = 5
+
+ABSOLUTE_GATE_LUFS = -70.0
+RELATIVE_GATE_LU = -10.0
+
+
+class SegmentAnalysis:
+    """Result of the analysis pass over one segment."""
+
+    __slots__ = ("start_frame", "end_frame", "loudness", "peak")
+
+    def __init__(self, start_frame: int, end_frame: int, loudness: float, peak: float):
+        self.start_frame = start_frame
+        self.end_frame = end_frame
+        self.loudness = loudness
+        self.peak = peak
+
+
+def k_weighting_filters(sample_rate: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Biquad coefficients of the ITU-R BS.1770 K-weighting curve for any sample rate:
+    a high-shelf pre-filter followed by the RLB high-pass.
+    """
+    def high_shelf(gain_db: float, q: float, center: float):
+        a = 10 ** (gain_db / 40)
+        w0 = 2 * math.pi * center / sample_rate
+        alpha = math.sin(w0) / (2 * q)
+        cos_w0 = math.cos(w0)
+        sqrt_a = math.sqrt(a)
+        b = [a * ((a + 1) + (a - 1) * cos_w0 + 2 * sqrt_a * alpha),
+             -2 * a * ((a - 1) + (a + 1) * cos_w0),
+             a * ((a + 1) + (a - 1) * cos_w0 - 2 * sqrt_a * alpha)]
+        den = [(a + 1) - (a - 1) * cos_w0 + 2 * sqrt_a * alpha,
+               2 * ((a - 1) - (a + 1) * cos_w0),
+               (a + 1) - (a - 1) * cos_w0 - 2 * sqrt_a * alpha]
+        return np.array(b) / den[0], np.array(den) / den[0]
+
+    def high_pass(q: float, center: float):
+        w0 = 2 * math.pi * center / sample_rate
+        alpha = math.sin(w0) / (2 * q)
+        cos_w0 = math.cos(w0)
+        b = [(1 + cos_w0) / 2, -(1 + cos_w0), (1 + cos_w0) / 2]
+        den = [1 + alpha, -2 * cos_w0, 1 - alpha]
+        return np.array(b) / den[0], np.array(den) / den[0]
+
+    return [high_shelf(4.0, 1 / math.sqrt(2), 1500.0), high_pass(0.5, 38.0)]
+
+
+def _open_pcm16(file_path: Union[str, Path]) -> wave.Wave_read:
+    wav = wave.open(str(file_path), "rb")
+    if wav.getsampwidth() != 2:
+        wav.close()
+        raise ValueError(f"Only 16-bit PCM WAV segments are supported: {file_path}")
+    return wav
+
+
+def iter_pcm_blocks(wav: wave.Wave_read, block_frames: int) -> Iterator[np.ndarray]:
+    """Yield float32 blocks of shape (frames, channels) scaled to [-1, 1)."""
+    channels = wav.getnchannels()
+    while True:
+        frames = wav.readframes(block_frames)
+        if not frames:
+            break
+        samples = np.frombuffer(frames, dtype="<i2").reshape(-1, channels)
+        yield samples.astype(np.float32) / 32768.0
+
+
+def _gated_loudness(block_powers: List[float]) -> float:
+    """Integrated loudness of per-gating-block mean-square powers, with absolute and relative gates."""
+    powers = np.asarray(block_powers, dtype=np.float64)
+    if powers.size == 0:
+        return -math.inf
+
+    with np.errstate(divide="ignore"):
+        loudness = -0.691 + 10 * np.log10(powers)
+    powers = powers[loudness > ABSOLUTE_GATE_LUFS]
+    if powers.size == 0:
+        return -math.inf
+
+    relative_gate = -0.691 + 10 * math.log10(powers.mean()) + RELATIVE_GATE_LU
+    with np.errstate(divide="ignore"):
+        powers = powers[-0.691 + 10 * np.log10(powers) > relative_gate]
+    return -0.691 + 10 * math.log10(powers.mean())
+
+
+def analyze_segment(file_path: Union[str, Path],
+                    silence_threshold_db: float = SILENCE_THRESHOLD_DB,
+                    padding_ms: int = SILENCE_PADDING_MS) -> SegmentAnalysis:
+    """
+    Stream one segment to find its non-silent range, integrated loudness and peak level.
+    """
+    with _open_pcm16(file_path) as wav:
+        sample_rate = wav.getframerate()
+        window_frames = max(1, sample_rate * SILENCE_WINDOW_MS // 1000)
+        gating_frames = window_frames * (GATING_BLOCK_MS // SILENCE_WINDOW_MS)
+        block_frames = gating_frames * GATING_BLOCKS_PER_READ
+
+        threshold = 10 ** (silence_threshold_db / 20)
+        filters = k_weighting_filters(sample_rate)
+        filter_states = None
+
+        first_loud = None
+        last_loud = None
+        peak = 0.0
+        block_powers = []
+        partial_power = 0.0
+        partial_frames = 0
+        position = 0
+
+        for block in iter_pcm_blocks(wav, block_frames):
+            frames = block.shape[0]
+            peak = max(peak, float(np.abs(block).max()))
+
+            # Silence detection on RMS of short windows
+            whole = frames - frames % window_frames
+            windows = block[:whole].reshape(-1, window_frames, block.shape[1])
+            rms = np.sqrt(np.mean(np.square(windows), axis=(1, 2)))
+            if frames > whole:
+                rms = np.append(rms, np.sqrt(np.mean(np.square(block[whole:]))))
+            loud = np.flatnonzero(rms > threshold)
+            if loud.size:
+                if first_loud is None:
+                    first_loud = position + int(loud[0]) * window_frames
+                last_loud = position + min((int(loud[-1]) + 1) * window_frames, frames)
+
+            # Loudness: K-weighting with filter state carried across blocks
+            if filter_states is None:
+                filter_states = [np.zeros((max(len(a), len(b)) - 1, block.shape[1])) for b, a in filters]
+            weighted = block
+            for index, (b, a) in enumerate(filters):
+                weighted, filter_states[index] = lfilter(b, a, weighted, axis=0, zi=filter_states[index])
+
+            whole = frames - frames % gating_frames
+            if whole:
+                gated = weighted[:whole].reshape(-1, gating_frames, block.shape[1])
+                block_powers.extend(np.mean(np.square(gated), axis=1).sum(axis=1).tolist())
+            if frames > whole:
+                # Only the final read can be short; keep its power for very short segments
+                partial_power = float(np.mean(np.square(weighted[whole:]), axis=0).sum())
+                partial_frames = frames - whole
+
+            position += frames
+
+    if not block_powers and partial_frames:
+        block_powers.append(partial_power)
+
+    if first_loud is None:
+        return SegmentAnalysis(0, 0, -math.inf, peak)
+
+    padding = sample_rate * padding_ms // 1000
+    return SegmentAnalysis(
+        max(0, first_loud - padding),
+        min(position, last_loud + padding),
+        _gated_loudness(block_powers),
+        peak,
+    )
+
+
+def normalization_gain(analysis: SegmentAnalysis, target_lufs: float = TARGET_LUFS,
+                       max_gain_db: float = MAX_GAIN_DB,
+                       peak_ceiling_db: float = PEAK_CEILING_DB) -> float:
+    """Linear gain that brings a segment to the target loudness without exceeding the peak ceiling."""
+    if not math.isfinite(analysis.loudness):
+        return 1.0
+    gain_db = max(-max_gain_db, min(max_gain_db, target_lufs - analysis.loudness))
+    gain = 10 ** (gain_db / 20)
+    if analysis.peak > 0:
+        gain = min(gain, 10 ** (peak_ceiling_db / 20) / analysis.peak)
+    return gain
+
+
+def render_segment(file_path: Union[str, Path], pause_ms: int = DEFAULT_PAUSE_MS,
+                   target_lufs: float = TARGET_LUFS,
+                   silence_threshold_db: float = SILENCE_THRESHOLD_DB) -> Tuple[bytes, int, int]:
+    """
+    Trim and normalize one segment the way process_audio_segments does, followed
+    by pause_ms of silence, for episodes encoded segment by segment.
+
+    Returns:
+        16-bit PCM, sample rate and channel count (no audio for a silent segment)
+    """
+    analysis = analyze_segment(file_path, silence_threshold_db)
+    with _open_pcm16(file_path) as wav:
+        channels = wav.getnchannels()
+        sample_rate = wav.getframerate()
+        if analysis.end_frame <= analysis.start_frame:
+            log.log_warning(f"Segment is silent, skipping: {file_path}")
+            return b"", sample_rate, channels
+        gain = normalization_gain(analysis, target_lufs)
+        wav.setpos(analysis.start_frame)
+        samples = next(iter_pcm_blocks(wav, analysis.end_frame - analysis.start_frame))
+
+    pcm = np.clip(samples * gain * 32768.0, -32768, 32767).astype("<i2").tobytes()
+    pause_frames = sample_rate * pause_ms // 1000
+    return pcm + np.zeros((pause_frames, channels), dtype="<i2").tobytes(), sample_rate, channels
+
+
+def process_audio_segments(input_files: List[Union[str, Path]], output_file: Union[str, Path],
+                           pause_ms: int = DEFAULT_PAUSE_MS,
+                           target_lufs: float = TARGET_LUFS,
+                           silence_threshold_db: float = SILENCE_THRESHOLD_DB,
+                           block_seconds: float = 2.0) -> str:
+    """
+    Trim silence, normalize loudness and insert pauses between speech segments,
+    streaming them into a single WAV file.
+
+    Each segment is read twice in fixed-size blocks (analysis, then rendering), so
+    memory use depends on the block size rather than the episode length.
+
+    Args:
+        input_files: Ordered list of 16-bit PCM WAV segments
+        output_file: Path of the WAV file to write
+        pause_ms: Silence inserted between consecutive segments
+        target_lufs: Integrated loudness each segment is normalized to
+        silence_threshold_db: Level below which leading/trailing audio is trimmed
+        block_seconds: Approximate duration of each processing block
+    Returns:
+        Path to the processed WAV file
+    """
+    input_files = [Path(f) for f in input_files]
+    output_file = Path(output_file)
+    output_file.parent.mkdir(parents=True, exist_ok=True)
+
+    output = None
+    written = 0
+    try:
+        for file_path in input_files:
+            try:
+                analysis = analyze_segment(file_path, silence_threshold_db)
+            except (wave.Error, ValueError, EOFError) as e:
+                log.log_error(f"Error analyzing {file_path}: {str(e)}")
+                continue
+
+            if analysis.end_frame <= analysis.start_frame:
+                log.log_warning(f"Segment is silent, skipping: {file_path}")
+                continue
+
+            gain = normalization_gain(analysis, target_lufs)
+            log.log_debug(f"{file_path.name}: loudness {analysis.loudness:.1f} LUFS, gain {20 * math.log10(gain):+.1f} dB, "
+                          f"frames {analysis.start_frame}-{analysis.end_frame}")
+
+            with _open_pcm16(file_path) as wav:
+                params = (wav.getnchannels(), wav.getsampwidth(), wav.getframerate())
+                if output is None:
+                    output = wave.open(str(output_file), "wb")
+                    output.setnchannels(params[0])
+                    output.setsampwidth(params[1])
+                    output.setframerate(params[2])
+                    output_params = params
+                elif params != output_params:
+                    log.log_error(f"Segment format {params} does not match {output_params}, skipping: {file_path}")
+                    continue
+
+                channels, _, sample_rate = params
+                if written:
+                    pause_frames = sample_rate * pause_ms // 1000
+                    output.writeframes(np.zeros((pause_frames, channels), dtype="<i2").tobytes())
+
+                block_frames = max(1, int(sample_rate * block_seconds))
+                wav.setpos(analysis.start_frame)
+                remaining = analysis.end_frame - analysis.start_frame
+                for block in iter_pcm_blocks(wav, min(block_frames, remaining)):
+                    block = block[:remaining]
+                    remaining -= block.shape[0]
+                    pcm = np.clip(block * gain * 32768.0, -32768, 32767).astype("<i2")
+                    output.writeframes(pcm.tobytes())
+                    if remaining <= 0:
+                        break
+                written += 1
+    finally:
+        if output is not None:
+            output.close()
+
+    if not written:
+        raise ValueError("No audio segments could be processed")
+
+    log.log_info(f"Processed {written} segments into {output_file}")
+    return str(output_file)
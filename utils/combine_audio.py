@@ -1,18 +1,49 @@
 import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from pydub import AudioSegment
-from typing import List, Union
+from typing import List, Optional, Union
 from logger import CustomLogger
+from utils.multi_export import ExportTarget, export_pcm, iter_pcm_blocks
+from utils.parallel_encode import DEFAULT_BITRATE, encode_mp3_parallel
 
 log = CustomLogger("CombineAudio", log_file="combine_audio.log")
 
-def combine_audio_files(input_files: List[Union[str, Path]], output_file: Union[str, Path]) -> str:
+def combine_and_export(input_files: List[Path], output_file: Path, exports: List[ExportTarget],
+                       parallel_encode: bool = False, encode_workers: Optional[int] = None) -> str:
+    """
+    Write the combined MP3 and every export target from a single read of the inputs.
+
+    A single WAV input with parallel_encode still gets its main MP3 from the
+    sectioned parallel encoder, alongside the export pass; otherwise the main
+    MP3 is one more encoder fed by the pass.
+    """
+    if parallel_encode and len(input_files) == 1 and input_files[0].suffix.lower() == '.wav':
+        sample_rate, channels, blocks = iter_pcm_blocks(input_files)
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            main_encode = executor.submit(encode_mp3_parallel, input_files[0], output_file, workers=encode_workers)
+            export_pcm(blocks, sample_rate, channels, exports)
+            return main_encode.result()
+
+    sample_rate, channels, blocks = iter_pcm_blocks(input_files)
+    export_pcm(blocks, sample_rate, channels, [ExportTarget("mp3", output_file, DEFAULT_BITRATE)] + exports)
+    log.log_debug(f"Combined audio saved as: {output_file}")
+    return str(output_file)
+
+
+def combine_audio_files(input_files: List[Union[str, Path]], output_file: Union[str, Path],
+                        parallel_encode: bool = False, encode_workers: Optional[int] = None,
+                        exports: Optional[List[ExportTarget]] = None) -> str:
     """
     Combine multiple audio files into a single MP3 file.
     
     Args:
         input_files: List of paths to input audio files
         output_file: Path where the combined audio should be saved
+        parallel_encode: Encode frame-aligned sections of the episode in a process pool
+        encode_workers: Number of encoder processes (defaults to the CPU count)
+        exports: Further outputs (MP3 variants, Opus, waveform peaks) written from the same read of the inputs
     """
     log.log_debug("Starting audio combination process...")
     
@@ -23,6 +54,14 @@ def combine_audio_files(input_files: List[Union[str, Path]], output_file: Union[
     # Ensure output directory exists
     output_file.parent.mkdir(parents=True, exist_ok=True)
 
+    if exports:
+        return combine_and_export(input_files, output_file, exports,
+                                  parallel_encode=parallel_encode, encode_workers=encode_workers)
+
+    # A single WAV input (e.g. the normalized episode) can be encoded directly
+    if parallel_encode and len(input_files) == 1 and input_files[0].suffix.lower() == '.wav':
+        return encode_mp3_parallel(input_files[0], output_file, workers=encode_workers)
+
     # Initialize an empty AudioSegment
     log.log_debug("Initializing an empty AudioSegment...")
     combined = AudioSegment.empty()
@@ -54,7 +93,16 @@ def combine_audio_files(input_files: List[Union[str, Path]], output_file: Union[
 
     # Export the combined audio to a file
     log.log_debug(f"Exporting combined audio to {output_file}...")
-    combined.export(str(output_file), format="mp3")
+    if parallel_encode:
+        fd, temp_wav = tempfile.mkstemp(suffix=".wav", dir=output_file.parent)
+        os.close(fd)
+        try:
+            combined.set_sample_width(2).export(temp_wav, format="wav")
+            encode_mp3_parallel(temp_wav, output_file, workers=encode_workers)
+        finally:
+            os.remove(temp_wav)
+    else:
+        combined.export(str(output_file), format="mp3")
     log.log_debug(f"Combined audio saved as: {output_file}")
 
     return str(output_file)
\ No newline at end of file
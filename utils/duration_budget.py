@@ -0,0 +1,153 @@
+import wave
+from bisect import bisect_right
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from logger import CustomLogger
+from utils.script_parser import Turn
+
+log = CustomLogger("DurationBudget", log_file="duration_budget.log")
+
+SPEECH_CHARS_PER_SECOND = 15.0  # About 150 words a minute, used until a voice has been measured
+SECTION_TURNS = 8  # Turns per section in scripts without headings
+
+
+class DurationModel:
+    """
+    Predicts how long turns take to speak from characters per second per voice,
+    plus the pause inserted after every turn.
+
+    Args:
+        chars_per_second: Measured speaking rate of each voice
+        pause_seconds: Pause after every turn (when audio is normalized)
+    """
+
+    def __init__(self, chars_per_second: Dict[str, float], pause_seconds: float = 0.0):
+        self.chars_per_second = dict(chars_per_second)
+        self.pause_seconds = pause_seconds
+        # Voices not measured yet speak at the average rate of those that were
+        self.default_rate = (sum(self.chars_per_second.values()) / len(self.chars_per_second)
+                             if self.chars_per_second else SPEECH_CHARS_PER_SECOND)
+
+    def turn_seconds(self, voice: str, text: str) -> float:
+        return len(text) / self.chars_per_second.get(voice, self.default_rate) + self.pause_seconds
+
+    def predict(self, segments: Sequence[Tuple[int, str, str]]) -> float:
+        """Predicted length in seconds of (index, voice, text) segments."""
+        return sum(self.turn_seconds(voice, text) for _, voice, text in segments)
+
+
+def measure_speech(segments: Sequence[Tuple[int, str, str]], audio_dir: Path) -> Dict[str, Dict[str, float]]:
+    """
+    Characters and seconds of synthesized speech per voice, from the segment
+    WAV files of a run, to calibrate the model of later runs.
+    """
+    chars: Dict[str, float] = {}
+    seconds: Dict[str, float] = {}
+    for index, voice, text in segments:
+        segment_file = audio_dir / f"segment_{index:03d}.wav"
+        if not segment_file.exists():
+            continue
+        with wave.open(str(segment_file), "rb") as wav:
+            length = wav.getnframes() / wav.getframerate()
+        chars[voice] = chars.get(voice, 0) + len(text)
+        seconds[voice] = round(seconds.get(voice, 0.0) + length, 3)
+    return {"chars": chars, "seconds": seconds}
+
+
+def turn_sections(script: str, turns: List[Turn]) -> List[int]:
+    """
+    Section number of every turn. Markdown headings start a new section;
+    scripts without headings are cut into sections of SECTION_TURNS turns.
+    """
+    headings = [number for number, line in enumerate(script.split("\n"), start=1) if line.strip().startswith("#")]
+    if headings:
+        return [bisect_right(headings, turn.line_number) for turn in turns]
+    return [index // SECTION_TURNS for index in range(len(turns))]
+
+
+def exchanges(segments: Sequence[Tuple[int, str, str]]) -> List[List[Tuple[int, str, str]]]:
+    """Group turns into exchanges: a turn and the reply of another speaker, or a turn on its own."""
+    grouped = []
+    position = 0
+    while position < len(segments):
+        if position + 1 < len(segments) and segments[position][1] != segments[position + 1][1]:
+            grouped.append([segments[position], segments[position + 1]])
+            position += 2
+        else:
+            grouped.append([segments[position]])
+            position += 1
+    return grouped
+
+
+def select_turns_to_trim(segments: Sequence[Tuple[int, str, str]], sections: List[int],
+                         model: DurationModel, target_seconds: float) -> List[int]:
+    """
+    Pick the turns to leave out so the predicted length fits the target.
+
+    The first and last sections (introduction and closing remarks) are never
+    trimmed. The others rank lower the later they come, as outlines lead with
+    the main points. Exchanges are dropped from the end of the lowest-ranked
+    section first, then of the next one. An exchange is two consecutive turns
+    by different speakers (a question and its answer), or a single turn where
+    the same speaker goes on, so no answer is left without its question.
+
+    Returns:
+        Indexes of the segments to drop; may not reach the target if the
+        protected sections alone are longer
+    """
+    remaining = model.predict(segments)
+    by_section: Dict[int, List[Tuple[int, str, str]]] = {}
+    for segment in segments:
+        by_section.setdefault(sections[segment[0]], []).append(segment)
+
+    dropped = []
+    for section in sorted(by_section)[1:-1][::-1]:
+        for exchange in reversed(exchanges(by_section[section])):
+            if remaining <= target_seconds:
+                return dropped
+            remaining -= model.predict(exchange)
+            dropped.extend(index for index, _, _ in exchange)
+    return dropped
+
+
+def remove_turns(script: str, turns: List[Turn], drop: Sequence[int]) -> str:
+    """Remove the lines of the given turns from the script, keeping headings."""
+    lines = script.split("\n")
+    keep = [True] * len(lines)
+    starts = [turn.line_number for turn in turns] + [len(lines) + 1]
+    for index in drop:
+        for number in range(starts[index], starts[index + 1]):
+            if not lines[number - 1].strip().startswith("#"):
+                keep[number - 1] = False
+    return "\n".join(line for line, kept in zip(lines, keep) if kept)
+
+
+def budget_script(script: str, turns: List[Turn], segments: Sequence[Tuple[int, str, str]],
+                  model: DurationModel, target_seconds: Optional[float] = None) -> Tuple[str, Dict]:
+    """
+    Predict the episode length and, with a target, trim the script to fit it.
+
+    Args:
+        turns: The parsed turns of the script
+        segments: The turns to synthesize, as from speech_segments
+    Returns:
+        The script to synthesize and a report of the prediction and trimming
+    """
+    predicted = model.predict(segments)
+    report = {"predicted_seconds": round(predicted, 1), "target_seconds": target_seconds,
+              "chars_per_second": {voice: round(rate, 2) for voice, rate in model.chars_per_second.items()},
+              "trimmed_turns": 0}
+    if target_seconds is None or predicted <= target_seconds:
+        return script, report
+
+    drop = select_turns_to_trim(segments, turn_sections(script, turns), model, target_seconds)
+    kept = [segment for segment in segments if segment[0] not in set(drop)]
+    report["trimmed_turns"] = len(drop)
+    report["trimmed_seconds"] = round(predicted - model.predict(kept), 1)
+    report["predicted_seconds"] = round(model.predict(kept), 1)
+    if report["predicted_seconds"] > target_seconds:
+        log.log_warning(f"Script is predicted at {report['predicted_seconds']:.0f}s even after trimming, "
+                        f"the opening and closing sections alone exceed the {target_seconds:.0f}s target")
+    log.log_info(f"Trimmed {len(drop)} turns ({report['trimmed_seconds']:.0f}s) to fit the {target_seconds:.0f}s target")
+    return remove_turns(script, turns, drop), report
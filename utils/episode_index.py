@@ -0,0 +1,308 @@
+import difflib
+import hashlib
+import json
+import os
+import subprocess
+import wave
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+from logger import CustomLogger
+from utils.artifact_store import REF_SUFFIX
+from utils.audio_processing import DEFAULT_PAUSE_MS, render_segment
+from utils.multi_export import ExportTarget, export_pcm
+from utils.parallel_encode import DEFAULT_BITRATE, encode_pcm_to_mp3_frames, iter_mp3_frames, mp3_frame_samples
+
+log = CustomLogger("EpisodeIndex", log_file="episode_index.log")
+
+INDEX_NAME = "segments_index.json"
+INDEX_VERSION = 1
+READ_BYTES = 1 << 20  # Block size when decoding the episode for exports
+
+
+def segment_key(voice: str, text: str) -> str:
+    """Identity of a speaker turn: the same text in the same voice renders to the same audio."""
+    return hashlib.sha256(f"{voice}\n{text}".encode("utf-8")).hexdigest()
+
+
+def segment_file(audio_dir: Path, index: int) -> Path:
+    return audio_dir / f"segment_{index:03d}.wav"
+
+
+def encode_segment(wav_file: str, normalize: bool, pause_ms: int, bitrate: str) -> Tuple[bytes, int, int]:
+    """
+    Encode one segment WAV on its own into self-contained MP3 frames; normalized
+    segments are trimmed, levelled and followed by their pause first.
+
+    Returns:
+        MP3 frames, sample rate and channel count
+    """
+    if normalize:
+        pcm, sample_rate, channels = render_segment(wav_file, pause_ms=pause_ms)
+    else:
+        with wave.open(wav_file, "rb") as wav:
+            if wav.getsampwidth() != 2:
+                raise ValueError(f"Only 16-bit PCM WAV segments can be indexed: {wav_file}")
+            sample_rate, channels = wav.getframerate(), wav.getnchannels()
+            pcm = wav.readframes(wav.getnframes())
+    if not pcm:
+        return b"", sample_rate, channels
+    return encode_pcm_to_mp3_frames(pcm, sample_rate, channels, bitrate), sample_rate, channels
+
+
+def encode_segments(wav_files: List[Path], normalize: bool, pause_ms: int, bitrate: str,
+                    workers: Optional[int] = None) -> List[Tuple[bytes, int, int]]:
+    """encode_segment for many files across a process pool, in input order."""
+    workers = min(workers or os.cpu_count() or 1, max(1, len(wav_files)))
+    if workers == 1:
+        return [encode_segment(str(f), normalize, pause_ms, bitrate) for f in wav_files]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(encode_segment, [str(f) for f in wav_files], [normalize] * len(wav_files),
+                                 [pause_ms] * len(wav_files), [bitrate] * len(wav_files)))
+
+
+def _check_format(index: Dict, sample_rate: int, channels: int, wav_file: Path) -> None:
+    if index["sample_rate"] is None:
+        index["sample_rate"], index["channels"] = sample_rate, channels
+    elif (sample_rate, channels) != (index["sample_rate"], index["channels"]):
+        raise ValueError(f"{wav_file} is {sample_rate} Hz / {channels} channels, the episode is "
+                         f"{index['sample_rate']} Hz / {index['channels']} channels")
+
+
+def _write_atomic(path: Path, write) -> None:
+    temp_path = path.with_name(f".{path.name}.tmp")
+    try:
+        with open(temp_path, "wb") as f:
+            write(f)
+        os.replace(temp_path, path)
+    finally:
+        if temp_path.exists():
+            temp_path.unlink()
+
+
+def _layout_episode(index: Dict, chunks: List[bytes]) -> None:
+    """Record where each chunk will sit in the episode in its index entry."""
+    frame_samples = mp3_frame_samples(index["sample_rate"] or 24000)
+    offset = 0
+    frames = 0
+    for entry, chunk in zip(index["segments"], chunks):
+        entry["offset"] = offset
+        entry["length"] = len(chunk)
+        entry["start_ms"] = round(frames * frame_samples * 1000 / index["sample_rate"]) if index["sample_rate"] else 0
+        entry["frames"] = sum(1 for _ in iter_mp3_frames(chunk))
+        offset += len(chunk)
+        frames += entry["frames"]
+    if offset == 0:
+        raise ValueError("No audio files were successfully combined")
+
+
+def _write_episode(output_file: Path, index: Dict, chunks: List[bytes]) -> Dict:
+    """Write the concatenated chunks and the index that locates each one in the file."""
+    _layout_episode(index, chunks)
+
+    def write_chunks(f):
+        for chunk in chunks:
+            f.write(chunk)
+
+    output_file.parent.mkdir(parents=True, exist_ok=True)
+    _write_atomic(output_file, write_chunks)
+    _write_atomic(output_file.with_name(INDEX_NAME),
+                  lambda f: f.write(json.dumps(index, indent=2).encode("utf-8")))
+    return index
+
+
+def build_indexed_episode(segments: List[Tuple[int, str, str]], audio_dir: Union[str, Path],
+                          output_file: Union[str, Path], normalize: bool = False,
+                          pause_ms: int = DEFAULT_PAUSE_MS, bitrate: str = DEFAULT_BITRATE,
+                          workers: Optional[int] = None) -> Dict:
+    """
+    Encode every segment separately and concatenate the frames into the episode,
+    writing a segment offset index next to it so rerender_episode can later
+    splice in changed turns without re-encoding the rest.
+
+    Args:
+        segments: (segment index, voice, text) of the turns, as from speech_segments
+        audio_dir: Directory holding segment_<index>.wav
+        output_file: Path of the MP3 file to write
+    Returns:
+        The index
+    """
+    audio_dir = Path(audio_dir)
+    output_file = Path(output_file)
+    present = []
+    for segment in segments:
+        if segment_file(audio_dir, segment[0]).exists():
+            present.append(segment)
+        else:
+            log.log_warning(f"Segment {segment[0]} has no audio, leaving it out of the episode")
+
+    index = {"version": INDEX_VERSION, "episode": output_file.name, "bitrate": bitrate,
+             "sample_rate": None, "channels": None, "normalize": normalize, "pause_ms": pause_ms, "segments": []}
+    encoded = encode_segments([segment_file(audio_dir, i) for i, _, _ in present], normalize, pause_ms, bitrate, workers)
+    for (i, voice, text), (_, sample_rate, channels) in zip(present, encoded):
+        _check_format(index, sample_rate, channels, segment_file(audio_dir, i))
+        index["segments"].append({"index": i, "voice": voice, "text_sha256": segment_key(voice, text),
+                                  "wav": segment_file(audio_dir, i).name})
+
+    _write_episode(output_file, index, [frames for frames, _, _ in encoded])
+    log.log_info(f"Encoded {len(present)} segments into {output_file} with a segment index")
+    return index
+
+
+def load_index(audio_dir: Union[str, Path]) -> Dict:
+    index_path = Path(audio_dir) / INDEX_NAME
+    if not index_path.exists():
+        raise FileNotFoundError(f"No segment index at {index_path}, generate the episode with --segment-index first")
+    with open(index_path, "r", encoding="utf-8") as f:
+        index = json.load(f)
+    if index.get("version") != INDEX_VERSION:
+        raise ValueError(f"Unsupported segment index version {index.get('version')} in {index_path}")
+    return index
+
+
+def diff_segments(index: Dict, segments: List[Tuple[int, str, str]]) -> Tuple[List[Optional[Dict]], List[Dict]]:
+    """
+    Match the turns of a new script against the indexed episode.
+
+    Returns:
+        For every new segment, the index entry whose audio it reuses or None if it
+        must be synthesized, and the entries no new segment reuses
+    """
+    old_keys = [entry["text_sha256"] for entry in index["segments"]]
+    new_keys = [segment_key(voice, text) for _, voice, text in segments]
+    reused: List[Optional[Dict]] = [None] * len(segments)
+    matched = set()
+    matcher = difflib.SequenceMatcher(None, old_keys, new_keys, autojunk=False)
+    for tag, old_start, old_end, new_start, _ in matcher.get_opcodes():
+        if tag == "equal":
+            for offset in range(old_end - old_start):
+                reused[new_start + offset] = index["segments"][old_start + offset]
+                matched.add(old_start + offset)
+    removed = [entry for position, entry in enumerate(index["segments"]) if position not in matched]
+    return reused, removed
+
+
+def _move_segment(source: Path, destination: Path) -> None:
+    """Move a segment WAV, or the artifact store ref standing in for it."""
+    if source.exists():
+        os.replace(source, destination)
+        return
+    source_ref = source.with_name(source.name + REF_SUFFIX)
+    if source_ref.exists():
+        with open(source_ref, "r", encoding="utf-8") as f:
+            ref = json.load(f)
+        # The ref names the file it restores to
+        ref["name"] = destination.name
+        with open(destination.with_name(destination.name + REF_SUFFIX), "w", encoding="utf-8") as f:
+            json.dump(ref, f, indent=2)
+        source_ref.unlink()
+
+
+def _remove_segment(wav_file: Path) -> None:
+    wav_file.unlink(missing_ok=True)
+    wav_file.with_name(wav_file.name + REF_SUFFIX).unlink(missing_ok=True)
+
+
+def rerender_episode(index: Dict, segments: List[Tuple[int, str, str]], reused: List[Optional[Dict]],
+                     removed: List[Dict], audio_dir: Union[str, Path], staging_dir: Union[str, Path],
+                     workers: Optional[int] = None) -> Dict:
+    """
+    Rebuild the indexed episode for a new list of segments: the audio of reused
+    turns is copied byte for byte from the current episode, the newly
+    synthesized turns waiting in staging_dir are encoded and spliced in at
+    segment boundaries. Segment WAVs are renumbered to the new turn indexes and
+    those of removed turns deleted before the episode and its index are written.
+
+    Returns:
+        The new index
+    """
+    audio_dir = Path(audio_dir)
+    staging_dir = Path(staging_dir)
+    episode_file = audio_dir / index["episode"]
+
+    fresh = [segment for segment, entry in zip(segments, reused) if entry is None
+             and segment_file(staging_dir, segment[0]).exists()]
+    for segment, entry in zip(segments, reused):
+        if entry is None and segment not in fresh:
+            log.log_warning(f"Segment {segment[0]} has no audio, leaving it out of the episode")
+    encoded = encode_segments([segment_file(staging_dir, i) for i, _, _ in fresh],
+                              index["normalize"], index["pause_ms"], index["bitrate"], workers)
+    fresh_frames = {}
+    for (i, _, _), (frames, sample_rate, channels) in zip(fresh, encoded):
+        _check_format(index, sample_rate, channels, segment_file(staging_dir, i))
+        fresh_frames[i] = frames
+
+    new_index = dict(index, segments=[])
+    chunks = []
+    moves = []
+    with open(episode_file, "rb") as episode:
+        for (i, voice, text), entry in zip(segments, reused):
+            if entry is not None:
+                episode.seek(entry["offset"])
+                chunks.append(episode.read(entry["length"]))
+                moves.append((audio_dir / entry["wav"], segment_file(staging_dir, i)))
+            elif i in fresh_frames:
+                chunks.append(fresh_frames[i])
+            else:
+                continue
+            new_index["segments"].append({"index": i, "voice": voice, "text_sha256": segment_key(voice, text),
+                                          "wav": segment_file(audio_dir, i).name})
+
+    # Everything that can fail on the audio is done before any WAV is touched: a
+    # failed rerender leaves the current episode, its index and its WAVs as they were
+    _layout_episode(new_index, chunks)
+    temp_episode = episode_file.with_name(f".{episode_file.name}.rerender.tmp")
+    try:
+        with open(temp_episode, "wb") as f:
+            for chunk in chunks:
+                f.write(chunk)
+
+        # Park the reused WAVs under their new index until the old ones are cleared out
+        parked = []
+        try:
+            for source, destination in moves:
+                _move_segment(source, destination)
+                parked.append((source, destination))
+        except OSError:
+            for source, destination in reversed(parked):
+                _move_segment(destination, source)
+            raise
+        for entry in removed:
+            _remove_segment(audio_dir / entry["wav"])
+        for entry in new_index["segments"]:
+            _remove_segment(audio_dir / entry["wav"])
+            _move_segment(segment_file(staging_dir, entry["index"]), audio_dir / entry["wav"])
+
+        # Written last, so the index never names WAVs that are not in place yet
+        os.replace(temp_episode, episode_file)
+    finally:
+        temp_episode.unlink(missing_ok=True)
+    _write_atomic(episode_file.with_name(INDEX_NAME),
+                  lambda f: f.write(json.dumps(new_index, indent=2).encode("utf-8")))
+    reused_count = sum(1 for entry in reused if entry is not None)
+    log.log_info(f"Re-rendered {episode_file}: {reused_count} turns reused, "
+                 f"{len(fresh)} synthesized, {len(removed)} removed")
+    return new_index
+
+
+def export_episode(episode_file: Union[str, Path], index: Dict, targets: List[ExportTarget]) -> Dict[str, str]:
+    """Write export targets from one decode of the indexed episode."""
+    sample_rate, channels = index["sample_rate"], index["channels"]
+    decoder = subprocess.Popen(["ffmpeg", "-v", "error", "-i", str(episode_file), "-f", "s16le",
+                                "-ar", str(sample_rate), "-ac", str(channels), "pipe:1"],
+                               stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+    def blocks():
+        while True:
+            block = decoder.stdout.read(READ_BYTES)
+            if not block:
+                break
+            yield block
+
+    try:
+        return export_pcm(blocks(), sample_rate, channels, targets)
+    finally:
+        decoder.stdout.close()
+        if decoder.wait() != 0:
+            log.log_error(f"ffmpeg decode of {episode_file} exited with {decoder.returncode}")
@@ -0,0 +1,143 @@
+import gzip
+import hashlib
+import os
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Union
+
+from logger import CustomLogger
+
+log = CustomLogger("ExtractionCache", log_file="extraction_cache.log")
+
+# Bump whenever extraction or normalization output (or the entry format) changes
+EXTRACTION_VERSION = 3
+
+HASH_CHUNK_SIZE = 1024 * 1024
+COMPRESS_LEVEL = 1  # Entries are written by every extraction, so favour speed over ratio
+MAX_UNUSED_SECONDS = 30 * 24 * 3600  # prune() removes entries not read or written for this long
+PRUNE_GRACE_SECONDS = 3600  # Temporary files younger than this may belong to a running extraction
+
+
+class ExtractionCache:
+    """
+    On-disk cache of extracted document text, keyed by the hash of the source
+    file contents so renamed or copied files are not extracted twice.
+
+    Entries are gzip-compressed. Reading an entry marks it as used (its access
+    time), while its modification time stays the time it was extracted; prune()
+    removes entries that have not been used for a while.
+    """
+
+    def __init__(self, cache_dir: Union[str, Path]):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def key_for_file(file_path: Union[str, Path]) -> str:
+        digest = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    @staticmethod
+    def key_for_url(url: str) -> str:
+        # Prefixed so a URL can never collide with the hash of a file's contents
+        return hashlib.sha256(f"url:{url}".encode("utf-8")).hexdigest()
+
+    def _entry_path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}_v{EXTRACTION_VERSION}.txt.gz"
+
+    def get(self, key: str, max_age: Optional[float] = None) -> Optional[str]:
+        """
+        Args:
+            max_age: Seconds after which an entry is ignored, for sources that can change (web pages)
+        """
+        entry_path = self._entry_path(key)
+        try:
+            modified = entry_path.stat().st_mtime
+            if max_age is not None and time.time() - modified > max_age:
+                return None
+            with gzip.open(entry_path, "rt", encoding="utf-8") as f:
+                content = f.read()
+            os.utime(entry_path, (time.time(), modified))
+            return content
+        except FileNotFoundError:
+            return None
+        except (OSError, EOFError, UnicodeDecodeError) as e:
+            log.log_warning(f"Ignoring unreadable cache entry {entry_path}: {str(e)}")
+            return None
+
+    def put(self, key: str, content: str) -> None:
+        entry_path = self._entry_path(key)
+        temp_path = entry_path.with_suffix(f".{os.getpid()}.tmp")
+        with gzip.open(temp_path, "wt", encoding="utf-8", compresslevel=COMPRESS_LEVEL) as f:
+            f.write(content)
+        os.replace(temp_path, entry_path)
+
+    def put_blocks(self, key: str, blocks: Iterable[Optional[str]]) -> int:
+        """
+        Store text arriving in blocks, as from document_processor.normalize_blocks,
+        without holding all of it; a None block discards what was written so far.
+        Nothing is stored if the blocks are empty.
+
+        Returns:
+            Characters stored
+        """
+        entry_path = self._entry_path(key)
+        temp_path = entry_path.with_suffix(f".{os.getpid()}.tmp")
+        written = 0
+        f = gzip.open(temp_path, "wt", encoding="utf-8", compresslevel=COMPRESS_LEVEL)
+        try:
+            for block in blocks:
+                if block is None:
+                    # A compressed stream cannot be truncated, start a new one
+                    f.close()
+                    f = gzip.open(temp_path, "wt", encoding="utf-8", compresslevel=COMPRESS_LEVEL)
+                    written = 0
+                    continue
+                f.write(block)
+                written += len(block)
+            f.close()
+            if written:
+                os.replace(temp_path, entry_path)
+            return written
+        finally:
+            f.close()
+            temp_path.unlink(missing_ok=True)
+
+    def prune(self, max_unused_seconds: float = MAX_UNUSED_SECONDS, dry_run: bool = False) -> Dict:
+        """
+        Remove entries not used within max_unused_seconds, entries of earlier
+        EXTRACTION_VERSIONs and temporary files left behind by interrupted extractions.
+        """
+        now = time.time()
+        current_suffix = f"_v{EXTRACTION_VERSION}.txt.gz"
+        removed = 0
+        freed = 0
+        kept = 0
+        for path in self.cache_dir.iterdir():
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            if path.name.endswith(".tmp"):
+                stale = now - stat.st_mtime >= PRUNE_GRACE_SECONDS
+            else:
+                stale = (not path.name.endswith(current_suffix)
+                         or now - max(stat.st_atime, stat.st_mtime) > max_unused_seconds)
+            if not stale:
+                kept += 1
+                continue
+            if not dry_run:
+                try:
+                    path.unlink()
+                except OSError as e:
+                    log.log_warning(f"Could not remove {path}: {str(e)}")
+                    continue
+            removed += 1
+            freed += stat.st_size
+
+        log.log_info(f"Extraction cache prune: kept {kept} entries, "
+                     f"{'would remove' if dry_run else 'removed'} {removed} ({freed / 1024 / 1024:.1f} MiB)")
+        return {"kept": kept, "removed": removed, "freed_bytes": freed}
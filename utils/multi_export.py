@@ -0,0 +1,238 @@
+import json
+import os
+import subprocess
+import tempfile
+import wave
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+from pydub import AudioSegment
+
+from logger import CustomLogger
+
+log = CustomLogger("MultiExport", log_file="multi_export.log")
+
+DEFAULT_MP3_BITRATE = "128k"
+DEFAULT_OPUS_BITRATE = "32k"  # Transparent for speech
+OPUS_SAMPLE_RATE = 48000  # libopus only takes 8/12/16/24/48 kHz, resample once to the native rate
+PEAKS_SAMPLES_PER_PIXEL = 512
+READ_FRAMES = 65536  # Frames read per block of the PCM pass
+
+FORMAT_EXTENSIONS = {"mp3": ".mp3", "opus": ".opus", "peaks": ".peaks.json"}
+
+
+class ExportTarget:
+    """One output of the PCM pass: an MP3 or Opus encode, or waveform peaks."""
+
+    __slots__ = ("format", "path", "bitrate", "samples_per_pixel")
+
+    def __init__(self, format: str, path: Union[str, Path], bitrate: Optional[str] = None,
+                 samples_per_pixel: int = PEAKS_SAMPLES_PER_PIXEL):
+        if format not in FORMAT_EXTENSIONS:
+            raise ValueError(f"Unsupported export format: {format}")
+        self.format = format
+        self.path = Path(path)
+        self.bitrate = bitrate or (DEFAULT_OPUS_BITRATE if format == "opus" else DEFAULT_MP3_BITRATE)
+        self.samples_per_pixel = samples_per_pixel
+
+    def __repr__(self):
+        return f"ExportTarget({self.format!r}, {str(self.path)!r})"
+
+
+def parse_export_spec(spec: str, output_file: Union[str, Path]) -> ExportTarget:
+    """
+    Turn a spec like "mp3:64k", "opus" or "peaks:256" into a target written next
+    to output_file, named after its stem and the bitrate (podcast_combined_64k.mp3).
+    """
+    output_file = Path(output_file)
+    format, _, option = spec.strip().lower().partition(":")
+    if format not in FORMAT_EXTENSIONS:
+        raise ValueError(f"Unsupported export format '{format}', expected one of {', '.join(FORMAT_EXTENSIONS)}")
+    if format == "peaks":
+        return ExportTarget("peaks", output_file.with_name(output_file.stem + FORMAT_EXTENSIONS["peaks"]),
+                            samples_per_pixel=int(option) if option else PEAKS_SAMPLES_PER_PIXEL)
+    target = ExportTarget(format, output_file, bitrate=option or None)
+    target.path = output_file.with_name(f"{output_file.stem}_{target.bitrate}{FORMAT_EXTENSIONS[format]}")
+    return target
+
+
+def iter_pcm_blocks(input_files: List[Path]) -> Tuple[int, int, Iterator[bytes]]:
+    """
+    Stream the 16-bit PCM of several audio files back to back.
+
+    WAV files in the format of the first file are read block by block. Other
+    files (MP3, or WAV in another format) are decoded and converted to it.
+
+    Returns:
+        Sample rate, channel count and an iterator of PCM blocks
+    """
+    readable = [f for f in input_files if f.suffix.lower() in (".wav", ".mp3")]
+    for f in input_files:
+        if f not in readable:
+            log.log_warning(f"Unsupported file format: {f}")
+    if not readable:
+        raise ValueError("No audio files were successfully combined")
+
+    first = readable[0]
+    if first.suffix.lower() == ".wav":
+        with wave.open(str(first), "rb") as wav:
+            sample_rate, channels = wav.getframerate(), wav.getnchannels()
+    else:
+        audio = AudioSegment.from_mp3(str(first))
+        sample_rate, channels = audio.frame_rate, audio.channels
+
+    def blocks() -> Iterator[bytes]:
+        for file_path in readable:
+            try:
+                if file_path.suffix.lower() == ".wav":
+                    with wave.open(str(file_path), "rb") as wav:
+                        if (wav.getframerate(), wav.getnchannels(), wav.getsampwidth()) == (sample_rate, channels, 2):
+                            while True:
+                                block = wav.readframes(READ_FRAMES)
+                                if not block:
+                                    break
+                                yield block
+                            continue
+                    audio = AudioSegment.from_wav(str(file_path))
+                else:
+                    audio = AudioSegment.from_mp3(str(file_path))
+                yield audio.set_frame_rate(sample_rate).set_channels(channels).set_sample_width(2).raw_data
+            except Exception as e:
+                log.log_error(f"Error processing {file_path}: {str(e)}")
+
+    return sample_rate, channels, blocks()
+
+
+def _encoder_command(target: ExportTarget, sample_rate: int, channels: int) -> List[str]:
+    command = ["ffmpeg", "-v", "error", "-y",
+               "-f", "s16le", "-ar", str(sample_rate), "-ac", str(channels), "-i", "pipe:0"]
+    if target.format == "mp3":
+        command += ["-c:a", "libmp3lame", "-b:a", target.bitrate, "-f", "mp3"]
+    else:
+        command += ["-c:a", "libopus", "-b:a", target.bitrate, "-application", "voip",
+                    "-ar", str(OPUS_SAMPLE_RATE), "-f", "ogg"]
+    return command
+
+
+class PeaksAccumulator:
+    """
+    Min/max waveform peaks per block of samples_per_pixel frames, in the
+    audiowaveform JSON format (version 2, 8-bit, one channel) that web players
+    such as peaks.js read. Channels are merged by taking the extremes across them.
+    """
+
+    def __init__(self, sample_rate: int, channels: int, samples_per_pixel: int):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.samples_per_pixel = samples_per_pixel
+        self._carry = np.empty(0, dtype=np.int16)
+        self._mins: List[np.ndarray] = []
+        self._maxs: List[np.ndarray] = []
+
+    def add(self, pcm: bytes) -> None:
+        frames = np.frombuffer(pcm, dtype="<i2").reshape(-1, self.channels)
+        low = frames.min(axis=1)
+        high = frames.max(axis=1)
+        # Keep min and max interleaved per frame so one reshape reduces both
+        merged = np.concatenate([self._carry, np.stack([low, high], axis=1).reshape(-1)])
+        usable = len(merged) // (2 * self.samples_per_pixel) * 2 * self.samples_per_pixel
+        if usable:
+            pairs = merged[:usable].reshape(-1, self.samples_per_pixel, 2)
+            self._mins.append(pairs[:, :, 0].min(axis=1))
+            self._maxs.append(pairs[:, :, 1].max(axis=1))
+        self._carry = merged[usable:]
+
+    def result(self) -> Dict:
+        mins = self._mins
+        maxs = self._maxs
+        if len(self._carry):
+            pairs = self._carry.reshape(-1, 2)
+            mins = mins + [pairs[:, 0].min(keepdims=True)]
+            maxs = maxs + [pairs[:, 1].max(keepdims=True)]
+        mins = np.concatenate(mins) if mins else np.empty(0, dtype=np.int16)
+        maxs = np.concatenate(maxs) if maxs else np.empty(0, dtype=np.int16)
+        # 16-bit to 8-bit, rounding toward zero so silence stays 0
+        data = np.empty(2 * len(mins), dtype=np.int16)
+        data[0::2] = np.trunc(mins / 256)
+        data[1::2] = np.trunc(maxs / 256)
+        return {
+            "version": 2,
+            "channels": 1,
+            "sample_rate": self.sample_rate,
+            "samples_per_pixel": self.samples_per_pixel,
+            "bits": 8,
+            "length": len(mins),
+            "data": data.tolist(),
+        }
+
+
+def export_pcm(blocks: Iterator[bytes], sample_rate: int, channels: int, targets: List[ExportTarget]) -> Dict[str, str]:
+    """
+    Feed one PCM stream to every target: one ffmpeg encoder process per MP3/Opus
+    target, all reading the same blocks from their stdin and encoding in
+    parallel, and numpy peak reductions for the peaks targets.
+
+    Returns:
+        Path of every target, keyed by its file name
+    """
+    for target in targets:
+        target.path.parent.mkdir(parents=True, exist_ok=True)
+
+    encoders = []
+    peaks = []
+    try:
+        for target in targets:
+            if target.format == "peaks":
+                peaks.append((target, PeaksAccumulator(sample_rate, channels, target.samples_per_pixel)))
+                continue
+            fd, temp_path = tempfile.mkstemp(suffix=target.path.suffix, dir=target.path.parent)
+            os.close(fd)
+            # stderr goes to a file: a pipe nobody reads could fill up and stall the encoder
+            stderr = tempfile.TemporaryFile()
+            process = subprocess.Popen(_encoder_command(target, sample_rate, channels) + [temp_path],
+                                       stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=stderr)
+            encoders.append((target, process, temp_path, stderr))
+
+        total_frames = 0
+        for block in blocks:
+            total_frames += len(block) // (2 * channels)
+            for target, process, _, _ in encoders:
+                try:
+                    process.stdin.write(block)
+                except BrokenPipeError:
+                    pass  # Reported with the encoder's exit status below
+            for _, accumulator in peaks:
+                accumulator.add(block)
+        if total_frames == 0:
+            raise ValueError("No audio files were successfully combined")
+
+        failures = []
+        for target, process, temp_path, stderr in encoders:
+            try:
+                process.stdin.close()
+            except BrokenPipeError:
+                pass
+            if process.wait() != 0:
+                stderr.seek(0)
+                failures.append(f"{target}: {stderr.read().decode(errors='replace').strip()}")
+        if failures:
+            raise RuntimeError(f"ffmpeg export failed: {'; '.join(failures)}")
+
+        for target, _, temp_path, _ in encoders:
+            os.replace(temp_path, target.path)
+        for target, accumulator in peaks:
+            with open(target.path, "w", encoding="utf-8") as f:
+                json.dump(accumulator.result(), f, separators=(",", ":"))
+    finally:
+        for _, process, temp_path, stderr in encoders:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+            stderr.close()
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    log.log_info(f"Exported {total_frames / sample_rate:.1f}s of audio to "
+                 f"{', '.join(target.path.name for target in targets)} in one pass")
+    return {target.path.name: str(target.path) for target in targets}
@@ -0,0 +1,195 @@
+import math
+import os
+import subprocess
+import wave
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple, Union
+
+from logger import CustomLogger
+
+log = CustomLogger("ParallelEncode", log_file="parallel_encode.log")
+
+DEFAULT_BITRATE = "128k"
+
+# Samples between an input sample entering LAME and the same sample leaving the
+# decoder: the encoder delay (576) plus the decoder filterbank delay (529).
+MP3_CODEC_DELAY = 1105
+
+# Whole MP3 frames of real audio encoded before and after each section. The
+# leading context warms up the psychoacoustic model and lines the section up on
+# the global frame grid; the trailing context covers the codec delay and the
+# MDCT window of the last kept frame.
+LEAD_CONTEXT_FRAMES = 4
+TRAIL_CONTEXT_FRAMES = 6
+
+MIN_SECTION_SECONDS = 30
+
+_BITRATES = {
+    1: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    2: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+_SAMPLE_RATES = {
+    0b11: [44100, 48000, 32000],  # MPEG-1
+    0b10: [22050, 24000, 16000],  # MPEG-2
+    0b00: [11025, 12000, 8000],   # MPEG-2.5
+}
+
+
+def mp3_frame_samples(sample_rate: int) -> int:
+    """Samples per Layer III frame: 1152 for MPEG-1 rates, 576 for MPEG-2/2.5 rates."""
+    return 1152 if sample_rate >= 32000 else 576
+
+
+def iter_mp3_frames(data: bytes) -> Iterator[Tuple[int, int]]:
+    """
+    Yield (offset, length) of every MPEG Layer III frame in a raw MP3 stream.
+
+    Bytes that are not part of a valid frame (such as tags) are skipped.
+    """
+    position = 0
+    end = len(data) - 4
+    while position <= end:
+        if data[position] != 0xFF or (data[position + 1] & 0xE0) != 0xE0:
+            position += 1
+            continue
+
+        header = int.from_bytes(data[position:position + 4], "big")
+        version = (header >> 19) & 0b11
+        layer = (header >> 17) & 0b11
+        bitrate_index = (header >> 12) & 0b1111
+        sample_rate_index = (header >> 10) & 0b11
+        padding = (header >> 9) & 0b1
+
+        if layer != 0b01 or version == 0b01 or bitrate_index in (0, 15) or sample_rate_index == 3:
+            position += 1
+            continue
+
+        bitrate = _BITRATES[1 if version == 0b11 else 2][bitrate_index] * 1000
+        sample_rate = _SAMPLE_RATES[version][sample_rate_index]
+        coefficient = 144 if version == 0b11 else 72
+        length = coefficient * bitrate // sample_rate + padding
+
+        yield position, length
+        position += length
+
+
+def _ffmpeg_mp3_command(sample_rate: int, channels: int, bitrate: str) -> List[str]:
+    # No bit reservoir, Xing header or ID3 tags, so every output frame is
+    # self-contained and frames from different encodes can be concatenated.
+    return [
+        "ffmpeg", "-v", "error",
+        "-f", "s16le", "-ar", str(sample_rate), "-ac", str(channels), "-i", "pipe:0",
+        "-c:a", "libmp3lame", "-b:a", bitrate, "-reservoir", "0",
+        "-write_xing", "0", "-id3v2_version", "0",
+        "-f", "mp3", "pipe:1",
+    ]
+
+
+def encode_pcm_to_mp3_frames(pcm: bytes, sample_rate: int, channels: int,
+                             bitrate: str = DEFAULT_BITRATE) -> bytes:
+    """Encode raw 16-bit PCM into a headerless stream of self-contained MP3 frames."""
+    result = subprocess.run(
+        _ffmpeg_mp3_command(sample_rate, channels, bitrate),
+        input=pcm, capture_output=True, check=False,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg MP3 encode failed: {result.stderr.decode(errors='replace').strip()}")
+    return result.stdout
+
+
+def _encode_section(wav_file: str, start: int, end: int, keep_from: int,
+                    keep_count: Optional[int], bitrate: str) -> bytes:
+    """Encode input frames [start, end) and return the MP3 frames selected for this section."""
+    with wave.open(wav_file, "rb") as wav:
+        wav.setpos(start)
+        pcm = wav.readframes(end - start)
+        sample_rate = wav.getframerate()
+        channels = wav.getnchannels()
+
+    data = encode_pcm_to_mp3_frames(pcm, sample_rate, channels, bitrate)
+    frames = list(iter_mp3_frames(data))
+    selected = frames[keep_from:] if keep_count is None else frames[keep_from:keep_from + keep_count]
+    if keep_count is not None and len(selected) < keep_count:
+        raise RuntimeError(f"Section {start}-{end} produced {len(frames)} frames, expected at least {keep_from + keep_count}")
+    if not selected:
+        return b""
+    return data[selected[0][0]:selected[-1][0] + selected[-1][1]]
+
+
+def plan_sections(total_samples: int, sample_rate: int, sections: int) -> List[Tuple[int, int, int, int, int, Optional[int]]]:
+    """
+    Split an input into frame-aligned sections.
+
+    Returns:
+        (section start, section end, encode start, encode end, frames to skip, frames to keep)
+        for each section; the last section keeps every frame up to the encoder flush.
+    """
+    frame_samples = mp3_frame_samples(sample_rate)
+    min_section = MIN_SECTION_SECONDS * sample_rate
+    section_samples = max(min_section, math.ceil(total_samples / max(1, sections)))
+    section_samples = math.ceil(section_samples / frame_samples) * frame_samples
+
+    plan = []
+    for start in range(0, total_samples, section_samples):
+        end = min(start + section_samples, total_samples)
+        is_last = end == total_samples
+        encode_start = max(0, start - LEAD_CONTEXT_FRAMES * frame_samples)
+        encode_end = min(total_samples, end + TRAIL_CONTEXT_FRAMES * frame_samples)
+        skip = (start - encode_start) // frame_samples
+        keep = None if is_last else (end - start) // frame_samples
+        plan.append((start, end, encode_start, encode_end, skip, keep))
+    return plan
+
+
+def encode_mp3_parallel(wav_file: Union[str, Path], output_file: Union[str, Path],
+                        bitrate: str = DEFAULT_BITRATE, workers: Optional[int] = None) -> str:
+    """
+    Encode a 16-bit PCM WAV file to MP3 using a pool of ffmpeg encodes.
+
+    Section boundaries fall on MP3 frame boundaries and each section is encoded
+    with a few frames of surrounding audio, so the selected frames of every
+    section line up with the frames a single serial encode would produce. The
+    frames are then concatenated without re-encoding.
+
+    Args:
+        wav_file: Input WAV file
+        output_file: Path of the MP3 file to write
+        bitrate: Constant bitrate passed to the encoder
+        workers: Number of encoder processes (defaults to the CPU count)
+    Returns:
+        Path to the MP3 file
+    """
+    wav_file = Path(wav_file)
+    output_file = Path(output_file)
+    output_file.parent.mkdir(parents=True, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+
+    with wave.open(str(wav_file), "rb") as wav:
+        if wav.getsampwidth() != 2:
+            raise ValueError(f"Only 16-bit PCM WAV input is supported: {wav_file}")
+        total_samples = wav.getnframes()
+        sample_rate = wav.getframerate()
+
+    plan = plan_sections(total_samples, sample_rate, workers)
+    log.log_info(f"Encoding {total_samples / sample_rate:.1f}s of audio in {len(plan)} sections with {workers} workers")
+
+    if len(plan) == 1 or workers == 1:
+        sections = [
+            _encode_section(str(wav_file), encode_start, encode_end, skip, keep, bitrate)
+            for _, _, encode_start, encode_end, skip, keep in plan
+        ]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(plan))) as executor:
+            futures = [
+                executor.submit(_encode_section, str(wav_file), encode_start, encode_end, skip, keep, bitrate)
+                for _, _, encode_start, encode_end, skip, keep in plan
+            ]
+            sections = [future.result() for future in futures]
+
+    with open(output_file, "wb") as f:
+        for section in sections:
+            f.write(section)
+
+    log.log_debug(f"Parallel MP3 saved as: {output_file}")
+    return str(output_file)
@@ -0,0 +1,151 @@
+import json
+import math
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+from logger import CustomLogger
+
+log = CustomLogger("Planner", log_file="planner.log")
+
+# Used until enough runs have been recorded in the run history
+DEFAULT_THROUGHPUT = {
+    "llm_seconds_per_request": 45.0,
+    "summary_chars": 4000,
+    "outline_chars": 6000,
+    "outline_sections": 6,
+    "tts_chars_per_document_token": 0.5,
+    "tts_chars_per_script_char": 0.9,
+    "tts_chars_per_segment": 220,
+    "tts_chars_per_second": 40.0,
+    "combine_seconds_per_segment": 0.05,
+}
+
+HISTORY_WINDOW = 20  # Most recent runs used to derive throughput
+CHARS_PER_TOKEN = 4  # For content that does not exist yet and cannot be tokenized
+
+
+class RunHistory:
+    """Append-only JSON Lines log of measured per-run statistics."""
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+
+    def record(self, run: Dict) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(run) + "\n")
+
+    def load(self) -> List[Dict]:
+        runs = []
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        runs.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        continue
+        except FileNotFoundError:
+            pass
+        return runs
+
+    def throughput(self, window: int = HISTORY_WINDOW) -> Dict:
+        """
+        Throughput figures measured over the most recent runs, falling back to
+        DEFAULT_THROUGHPUT for anything that has not been measured yet.
+        """
+        runs = self.load()[-window:]
+        throughput = dict(DEFAULT_THROUGHPUT)
+        throughput["runs"] = len(runs)
+
+        def total(field: str) -> float:
+            return sum(run.get(field, 0) or 0 for run in runs)
+
+        def stage_total(stage: str) -> float:
+            return sum(run.get("stage_seconds", {}).get(stage, 0) for run in runs)
+
+        ratios = {
+            "llm_seconds_per_request": (total("llm_seconds"), total("llm_requests")),
+            "tts_chars_per_document_token": (total("tts_chars"), total("document_tokens")),
+            "tts_chars_per_script_char": (total("tts_chars"), total("script_chars")),
+            "tts_chars_per_segment": (total("tts_chars"), total("tts_segments")),
+            "tts_chars_per_second": (total("tts_chars"), stage_total("generate_audio")),
+            "combine_seconds_per_segment": (stage_total("combine_audio_files"), total("tts_segments")),
+        }
+        for name, (numerator, denominator) in ratios.items():
+            if numerator > 0 and denominator > 0:
+                throughput[name] = numerator / denominator
+
+        for name in ("outline_chars", "outline_sections", "summary_chars"):
+            values = [run[name] for run in runs if run.get(name)]
+            if values:
+                throughput[name] = sum(values) / len(values)
+
+        return throughput
+
+    def speech_rates(self, window: int = HISTORY_WINDOW) -> Dict[str, float]:
+        """Characters per second of synthesized speech per voice, over the most recent runs."""
+        chars: Dict[str, float] = {}
+        seconds: Dict[str, float] = {}
+        for run in self.load()[-window:]:
+            for voice, value in (run.get("speech_chars_by_voice") or {}).items():
+                chars[voice] = chars.get(voice, 0) + value
+            for voice, value in (run.get("speech_seconds_by_voice") or {}).items():
+                seconds[voice] = seconds.get(voice, 0) + value
+        return {voice: chars[voice] / seconds[voice] for voice in chars if chars[voice] > 0 and seconds.get(voice)}
+
+
+def chunks_for_tokens(tokens: int, max_chunk_tokens: int) -> int:
+    return max(1, math.ceil(tokens / max_chunk_tokens)) if tokens else 0
+
+
+def estimate_run(document_count: int, document_chars: int, document_tokens: int, extraction_seconds: float,
+                 summary_requests: int, outline_requests: int, script_requests: int,
+                 prompt_tokens: int, throughput: Dict, tts_batch_chars: int = 0,
+                 script_rounds: Optional[int] = None) -> Dict:
+    """
+    Turn request counts from a dry run into a cost and latency estimate.
+
+    Args:
+        document_tokens: Tokens of all extracted document text, which scales the spoken script
+        tts_batch_chars: Characters per SSML batch when turns are batched, 0 for one request per turn
+        script_rounds: Script requests that wait on each other when the script is written
+            section by section, all of script_requests when None
+    """
+    llm_requests = summary_requests + outline_requests + script_requests
+    if script_rounds is None:
+        script_rounds = script_requests
+    tts_chars = int(document_tokens * throughput["tts_chars_per_document_token"])
+    script_chars = int(tts_chars / throughput["tts_chars_per_script_char"])
+    tts_segments = math.ceil(tts_chars / throughput["tts_chars_per_segment"]) if tts_chars else 0
+    tts_requests = math.ceil(tts_chars / tts_batch_chars) if tts_batch_chars else tts_segments
+
+    llm_seconds = (summary_requests + outline_requests + script_rounds) * throughput["llm_seconds_per_request"]
+    tts_seconds = tts_chars / throughput["tts_chars_per_second"]
+    combine_seconds = tts_segments * throughput["combine_seconds_per_segment"]
+
+    return {
+        "documents": document_count,
+        "document_characters": document_chars,
+        "document_tokens": document_tokens,
+        "llm_requests": {
+            "summaries": summary_requests,
+            "outline": outline_requests,
+            "script": script_requests,
+            "total": llm_requests,
+        },
+        "llm_prompt_tokens": prompt_tokens,
+        "tts": {
+            "script_characters": script_chars,
+            "characters": tts_chars,
+            "segments": tts_segments,
+            "requests": tts_requests,
+        },
+        "estimated_seconds": {
+            "extraction": round(extraction_seconds, 1),
+            "llm": round(llm_seconds, 1),
+            "tts": round(tts_seconds, 1),
+            "combine": round(combine_seconds, 1),
+            "total": round(extraction_seconds + llm_seconds + tts_seconds + combine_seconds, 1),
+        },
+        "throughput": throughput,
+    }
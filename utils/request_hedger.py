@@ -0,0 +1,183 @@
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, TypeVar
+
+from logger import CustomLogger
+from utils.adaptive_limiter import AdaptiveLimiter, LimiterBusy
+
+log = CustomLogger("RequestHedger", log_file="request_hedger.log")
+
+T = TypeVar("T")
+
+HEDGE_PERCENTILE = 95  # A request still running past this percentile of latencies for its size is hedged
+MAX_HEDGE_RATE = 0.05  # At most this fraction of calls send a duplicate
+LATENCY_WINDOW = 200  # Recent latency samples the percentile is computed over
+MIN_SAMPLES = 20  # Samples needed before any request is hedged
+MAX_REQUESTS = 64  # Requests (originals and duplicates) running at once
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile of unsorted values."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+def fit_latency(samples: Sequence[Tuple[float, float]]) -> Tuple[float, float]:
+    """
+    Least-squares fit of latency = fixed + per_unit * units over (units, latency)
+    samples, with neither part negative.
+
+    Returns:
+        fixed seconds and seconds per unit
+    """
+    count = len(samples)
+    mean_units = sum(units for units, _ in samples) / count
+    mean_latency = sum(latency for _, latency in samples) / count
+    spread = sum((units - mean_units) ** 2 for units, _ in samples)
+    if spread == 0:
+        return mean_latency, 0.0
+    per_unit = sum((units - mean_units) * (latency - mean_latency) for units, latency in samples) / spread
+    if per_unit < 0:
+        return mean_latency, 0.0
+    fixed = mean_latency - per_unit * mean_units
+    if fixed < 0:
+        # Refit through the origin
+        return 0.0, sum(units * latency for units, latency in samples) / sum(units * units for units, _ in samples)
+    return fixed, per_unit
+
+
+class RequestHedger:
+    """
+    Hedged requests: when a call is still running after the given percentile of
+    latencies expected for its size, the same request is sent again and
+    whichever finishes first wins. The duplicate of a request is only sent
+    while fewer than max_hedge_rate of all calls have been hedged, which bounds
+    the extra cost.
+
+    Recent latencies are fitted as a fixed part plus a part per unit of work
+    (characters for speech). A call is hedged once it has run longer than the
+    fit predicts for its size, times the percentile of how far recent calls
+    ran over their own prediction. The losing request runs to completion in
+    the background and its result is dropped.
+
+    Args:
+        name: Name used in logs and metrics
+        percentile: Latency percentile after which a call is hedged
+        max_hedge_rate: Largest fraction of calls that may be hedged
+        limiter: Concurrency limiter the calls run under; a duplicate runs
+                 through it in a slot of its own, so its throttling and latency
+                 adjust the limit, and is not sent while no slot is free
+    """
+
+    def __init__(self, name: str, percentile: float = HEDGE_PERCENTILE, max_hedge_rate: float = MAX_HEDGE_RATE,
+                 window: int = LATENCY_WINDOW, min_samples: int = MIN_SAMPLES, max_requests: int = MAX_REQUESTS,
+                 limiter: Optional[AdaptiveLimiter] = None):
+        self.name = name
+        self.percentile = percentile
+        self.max_hedge_rate = max_hedge_rate
+        self.min_samples = min_samples
+        self.limiter = limiter
+        self._executor = ThreadPoolExecutor(max_workers=max_requests, thread_name_prefix=f"hedge-{name}")
+        self._lock = threading.Lock()
+        self._samples = deque(maxlen=window)
+        self._call_latencies = deque(maxlen=window)
+        self._calls = 0
+        self._hedged = 0
+        self._hedge_wins = 0
+
+    def _hedge_after(self, units: float) -> Optional[float]:
+        """Seconds to wait before hedging a call of this size, None if it may not be hedged."""
+        with self._lock:
+            if len(self._samples) < self.min_samples or self._hedged + 1 > self.max_hedge_rate * self._calls:
+                return None
+            samples = list(self._samples)
+
+        def overruns(fixed: float, per_unit: float) -> List[float]:
+            return [latency / (fixed + per_unit * sample_units) if fixed + per_unit * sample_units > 0 else 1.0
+                    for sample_units, latency in samples]
+
+        # Refit without the slow tail, which is what hedging is for and would otherwise skew the fit
+        first = overruns(*fit_latency(samples))
+        cutoff = percentile(first, self.percentile)
+        fixed, per_unit = fit_latency([sample for sample, overrun in zip(samples, first) if overrun <= cutoff])
+        return (fixed + per_unit * units) * max(1.0, percentile(overruns(fixed, per_unit), self.percentile))
+
+    def _submit(self, fn: Callable[[], T], units: float) -> Future:
+        started = time.monotonic()
+        future = self._executor.submit(fn)
+
+        def record(done: Future):
+            if done.cancelled() or done.exception() is not None:
+                return
+            latency = time.monotonic() - started
+            with self._lock:
+                self._samples.append((units, latency))
+                self._call_latencies.append(latency)
+
+        future.add_done_callback(record)
+        return future
+
+    def call(self, fn: Callable[[], T], units: float = 1.0) -> T:
+        """
+        Run fn, sending a second fn() if the first is slow; returns the first result
+        that did not raise. Raises the original call's exception if both raise.
+        """
+        with self._lock:
+            self._calls += 1
+        original = self._submit(fn, units)
+
+        hedge_after = self._hedge_after(units)
+        if hedge_after is None:
+            return original.result()
+        done, _ = wait([original], timeout=hedge_after)
+        if done:
+            return original.result()
+
+        with self._lock:
+            # Recheck the budget, other threads may have hedged in the meantime
+            within_budget = self._hedged + 1 <= self.max_hedge_rate * self._calls
+            if within_budget:
+                self._hedged += 1
+        if not within_budget:
+            return original.result()
+        if self.limiter:
+            hedge = self._submit(lambda: self.limiter.call(fn, units, wait=False), units)
+        else:
+            hedge = self._submit(fn, units)
+        log.log_debug(f"{self.name}: hedging a call still running after {hedge_after:.2f}s")
+
+        pending = {original, hedge}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future is hedge and isinstance(future.exception(), LimiterBusy):
+                    # Every slot was taken, a duplicate would only have added to the congestion
+                    with self._lock:
+                        self._hedged -= 1
+                    continue
+                if future.exception() is None:
+                    if future is hedge:
+                        with self._lock:
+                            self._hedge_wins += 1
+                    return future.result()
+        return original.result()
+
+    def metrics(self) -> Dict:
+        """Hedge counts and the latency distribution of recent requests."""
+        with self._lock:
+            call_latencies = list(self._call_latencies)
+            metrics = {
+                "calls": self._calls,
+                "hedged": self._hedged,
+                "hedge_wins": self._hedge_wins,
+                "hedge_rate": round(self._hedged / self._calls, 4) if self._calls else 0.0,
+                "max_hedge_rate": self.max_hedge_rate,
+                "percentile": self.percentile,
+            }
+        if call_latencies:
+            for q in (50, 95, 99):
+                metrics[f"p{q}_seconds"] = round(percentile(call_latencies, q), 3)
+        return metrics
@@ -0,0 +1,120 @@
+import re
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+DEFAULT_HOSTS = ("Alex", "Jane")
+# Host names in the order they join a show: a show with N hosts has the first N
+HOST_NAMES = ("Alex", "Jane", "Sam", "Maya")
+
+
+class Turn:
+    """A single speaker turn parsed from a podcast script."""
+
+    __slots__ = ("speaker", "text", "line_number")
+
+    def __init__(self, speaker: str, text: str, line_number: int):
+        self.speaker = speaker
+        self.text = text
+        self.line_number = line_number
+
+    def __iter__(self):
+        # Allows unpacking as (speaker, text, line_number)
+        return iter((self.speaker, self.text, self.line_number))
+
+    def __eq__(self, other):
+        return isinstance(other, Turn) and tuple(self) == tuple(other)
+
+    def __repr__(self):
+        return f"Turn(speaker={self.speaker!r}, text={self.text[:30]!r}, line_number={self.line_number})"
+
+
+class ScriptParser:
+    """
+    Incremental parser that splits a Markdown podcast script into speaker turns.
+
+    Feed the script in arbitrary chunks with `feed()` and call `close()` at the end;
+    both return the turns that were completed by that call.
+
+    Args:
+        hosts: Host names that mark a speaker line even without bold formatting
+    """
+
+    def __init__(self, hosts: Sequence[str] = DEFAULT_HOSTS):
+        self.hosts = tuple(hosts)
+        self._host_pattern = re.compile("|".join(re.escape(host) for host in self.hosts)) if self.hosts else None
+        self._buffer = ""
+        self._line_number = 0
+        self._speaker = ""
+        self._parts: List[str] = []
+        self._start_line = 0
+
+    def _flush(self, turns: List[Turn]):
+        if self._speaker and self._parts:
+            turns.append(Turn(self._speaker, " ".join(self._parts), self._start_line))
+        self._parts = []
+
+    def _parse_lines(self, lines: List[str]) -> List[Turn]:
+        # Hot loop: attributes are bound to locals and written back at the end
+        turns: List[Turn] = []
+        host_search = self._host_pattern.search if self._host_pattern is not None else None
+        speaker = self._speaker
+        parts = self._parts
+        start_line = self._start_line
+        line_number = self._line_number
+
+        for line in lines:
+            line_number += 1
+            line = line.strip()
+            if not line:
+                continue
+
+            colon = line.find(":")
+            if colon >= 0 and (line.startswith("**") or (host_search is not None and host_search(line, 0, colon))):
+                # New speaker
+                if speaker and parts:
+                    turns.append(Turn(speaker, " ".join(parts), start_line))
+                speaker = line[:colon].strip("* ")
+                start_line = line_number
+                spoken = line[colon + 1:].lstrip("* ")
+                parts = [spoken] if spoken else []
+            elif line[0] not in "[#":
+                parts.append(line)
+
+        self._speaker = speaker
+        self._parts = parts
+        self._start_line = start_line
+        self._line_number = line_number
+        return turns
+
+    def feed(self, chunk: str) -> List[Turn]:
+        """Parse the next chunk of script text and return the turns it completed."""
+        lines = (self._buffer + chunk).split("\n")
+        self._buffer = lines.pop()
+        return self._parse_lines(lines)
+
+    def close(self) -> List[Turn]:
+        """Parse any buffered text and return the final turns."""
+        turns = self._parse_lines([self._buffer]) if self._buffer else []
+        self._buffer = ""
+        self._flush(turns)
+        return turns
+
+
+def host_roster(host_count: int) -> Tuple[str, ...]:
+    """Names of the hosts of a show with host_count hosts."""
+    if not 1 <= host_count <= len(HOST_NAMES):
+        raise ValueError(f"A show can have 1 to {len(HOST_NAMES)} hosts, got {host_count}")
+    return HOST_NAMES[:host_count]
+
+
+def parse_script(script: str, hosts: Optional[Sequence[str]] = None) -> List[Turn]:
+    """Parse a complete podcast script into a list of speaker turns."""
+    parser = ScriptParser(hosts if hosts is not None else DEFAULT_HOSTS)
+    return parser.feed(script) + parser.close()
+
+
+def iter_turns(chunks: Iterable[str], hosts: Optional[Sequence[str]] = None):
+    """Yield speaker turns from a stream of script chunks as soon as they are complete."""
+    parser = ScriptParser(hosts if hosts is not None else DEFAULT_HOSTS)
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+    yield from parser.close()
@@ -0,0 +1,59 @@
+from typing import Dict, List, Sequence
+
+import numpy as np
+from sklearn.cluster import KMeans
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from logger import CustomLogger
+
+log = CustomLogger("SeriesPlanner", log_file="series_planner.log")
+
+MAX_FEATURES = 20000  # Vocabulary size of the TF-IDF vectors
+TOPIC_TERMS = 5  # Terms naming each episode's topic
+KMEANS_RESTARTS = 10
+
+
+def plan_series(sources: Sequence[str], texts: Sequence[str], episodes: int, seed: int = 0) -> List[Dict]:
+    """
+    Split a corpus into episodes of related documents: TF-IDF vectors of the
+    documents are clustered with k-means and every cluster becomes an episode.
+
+    Args:
+        sources: Name of every document (its input file)
+        texts: Extracted text of every document
+        episodes: Number of episodes wanted, capped at the number of documents
+        seed: Random state of k-means, so a corpus always splits the same way
+    Returns:
+        For every episode, in order of its first document, the sources it covers
+        and the terms that characterize it
+    """
+    if not texts:
+        raise ValueError("No documents to plan a series from")
+    episodes = max(1, min(episodes, len(texts)))
+    if episodes == 1:
+        return [{"sources": list(sources), "topic_terms": []}]
+
+    vectorizer = TfidfVectorizer(stop_words="english", sublinear_tf=True, max_features=MAX_FEATURES)
+    try:
+        vectors = vectorizer.fit_transform(texts)
+    except ValueError:
+        # Nothing but stop words, every document looks the same
+        log.log_warning("Documents have no distinguishing terms, planning a single episode")
+        return [{"sources": list(sources), "topic_terms": []}]
+
+    kmeans = KMeans(n_clusters=episodes, n_init=KMEANS_RESTARTS, random_state=seed)
+    labels = kmeans.fit_predict(vectors)
+    terms = vectorizer.get_feature_names_out()
+
+    plan = []
+    # Episodes follow the input order, by the first document of each cluster
+    for label in dict.fromkeys(labels):
+        members = [i for i, member_label in enumerate(labels) if member_label == label]
+        center = kmeans.cluster_centers_[label]
+        # Terms none of the episode's documents contain weigh 0 and say nothing about it
+        top = [i for i in np.argsort(center)[::-1][:TOPIC_TERMS] if center[i] > 0]
+        plan.append({"sources": [sources[i] for i in members],
+                     "topic_terms": [str(terms[i]) for i in top]})
+    log.log_info(f"Planned {len(plan)} episodes over {len(texts)} documents: "
+                 f"{', '.join(str(len(episode['sources'])) for episode in plan)} documents each")
+    return plan
@@ -0,0 +1,260 @@
+import hashlib
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Union
+
+from logger import CustomLogger
+
+log = CustomLogger("WorkQueue", log_file="work_queue.log")
+
+DEFAULT_LEASE_SECONDS = 300.0
+DEFAULT_MAX_ATTEMPTS = 3
+RETRY_BACKOFF_SECONDS = 5.0  # Doubled after every failed attempt
+BUSY_TIMEOUT_SECONDS = 30.0
+
+# Task states
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY,
+    project TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    task_key TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    available_at REAL NOT NULL,
+    lease_owner TEXT,
+    lease_expires REAL,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    UNIQUE (project, kind, task_key)
+);
+CREATE INDEX IF NOT EXISTS tasks_claim ON tasks (project, state, available_at);
+"""
+
+
+class Task:
+    """A claimed task: its payload plus the lease that has to be renewed while it runs."""
+
+    __slots__ = ("id", "project", "kind", "payload", "attempts", "lease_owner")
+
+    def __init__(self, id: int, project: str, kind: str, payload: Dict, attempts: int, lease_owner: str):
+        self.id = id
+        self.project = project
+        self.kind = kind
+        self.payload = payload
+        self.attempts = attempts
+        self.lease_owner = lease_owner
+
+    def __repr__(self):
+        return f"Task(id={self.id}, project={self.project!r}, kind={self.kind!r}, attempts={self.attempts})"
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+
+class WorkQueue:
+    """
+    Durable task queue in a SQLite database, shared by every worker process.
+
+    Workers claim a task by taking a lease on it. A lease that is not renewed
+    (the worker crashed, was killed or lost its host) expires and the task is
+    handed to another worker. Failed tasks are retried with exponential backoff
+    until they run out of attempts.
+
+    Workers on several machines can share a queue on network storage as long as
+    it supports POSIX file locks; the database uses the default rollback
+    journal because WAL mode does not work over network filesystems. Paths in
+    task payloads must then resolve to the same files on every machine.
+
+    Args:
+        db_path: SQLite database file, created on first use
+        lease_seconds: How long a claim is valid without a heartbeat
+        max_attempts: Attempts before a task is marked failed
+    """
+
+    def __init__(self, db_path: Union[str, Path], lease_seconds: float = DEFAULT_LEASE_SECONDS,
+                 max_attempts: int = DEFAULT_MAX_ATTEMPTS):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._local = threading.local()
+        self._connection().executescript(SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections cannot be shared between threads, so keep one per thread
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(str(self.db_path), timeout=BUSY_TIMEOUT_SECONDS, isolation_level=None)
+            db.row_factory = sqlite3.Row
+            self._local.db = db
+        return db
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        db = self._connection()
+        # Take the write lock up front so two workers never claim the same task
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    @staticmethod
+    def task_key(payload: Dict) -> str:
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def enqueue(self, project: str, kind: str, payload: Dict, key: Optional[str] = None) -> int:
+        """
+        Add a task and return its id.
+
+        Enqueueing the same (project, kind, key) again returns the existing task;
+        a finished or failed one is reset so it runs again, while one that is
+        still pending or leased is left to its current worker.
+
+        Args:
+            key: Identity of the task, defaults to the hash of the payload
+        """
+        key = key or self.task_key(payload)
+        now = time.time()
+        with self._transaction() as db:
+            db.execute(
+                """
+                INSERT INTO tasks (project, kind, task_key, payload, state, max_attempts,
+                                   available_at, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (project, kind, task_key) DO UPDATE SET
+                    payload = excluded.payload, state = excluded.state, attempts = 0,
+                    max_attempts = excluded.max_attempts, available_at = excluded.available_at,
+                    lease_owner = NULL, lease_expires = NULL, result = NULL, error = NULL,
+                    updated_at = excluded.updated_at
+                WHERE tasks.state IN (?, ?)
+                """,
+                (project, kind, key, json.dumps(payload), PENDING, self.max_attempts, now, now, now, DONE, FAILED),
+            )
+            row = db.execute("SELECT id FROM tasks WHERE project = ? AND kind = ? AND task_key = ?",
+                             (project, kind, key)).fetchone()
+        return row["id"]
+
+    def claim(self, worker_id: str, project: Optional[str] = None,
+              kinds: Optional[Sequence[str]] = None) -> Optional[Task]:
+        """Lease the oldest runnable task (pending, or leased with an expired lease), if any."""
+        now = time.time()
+        conditions = ["((state = ? AND available_at <= ?) OR (state = ? AND lease_expires < ?))"]
+        params: List = [PENDING, now, LEASED, now]
+        if project is not None:
+            conditions.append("project = ?")
+            params.append(project)
+        if kinds:
+            conditions.append(f"kind IN ({', '.join('?' for _ in kinds)})")
+            params.extend(kinds)
+
+        with self._transaction() as db:
+            row = db.execute(
+                f"SELECT id, project, kind, payload, attempts, max_attempts, state FROM tasks "
+                f"WHERE {' AND '.join(conditions)} ORDER BY id LIMIT 1",
+                params,
+            ).fetchone()
+            if row is None:
+                return None
+
+            if row["state"] == LEASED and row["attempts"] >= row["max_attempts"]:
+                # The last attempt's worker died; nothing left to retry
+                db.execute("UPDATE tasks SET state = ?, error = ?, lease_owner = NULL, updated_at = ? WHERE id = ?",
+                           (FAILED, "lease expired on final attempt", now, row["id"]))
+                log.log_warning(f"Task {row['id']} ({row['kind']}) failed: lease expired on final attempt")
+                return None
+
+            attempts = row["attempts"] + 1
+            db.execute(
+                "UPDATE tasks SET state = ?, attempts = ?, lease_owner = ?, lease_expires = ?, updated_at = ? "
+                "WHERE id = ?",
+                (LEASED, attempts, worker_id, now + self.lease_seconds, now, row["id"]),
+            )
+        return Task(row["id"], row["project"], row["kind"], json.loads(row["payload"]), attempts, worker_id)
+
+    def heartbeat(self, task: Task) -> bool:
+        """Extend a lease; False means the lease was lost and the task may be running elsewhere."""
+        with self._transaction() as db:
+            cursor = db.execute(
+                "UPDATE tasks SET lease_expires = ?, updated_at = ? WHERE id = ? AND state = ? AND lease_owner = ?",
+                (time.time() + self.lease_seconds, time.time(), task.id, LEASED, task.lease_owner),
+            )
+        return cursor.rowcount == 1
+
+    def complete(self, task: Task, result: Optional[Dict] = None) -> bool:
+        with self._transaction() as db:
+            cursor = db.execute(
+                "UPDATE tasks SET state = ?, result = ?, lease_owner = NULL, lease_expires = NULL, updated_at = ? "
+                "WHERE id = ? AND lease_owner = ?",
+                (DONE, json.dumps(result or {}), time.time(), task.id, task.lease_owner),
+            )
+        if cursor.rowcount != 1:
+            log.log_warning(f"{task} finished after its lease was taken over, result discarded")
+        return cursor.rowcount == 1
+
+    def fail(self, task: Task, error: str) -> None:
+        """Record a failed attempt, scheduling a retry with backoff while attempts remain."""
+        now = time.time()
+        with self._transaction() as db:
+            row = db.execute("SELECT max_attempts FROM tasks WHERE id = ? AND lease_owner = ?",
+                             (task.id, task.lease_owner)).fetchone()
+            if row is None:
+                return
+            if task.attempts >= row["max_attempts"]:
+                db.execute("UPDATE tasks SET state = ?, error = ?, lease_owner = NULL, lease_expires = NULL, "
+                           "updated_at = ? WHERE id = ?", (FAILED, error, now, task.id))
+                log.log_error(f"{task} failed permanently: {error}")
+            else:
+                retry_at = now + RETRY_BACKOFF_SECONDS * 2 ** (task.attempts - 1)
+                db.execute("UPDATE tasks SET state = ?, error = ?, available_at = ?, lease_owner = NULL, "
+                           "lease_expires = NULL, updated_at = ? WHERE id = ?",
+                           (PENDING, error, retry_at, now, task.id))
+                log.log_warning(f"{task} failed, retrying in {retry_at - now:.0f}s: {error}")
+
+    def states(self, task_ids: Iterable[int]) -> Dict[int, Dict]:
+        """State, result and error of the given tasks."""
+        task_ids = list(task_ids)
+        states = {}
+        db = self._connection()
+        # Stay well below SQLite's limit on query parameters
+        for start in range(0, len(task_ids), 500):
+            batch = task_ids[start:start + 500]
+            rows = db.execute(f"SELECT id, state, result, error FROM tasks WHERE id IN "
+                              f"({', '.join('?' for _ in batch)})", batch).fetchall()
+            for row in rows:
+                states[row["id"]] = {
+                    "state": row["state"],
+                    "result": json.loads(row["result"]) if row["result"] else None,
+                    "error": row["error"],
+                }
+        return states
+
+    def counts(self, project: Optional[str] = None) -> Dict[str, int]:
+        """Number of tasks per state, for one project or the whole queue."""
+        query = "SELECT state, COUNT(*) AS n FROM tasks"
+        params: List = []
+        if project is not None:
+            query += " WHERE project = ?"
+            params.append(project)
+        rows = self._connection().execute(query + " GROUP BY state", params).fetchall()
+        return {row["state"]: row["n"] for row in rows}
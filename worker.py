@@ -0,0 +1,207 @@
+import asyncio
+import multiprocessing
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence
+
+from ai_helper.generate_speech import create_speech, create_speech_batch, tts_hedger
+from document_processor import analyze_document_blocks
+from logger import CustomLogger
+from utils.audio_processing import process_audio_segments
+from utils.combine_audio import combine_audio_files
+from utils.episode_index import build_indexed_episode, export_episode
+from utils.extraction_cache import ExtractionCache
+from utils.multi_export import parse_export_spec
+from utils.work_queue import DONE, FAILED, Task, WorkQueue, default_worker_id
+
+log = CustomLogger("Worker", log_file="worker.log")
+
+# Task kinds
+EXTRACT = "extract"
+SYNTHESIZE = "synthesize"
+ENCODE = "encode"
+
+POLL_SECONDS = 1.0
+
+
+def run_extract(payload: Dict) -> Dict:
+    """Extract one document into the (shared) extraction cache."""
+    cache = ExtractionCache(payload["cache_dir"])
+    cache_key = cache.key_for_file(payload["file_path"])
+    if cache.get(cache_key) is None:
+        blocks = asyncio.run(analyze_document_blocks(payload["file_path"]))
+        if not cache.put_blocks(cache_key, blocks):
+            raise ValueError(f"No text content extracted from {payload['file_path']}")
+    return {"cache_key": cache_key}
+
+
+def run_synthesize(payload: Dict) -> Dict:
+    """Synthesize one turn, or one SSML batch of turns, into segment WAV files."""
+    output_dir = Path(payload["output_dir"])
+    segments = [tuple(segment) for segment in payload["segments"]]
+    hedger = tts_hedger if payload.get("hedge") else None
+    # Clear out audio of an earlier attempt, so a failed synthesis cannot pass the check below
+    for index, _, _ in segments:
+        (output_dir / f"segment_{index:03d}.wav").unlink(missing_ok=True)
+    if payload.get("ssml_batching"):
+        segment_files = create_speech_batch(segments, output_dir, hedger)
+    else:
+        segment_files = []
+        for index, voice, text in segments:
+            segment_file = output_dir / f"segment_{index:03d}.wav"
+            create_speech(text, voice, str(segment_file), hedger)
+            segment_files.append(segment_file)
+
+    # The speech helpers log synthesis errors instead of raising, so check the output
+    missing = [str(f) for f in segment_files if not Path(f).exists()]
+    if missing:
+        raise RuntimeError(f"Speech synthesis produced no audio for {', '.join(missing)}")
+    return {"files": [str(f) for f in segment_files]}
+
+
+def run_encode(payload: Dict) -> Dict:
+    """Optionally normalize, then combine and encode the segments of an episode and its export formats."""
+    exports = [parse_export_spec(spec, payload["output_file"]) for spec in payload.get("exports", [])]
+    if payload.get("segment_index"):
+        segments = [tuple(segment) for segment in payload["segment_index"]["segments"]]
+        index = build_indexed_episode(segments, Path(payload["output_file"]).parent, payload["output_file"],
+                                      normalize=payload["segment_index"]["normalize"], pause_ms=payload["pause_ms"],
+                                      workers=payload.get("encode_workers"))
+        if exports:
+            export_episode(payload["output_file"], index, exports)
+        return {"output_file": payload["output_file"]}
+
+    files_to_combine = payload["input_files"]
+    if payload.get("processed_file"):
+        process_audio_segments(files_to_combine, payload["processed_file"], pause_ms=payload["pause_ms"])
+        files_to_combine = [payload["processed_file"]]
+    combine_audio_files(files_to_combine, payload["output_file"],
+                        parallel_encode=payload.get("parallel_encode", False),
+                        encode_workers=payload.get("encode_workers"),
+                        exports=exports)
+    return {"output_file": payload["output_file"]}
+
+
+TASK_HANDLERS: Dict[str, Callable[[Dict], Dict]] = {
+    EXTRACT: run_extract,
+    SYNTHESIZE: run_synthesize,
+    ENCODE: run_encode,
+}
+
+
+def run_task(queue: WorkQueue, task: Task) -> None:
+    """Run a claimed task, renewing its lease in the background until it finishes."""
+    stop = threading.Event()
+
+    def renew_lease():
+        while not stop.wait(queue.lease_seconds / 3):
+            if not queue.heartbeat(task):
+                log.log_warning(f"Lost the lease on {task}")
+                return
+
+    heartbeat = threading.Thread(target=renew_lease, daemon=True)
+    heartbeat.start()
+    result = None
+    error = None
+    try:
+        log.log_info(f"Running {task}")
+        result = TASK_HANDLERS[task.kind](task.payload)
+    except Exception as e:
+        error = f"{type(e).__name__}: {str(e)}"
+    finally:
+        # Stop renewing before the lease is released so a late heartbeat cannot race it
+        stop.set()
+        heartbeat.join()
+
+    if error is None:
+        queue.complete(task, result)
+    else:
+        queue.fail(task, error)
+
+
+def run_worker(queue: WorkQueue, worker_id: Optional[str] = None, project: Optional[str] = None,
+               kinds: Optional[Sequence[str]] = None, exit_when_idle: Optional[float] = None,
+               poll_seconds: float = POLL_SECONDS) -> int:
+    """
+    Claim and run tasks until stopped, or until no task was available for exit_when_idle seconds.
+
+    Args:
+        project: Only run tasks of this project (all projects when None)
+        kinds: Only run these task kinds (all kinds when None)
+    Returns:
+        Number of tasks run
+    """
+    worker_id = worker_id or default_worker_id()
+    kinds = kinds or list(TASK_HANDLERS)
+    log.log_info(f"Worker {worker_id} started on {queue.db_path}")
+
+    tasks_run = 0
+    idle_since = time.monotonic()
+    while True:
+        task = queue.claim(worker_id, project=project, kinds=kinds)
+        if task is None:
+            if exit_when_idle is not None and time.monotonic() - idle_since >= exit_when_idle:
+                log.log_info(f"Worker {worker_id} idle, exiting after {tasks_run} tasks")
+                return tasks_run
+            time.sleep(poll_seconds)
+            continue
+        run_task(queue, task)
+        tasks_run += 1
+        idle_since = time.monotonic()
+
+
+def drain(queue: WorkQueue, task_ids: List[int], project: str, worker_id: Optional[str] = None,
+          poll_seconds: float = POLL_SECONDS) -> Dict[int, Dict]:
+    """
+    Work on a project's tasks alongside any other workers until the given tasks
+    are done or failed.
+
+    Returns:
+        State, result and error of every task, keyed by task id
+    """
+    worker_id = worker_id or default_worker_id()
+    while True:
+        states = queue.states(task_ids)
+        if all(state["state"] in (DONE, FAILED) for state in states.values()):
+            return states
+        task = queue.claim(worker_id, project=project)
+        if task is None:
+            # Remaining tasks are leased by other workers or waiting to be retried
+            time.sleep(poll_seconds)
+            continue
+        run_task(queue, task)
+
+
+def _worker_process(db_path: str, lease_seconds: float, project: Optional[str], exit_when_idle: Optional[float]):
+    run_worker(WorkQueue(db_path, lease_seconds=lease_seconds), project=project, exit_when_idle=exit_when_idle)
+
+
+def start_local_workers(queue: WorkQueue, count: int, project: Optional[str] = None,
+                        exit_when_idle: Optional[float] = None) -> List[multiprocessing.Process]:
+    """
+    Start worker processes on this machine draining the same queue.
+
+    The processes are spawned rather than forked because the caller usually has
+    threads running, and are not daemonic so they can run their own encoder
+    process pools; stop them with stop_local_workers.
+    """
+    context = multiprocessing.get_context("spawn")
+    workers = []
+    for _ in range(count):
+        process = context.Process(
+            target=_worker_process,
+            args=(str(queue.db_path), queue.lease_seconds, project, exit_when_idle),
+        )
+        process.start()
+        workers.append(process)
+    log.log_info(f"Started {count} local worker processes")
+    return workers
+
+
+def stop_local_workers(workers: List[multiprocessing.Process]) -> None:
+    # A task interrupted here is picked up again once its lease expires
+    for process in workers:
+        process.terminate()
+    for process in workers:
+        process.join()